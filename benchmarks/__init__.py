@@ -0,0 +1 @@
+"""Benchmarks and synthetic corpus generation for gcrslicer."""
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Deterministic synthetic WAV corpus generator for benchmarks.
+
+A corpus mixes many short one-shots spread over a deep directory tree with a few long files, across sample
+formats (8/16/24/32-bit PCM, 32-bit float), sample rates and channel counts. The same spec and seed always
+produce byte-identical files. Long files are written block by block, so generating them needs little memory.
+The spec and seed are recorded in the corpus, so a reused corpus can be described as generated.
+"""
+from dataclasses import dataclass, asdict
+import itertools
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from src.writers import wav_header
+from src.wavreader import WavInfo
+
+# (bits per sample, is float) of the generated formats
+SAMPLE_FORMATS = [(16, False), (24, False), (32, True), (8, False), (32, False)]
+SAMPLE_RATES = [44100, 48000, 96000]
+CHANNEL_COUNTS = [1, 2, 2, 4]
+
+# Frames generated and written at a time
+_WRITE_BLOCK_FRAMES = 1 << 16
+
+# File in the corpus root recording the spec and seed the corpus was generated with
+SPEC_FILENAME = 'corpus.json'
+
+
+@dataclass(frozen=True)
+class CorpusSpec:
+	"""Shape of a synthetic corpus."""
+	one_shots: int = 2000
+	one_shot_seconds: tuple = (0.05, 1.0)
+	long_files: int = 3
+	long_file_seconds: float = 600.0
+	tree_depth: int = 4
+	tree_fanout: int = 3
+
+	def to_dict(self):
+		""" The spec as plain values, for reports.
+		:rtype: dict
+		"""
+		return asdict(self)
+
+
+# Named specs, from a quick smoke run to a realistic library
+PRESETS = {
+	'tiny': CorpusSpec(one_shots=50, one_shot_seconds=(0.05, 0.5), long_files=1, long_file_seconds=10.0,
+					   tree_depth=2, tree_fanout=2),
+	'small': CorpusSpec(one_shots=500, long_files=2, long_file_seconds=120.0, tree_depth=3),
+	'default': CorpusSpec(),
+}
+
+
+def _sample_info(sample_rate, channels, bits, is_float):
+	block_align = channels * bits // 8
+	return WavInfo(sample_rate=sample_rate, channels=channels, bits_per_sample=bits, is_float=is_float,
+				   frames=0, data_offset=44, block_align=block_align)
+
+
+def _encode(samples, info):
+	""" Encode float samples in [-1, 1] to the bytes of a sample format. """
+	if info.is_float:
+		return samples.astype('<f4').tobytes()
+	if info.bits_per_sample == 8:
+		return (samples * 127 + 128).astype(np.uint8).tobytes()
+	if info.bits_per_sample == 24:
+		as_int = (samples * (2 ** 23 - 1)).astype('<i4')
+		return as_int.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+	dtype = f"<i{info.bits_per_sample // 8}"
+	return (samples * (2 ** (info.bits_per_sample - 1) - 1)).astype(dtype).tobytes()
+
+
+def _signal(rng, frames, channels, sample_rate, start=0):
+	""" Synthesize decaying tone and noise hits, the kind of material that gets sliced. """
+	time = (start + np.arange(frames)) / sample_rate
+	hit_period = rng.uniform(0.2, 0.8)
+	envelope = np.exp(-8 * (time % hit_period))
+	tone = np.sin(2 * np.pi * rng.uniform(50, 2000) * time)
+	noise = rng.standard_normal((frames, channels)) * 0.1
+	return np.clip((0.6 * tone * envelope)[:, None] + noise * envelope[:, None], -1, 1)
+
+
+def write_wav(filename, rng, seconds, sample_rate, channels, bits, is_float):
+	""" Write a synthetic WAV file, block by block.
+	:return: The number of frames written.
+	:rtype: int
+	"""
+	info = _sample_info(sample_rate, channels, bits, is_float)
+	frames = max(1, int(seconds * sample_rate))
+	with open(filename, 'wb') as wav_file:
+		wav_file.write(wav_header(info, frames))
+		for start in range(0, frames, _WRITE_BLOCK_FRAMES):
+			block = _signal(rng, min(_WRITE_BLOCK_FRAMES, frames - start), channels, sample_rate, start)
+			wav_file.write(_encode(block, info))
+		if frames * info.block_align % 2:
+			wav_file.write(b'\x00')
+	return frames
+
+
+def tree_directories(root, depth, fanout):
+	""" List the leaf directories of a tree of the given depth and fanout.
+	:rtype: list[Path]
+	"""
+	leaves = [Path(root)]
+	for level in range(depth):
+		leaves = [leaf / f"d{level}_{branch}" for leaf in leaves for branch in range(fanout)]
+	return leaves
+
+
+def generate_corpus(root, spec=CorpusSpec(), seed=0):
+	""" Generate a synthetic corpus.
+	:param root: Directory to generate the corpus in.
+	:param spec: The shape of the corpus.
+	:param seed: Seed of the random generator; the same seed generates the same corpus.
+	:return: The number of files and frames generated.
+	:rtype: tuple[int, int]
+	"""
+	rng = np.random.default_rng(seed)
+	formats = itertools.cycle(itertools.product(SAMPLE_FORMATS, SAMPLE_RATES, CHANNEL_COUNTS))
+	leaves = tree_directories(Path(root, 'one_shots'), spec.tree_depth, spec.tree_fanout)
+	for leaf in leaves:
+		os.makedirs(leaf, exist_ok=True)
+	os.makedirs(Path(root, 'long'), exist_ok=True)
+
+	total_frames = 0
+	for index in range(spec.one_shots):
+		(bits, is_float), sample_rate, channels = next(formats)
+		filename = leaves[index % len(leaves)] / f"one_shot_{index:06d}.wav"
+		seconds = rng.uniform(*spec.one_shot_seconds)
+		total_frames += write_wav(filename, rng, seconds, sample_rate, channels, bits, is_float)
+
+	for index in range(spec.long_files):
+		(bits, is_float), sample_rate, channels = next(formats)
+		filename = Path(root, 'long', f"long_{index:03d}.wav")
+		total_frames += write_wav(filename, rng, spec.long_file_seconds, sample_rate, channels, bits, is_float)
+
+	with open(Path(root, SPEC_FILENAME), 'w', encoding='utf-8') as spec_file:
+		json.dump({'spec': spec.to_dict(), 'seed': seed}, spec_file, indent=2)
+	return spec.one_shots + spec.long_files, total_frames
+
+
+def read_corpus_spec(root):
+	""" Read the spec and seed a corpus was generated with.
+	:param root: Directory of the corpus.
+	:return: The spec as plain values under 'spec', and the seed under 'seed'; None if generate_corpus didn't
+		generate the corpus.
+	:rtype: dict
+	"""
+	try:
+		with open(Path(root, SPEC_FILENAME), encoding='utf-8') as spec_file:
+			return json.load(spec_file)
+	except (OSError, ValueError):
+		return None
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Benchmark gcrslicer stages over a synthetic corpus.
+
+Each stage runs in a fresh process, so its peak RSS is its own. Results are written as JSON and can be
+compared against an earlier run:
+
+	python -m benchmarks.run --preset small --output bench.json
+	python -m benchmarks.run --preset small --output bench2.json --compare bench.json
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import json
+import os
+from pathlib import Path
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.corpus import PRESETS, generate_corpus, read_corpus_spec
+from src.analysis import analyze
+from src.envelope import minmax_envelope
+from src.gcrslicer import PLOT_WIDTH, SUPPORTED_READ_EXTENSIONS, file_iterator
+from src.profiling import peak_rss_bytes
+from src.slicer import write_slices
+from src.wavreader import WavReader
+
+STAGES = ['scan', 'read', 'plot_prep', 'analyze', 'slice']
+
+
+def _files(corpus_dir):
+	return list(file_iterator([corpus_dir], top='/', file_ext_filters=SUPPORTED_READ_EXTENSIONS))
+
+
+def _stage_scan(corpus_dir):
+	return {'files': len(_files(corpus_dir)), 'samples': 0}
+
+
+def _stage_read(corpus_dir):
+	files = _files(corpus_dir)
+	samples = 0
+	for file in files:
+		with WavReader(file) as reader:
+			for _, block in reader.float_blocks():
+				samples += block.size
+	return {'files': len(files), 'samples': samples}
+
+
+def _stage_plot_prep(corpus_dir):
+	files = _files(corpus_dir)
+	samples = 0
+	for file in files:
+		with WavReader(file) as reader:
+			minmax_envelope(reader, max(1, -(-reader.info.frames // PLOT_WIDTH)))
+			samples += reader.info.frames * reader.info.channels
+	return {'files': len(files), 'samples': samples}
+
+
+def _stage_analyze(corpus_dir):
+	files = _files(corpus_dir)
+	samples = 0
+	for file in files:
+		with WavReader(file) as reader:
+			analyze(reader)
+			samples += reader.info.frames * reader.info.channels
+	return {'files': len(files), 'samples': samples}
+
+
+def _stage_slice(corpus_dir):
+	files = _files(corpus_dir)
+	samples = slices = 0
+	with tempfile.TemporaryDirectory() as write_dir:
+		for file in files:
+			with WavReader(file) as reader:
+				slices += len(write_slices(reader, analyze(reader).slices, write_dir, Path(file).stem))
+				samples += reader.info.frames * reader.info.channels
+	return {'files': len(files), 'samples': samples, 'slices': slices}
+
+
+def _run_stage(name, corpus_dir):
+	""" Time one stage. Runs in a fresh worker process. """
+	stage = globals()[f"_stage_{name}"]
+	wall, cpu = time.perf_counter(), time.process_time()
+	counts = stage(corpus_dir)
+	wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+
+	result = {'wall_s': round(wall, 4), 'cpu_s': round(cpu, 4), 'peak_rss_bytes': peak_rss_bytes(), **counts}
+	result['files_per_s'] = round(counts['files'] / wall, 2) if wall else None
+	result['samples_per_s'] = round(counts['samples'] / wall) if wall else None
+	return result
+
+
+def run_benchmarks(corpus_dir, stages=None):
+	""" Run benchmark stages over a corpus, each in a fresh process.
+	:param corpus_dir: The corpus directory.
+	:param stages: Names of the stages to run. All if None.
+	:return: The results per stage.
+	:rtype: dict
+	"""
+	results = {}
+	for name in stages or STAGES:
+		with ProcessPoolExecutor(max_workers=1) as executor:
+			results[name] = executor.submit(_run_stage, name, str(corpus_dir)).result()
+		print(f"{name:>10}: {results[name]}")
+	return results
+
+
+def corpus_meta(corpus_dir):
+	""" Describe the measured corpus by the spec and seed it was generated with, and the preset of that spec if
+	there is one. A corpus without a recorded spec is described as external.
+	:rtype: dict
+	"""
+	stored = read_corpus_spec(corpus_dir)
+	if stored is None:
+		return {'preset': None, 'seed': None, 'corpus': 'external'}
+	presets = [name for name, spec in PRESETS.items() if json.loads(json.dumps(spec.to_dict())) == stored['spec']]
+	return {'preset': presets[0] if presets else None, 'seed': stored['seed'], 'corpus': stored['spec']}
+
+
+def compare(current, previous):
+	""" Print the speedup of each stage, relative to a previous run. """
+	for name, result in current['stages'].items():
+		before = previous.get('stages', {}).get(name)
+		if before and result['wall_s'] and before['wall_s']:
+			line = f"{name:>10}: {before['wall_s'] / result['wall_s']:.2f}x speed"
+			if result['peak_rss_bytes'] and before['peak_rss_bytes']:
+				line += f", {result['peak_rss_bytes'] / before['peak_rss_bytes']:.2f}x peak RSS"
+			print(line)
+
+
+def main(args=None):
+	""" Generate (or reuse) a corpus, run the benchmarks and write the JSON report.
+	:rtype: int
+	"""
+	parser = argparse.ArgumentParser(description="gcrslicer benchmarks")
+	parser.add_argument("--preset", choices=sorted(PRESETS), default='small', help="Corpus spec.")
+	parser.add_argument("--seed", type=int, default=0, help="Corpus seed.")
+	parser.add_argument("--corpus-dir", type=str, default=None,
+						help="Corpus location. Generated unless it exists. A temporary corpus if omitted.")
+	parser.add_argument("--stages", nargs='+', choices=STAGES, default=None, help="Stages to run.")
+	parser.add_argument("--output", type=str, default=None, help="Path of the JSON report.")
+	parser.add_argument("--compare", type=str, default=None, help="JSON report of an earlier run to compare to.")
+	params = parser.parse_args(args)
+
+	with tempfile.TemporaryDirectory() as tmp_dir:
+		corpus_dir = Path(params.corpus_dir or tmp_dir).resolve()
+		if not (corpus_dir / 'one_shots').is_dir():
+			started = time.perf_counter()
+			files, frames = generate_corpus(corpus_dir, PRESETS[params.preset], params.seed)
+			print(f"Generated {files} files, {frames} frames in {time.perf_counter() - started:.1f}s")
+
+		report = {
+			'meta': {
+				'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+				'python': platform.python_version(),
+				'numpy': np.__version__,
+				'platform': platform.platform(),
+				'cpus': os.cpu_count(),
+				# The corpus measured, which a reused --corpus-dir may have been generated from other options
+				**corpus_meta(corpus_dir),
+			},
+			'stages': run_benchmarks(corpus_dir, params.stages),
+		}
+
+	if params.output:
+		with open(params.output, 'w', encoding='utf-8') as output:
+			json.dump(report, output, indent=2)
+	if params.compare:
+		with open(params.compare, encoding='utf-8') as previous:
+			compare(report, json.load(previous))
+	return 0
+
+
+if __name__ == '__main__':
+	sys.exit(main())
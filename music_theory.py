@@ -23,8 +23,12 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+from functools import lru_cache
 import pprint
 import re
+from types import MappingProxyType
+
+import numpy as np
 
 # The musical alphabet consists of seven letter from A through G
 alphabet = ['C', 'D', 'E', 'F', 'G', 'A', 'B']
@@ -45,9 +49,28 @@ notes = [
 	['A##', 'B', 'Cb'],
 ]
 
+# Every enharmonic note name mapped to its pitch class, the index of its row in notes
+pitch_classes = {name: i for i, names in enumerate(notes) for name in names}
+
+# Every letter mapped to its index in alphabet
+_alphabet_indexes = {letter: i for i, letter in enumerate(alphabet)}
+
+# Bound on the number of (key, interval type) tables kept by interval_table()
+INTERVAL_CACHE_SIZE = 256
+
+
+def pitch_class(note):
+	''' Find the pitch class (0 for C through 11 for B) of a note name, or None. '''
+	return pitch_classes.get(note)
+
 
 def find_note_index(scale, search_note):
 	''' Given a scale, find the index of a particular note '''
+	# The note and alphabet tables are indexed up front
+	if scale is notes:
+		return pitch_classes.get(search_note)
+	if scale is alphabet:
+		return _alphabet_indexes.get(search_note)
 	for i, note in enumerate(scale):
 		# Deal with situations where we have a list of enharmonic
 		# equivalents, as well as just a single note as and str.
@@ -117,80 +140,78 @@ def find_note_by_root(notes, root):
 			return note
 
 
-def make_intervals(root):
-	labeled = {}
-	c = chromatic(root)
-	start_index = find_note_index(alphabet, root[0])
-	for i, interval in enumerate(intervals):
-		for interval_name in interval:
-			interval_index = int(interval_name[1]) - 1
-			note = c[i % len(c)]
-			note_root = alphabet[(start_index + interval_index) % len(alphabet)]
-			if note_root is not None:
-				labeled[interval_name] = find_note_by_root(note, note_root)
-	return labeled
+@lru_cache(maxsize=None)
+def _interval_degrees(interval_type):
+	'''
+	The (semitones, interval name, scale degree) of every interval name of an
+	interval type, e.g. (4, 'M3', 2) or (4, '3', 2).
+	'''
+	if interval_type == 'standard':
+		return tuple((index, name, int(name[1]) - 1)  # e.g. M3 --> 2, m7 --> 6
+					 for index, names in enumerate(intervals) for name in names)
+	return tuple((index, name, int(re.sub('[b#]', '', name)) - 1)
+				 for index, names in enumerate(intervals_major) for name in names)
+
+
+@lru_cache(maxsize=INTERVAL_CACHE_SIZE)
+def _interval_spellings(key, interval_type):
+	'''
+	The (interval name, note, enharmonic equivalents) of every interval of a
+	key. The note is the equivalent spelled with the letter of the interval's
+	degree, or None if there is none.
+	'''
+	key_index = pitch_classes.get(key)
+	if key_index is None:
+		raise ValueError(f"Unknown key: {key!r}")
+	letter_index = _alphabet_indexes[key[0]]
+	spellings = []
+	for semitones, interval_name, degree in _interval_degrees(interval_type):
+		equivalents = notes[(key_index + semitones) % len(notes)]
+		letter = alphabet[(letter_index + degree) % len(alphabet)]
+		spellings.append((interval_name, find_note_by_root(equivalents, letter), equivalents))
+	return tuple(spellings)
+
+
+@lru_cache(maxsize=INTERVAL_CACHE_SIZE)
+def interval_table(key, interval_type='standard'):
+	'''
+	The read-only mapping of interval names to the notes of a key, as
+	make_intervals() returns it. Built once per key and interval type.
+	'''
+	return MappingProxyType({interval_name: equivalents[0] if note is None else note
+							 for interval_name, note, equivalents in _interval_spellings(key, interval_type)})
 
 
 def make_intervals_major(root):
-	labeled = {}
-	c = chromatic(root)
-	start_index = find_note_index(alphabet, root[0])
-	for i, interval in enumerate(intervals_major):
-		for interval_name in interval:
-			interval_index = int(re.sub('[b#]', '', interval_name)) - 1
-			note = c[i % len(c)]
-			note_root = alphabet[(start_index + interval_index) % len(alphabet)]
-			if note_root is not None:
-				labeled[interval_name] = find_note_by_root(note, note_root)
-	return labeled
+	return {interval_name: note for interval_name, note, _ in _interval_spellings(root, 'major')}
 
 
 def make_intervals_standard(key):
 	# Our labeled set of notes mapping interval names to notes
-	labels = {}
-
-	# Step 1: Generate a chromatic scale in our desired key
-	chromatic_scale = chromatic(key)
-
-	# The alphabets starting at provided key's alphabet
-	alphabet_key = rotate(alphabet, find_note_index(alphabet, key[0]))
-
-	# Iterate through all intervals (list of lists)
-	for index, interval_list in enumerate(intervals):
-
-		# Step 2: Find the notes to search through based on degree
-		notes_to_search = chromatic_scale[index % len(chromatic_scale)]
+	return dict(interval_table(key, 'standard'))
 
-		for interval_name in interval_list:
-			# Get the interval degree
-			degree = int(interval_name[1]) - 1  # e.g. M3 --> 3, m7 --> 7
 
-			# Get the alphabet to look for
-			alphabet_to_search = alphabet_key[degree % len(alphabet_key)]
+@lru_cache(maxsize=None)
+def _formula_names(formula):
+	return tuple(formula.split(','))
 
-			try:
-				note = [x for x in notes_to_search if x[0] == alphabet_to_search][0]
-			except:
-				note = notes_to_search[0]
-
-			labels[interval_name] = note
-
-	return labels
 
 def make_formula(formula, labeled):
 	'''
 	Given a comma-separated interval formula, and a set of labeled
 	notes in a key, return the notes of the formula.
 	'''
-	return [labeled[x] for x in formula.split(',')]
+	return [labeled[x] for x in _formula_names(formula)]
+
 
+@lru_cache(maxsize=4096)
+def formula_notes(formula, key, interval_type='major'):
+	'''
+	The notes of a comma-separated interval formula in a key, as a tuple.
+	Memoized, for resolving the same formulas over and over.
+	'''
+	return tuple(make_formula(formula, interval_table(key, interval_type)))
 
-intervs = make_intervals('C')
-print('Major     :', ','.join(make_formula('P1,M2,M3,P4,P5,M6,M7,P8', intervs)))  # Major
-print('Minor     :', ','.join(make_formula('P1,M2,m3,P4,P5,m6,m7,P8', intervs)))  # Natural Minor
-print('Mel. Minor:', ','.join(make_formula('P1,M2,m3,P4,P5,M6,M7,P8', intervs)))  # Melodic Minor
-print('Har. Minor:', ','.join(make_formula('P1,M2,m3,P4,P5,m6,M7,P8', intervs)))  # Harmonic Minor
-#TODO#FIX#print('Major     :', ','.join(make_formula('1,2,3,4,5,6,7', intervs)))  # Major
 
 formulas = {
 	# Scale formulas
@@ -260,13 +281,6 @@ def dump(scale, separator=' '):
 		.replace('#', '\u266f')
 
 
-intervs = make_intervals_major('C')
-for key in formulas:
-	print(key)
-	for name, formula in formulas[key].items():
-		v = make_formula(formula, intervs)
-		print('\t', name, ':', dump(v))
-
 major_mode_rotations = {
 	'Ionian': 0,
 	'Dorian': 1,
@@ -282,95 +296,212 @@ def mode(scale, degree):
 	return rotate(scale, degree)
 
 
-intervs = make_intervals_major('C')
-#TODO#FIX#v = make_formula(formulas['scales']['major_I'], intervs)
-print(dump(mode(v, major_mode_rotations['Phrygian'])))
-
-print(find_note_index(notes, 'A'))
-print(find_note_index(alphabet, 'A'))
-
-
 def make_intervals(key, interval_type='standard'):
 	# Our labeled set of notes mapping interval names to notes
-	labels = {}
-
-	# Step 1: Generate a chromatic scale in our desired key
-	chromatic_scale = chromatic(key)
-
-	# The alphabets starting at provided key
-	alphabet_key = rotate(alphabet, find_note_index(alphabet, key[0]))
-
-	intervs = intervals if interval_type == 'standard' else intervals_major
-	# Iterate through all intervals (list of lists)
-	for index, interval_list in enumerate(intervs):
+	return dict(interval_table(key, interval_type))
 
-		# Step 2: Find the notes to search through based on degree
-		notes_to_search = chromatic_scale[index % len(chromatic_scale)]
 
-		for interval_name in interval_list:
-			# Get the interval degree
-			if interval_type == 'standard':
-				degree = int(interval_name[1]) - 1  # e.g. M3 --> 2, m7 --> 6
-			elif interval_type == 'major':
-				degree = int(re.sub('[b#]', '', interval_name)) - 1
+keys = [
+	'B#', 'C', 'C#', 'Db', 'D', 'D#', 'Eb', 'E', 'Fb', 'E#', 'F',
+	'F#', 'Gb', 'G', 'G#', 'Ab', 'A', 'A#', 'Bb', 'B', 'Cb',
+]
 
-			# Get the alphabet to look for
-			alphabet_to_search = alphabet_key[degree % len(alphabet_key)]
 
-			print('Interval {}, degree {}: looking for alphabet {} in notes {}'.format(interval_name, degree,
-																					   alphabet_to_search,
-																					   notes_to_search))
-			try:
-				note = [x for x in notes_to_search if x[0] == alphabet_to_search][0]
-			except:
-				note = notes_to_search[0]
+@lru_cache(maxsize=None)
+def make_modes():
+	'''
+	Build the modes of the major scale of every key, keyed by the root of
+	the mode and the mode name. Built on first use, then cached.
+	'''
+	modes = {}
+	for key in keys:
+		intervs = make_intervals(key, 'major')
+		major_scale = make_formula(formulas['scales']['major'], intervs)
+		for m in major_mode_rotations:
+			v = mode(major_scale, major_mode_rotations[m])
+			if v[0] not in modes:
+				modes[v[0]] = {}
+			modes[v[0]][m] = v
+	return modes
 
-			labels[interval_name] = note
 
-	return labels
+# A common spelling of each pitch class, for naming roots
+pitch_class_names = ('C', 'C#', 'D', 'Eb', 'E', 'F', 'F#', 'G', 'Ab', 'A', 'Bb', 'B')
 
+# Observations matched per pass of PitchClassSets.match(), bounding its score matrix
+_MATCH_BATCH = 4096
 
-intervs = make_intervals('B#', 'major')
 
-pprint.pprint(make_intervals_standard('C'), sort_dicts=False)
+def formula_mask(formula):
+	'''
+	Turn a comma-separated formula in major interval names into a 12-bit
+	pitch-class mask relative to its root: bit i is set if the formula holds
+	the note i semitones above the root.
+	'''
+	mask = 0
+	for name in _formula_names(formula):
+		semitones = next(index for index, names in enumerate(intervals_major) if name in names)
+		mask |= 1 << (semitones % 12)
+	return mask
 
-formula = 'P1,M2,M3,P4,P5,M6,M7,P8'
-for key in alphabet:
-	print(key, make_formula(formula, make_intervals_standard(key)))
 
-for key in alphabet:
-	scale = make_formula(formula, make_intervals_standard(key))
-	print('{}: {}'.format(key, dump(scale)))
+def pitch_class_mask(pitch_class_set):
+	''' Turn an iterable of pitch classes (0 for C through 11 for B) into a 12-bit mask. '''
+	mask = 0
+	for pc in pitch_class_set:
+		mask |= 1 << (int(pc) % 12)
+	return mask
 
-intervs = make_intervals('C', 'major')
-for ftype in formulas:
-	print(ftype)
-	for name, formula in formulas[ftype].items():
-		v = make_formula(formula, intervs)
-		print('\t{}: {}'.format(name, dump(v)))
 
-print('\n\n')
-intervs = make_intervals('C', 'major')
-c_major_scale = make_formula(formulas['scales']['major'], intervs)
-for m in major_mode_rotations:
-	v = mode(c_major_scale, major_mode_rotations[m])
-	print('{} {}: {}'.format(dump([v[0]]), m, dump(v)))
+def transpose_masks(masks, semitones):
+	''' Rotate 12-bit pitch-class masks up by a number of semitones. '''
+	masks = np.asarray(masks, dtype=np.uint16)
+	semitones = np.asarray(semitones, dtype=np.uint16) % 12
+	return ((masks << semitones) | (masks >> (12 - semitones))) & 0xFFF
 
-keys = [
-	'B#', 'C', 'C#', 'Db', 'D', 'D#', 'Eb', 'E', 'Fb', 'E#', 'F',
-	'F#', 'Gb', 'G', 'G#', 'Ab', 'A', 'A#', 'Bb', 'B', 'Cb',
-]
 
-modes = {}
+class PitchClassSets:
+	'''
+	Every scale and chord formula in all twelve keys, as 12-bit pitch-class
+	masks in NumPy arrays, matched against batches of observed pitch-class
+	sets or chroma vectors in one vectorized pass.
+	'''
 
-for key in keys:
-	print(key)
-	intervs = make_intervals(key, 'major')
+	def __init__(self, formula_table=formulas):
+		entries = [(kind, name, formula_mask(formula))
+				   for kind, named in formula_table.items() for name, formula in named.items()]
+		count = len(entries)
+		self.kinds = np.repeat([kind for kind, _, _ in entries], 12)
+		self.names = np.repeat([name for _, name, _ in entries], 12)
+		self.roots = np.tile(np.arange(12, dtype=np.uint8), count)
+		self.masks = transpose_masks(np.repeat([mask for _, _, mask in entries], 12), self.roots)
+		# One row per (formula, key), with a 1 for each pitch class it holds
+		self.templates = ((self.masks[:, None] >> np.arange(12, dtype=np.uint16)) & 1).astype(np.float32)
+		self._unit_templates = self.templates / np.linalg.norm(self.templates, axis=1, keepdims=True)
+
+	def __len__(self):
+		return len(self.masks)
+
+	def label(self, index):
+		''' Name an entry, e.g. 'Eb minor_7'. '''
+		return f"{pitch_class_names[self.roots[index]]} {self.names[index]}"
+
+	def _scores(self, observed, candidates):
+		'''
+		Score a batch of observations against candidate entries: Jaccard
+		similarity for masks, cosine similarity for chroma vectors.
+		'''
+		if observed.ndim == 2:
+			norms = np.linalg.norm(observed, axis=1, keepdims=True)
+			return (observed / np.maximum(norms, 1e-12)) @ self._unit_templates[candidates].T
+		# Set sizes by matrix product: |a & b| = bits(a) . bits(b), and |a | b| = |a| + |b| - |a & b|
+		bits = ((observed[:, None] >> np.arange(12, dtype=np.uint16)) & 1).astype(np.float32)
+		templates = self.templates[candidates]
+		shared = bits @ templates.T
+		union = bits.sum(axis=1, keepdims=True) + templates.sum(axis=1) - shared
+		return shared / np.maximum(union, 1)
+
+	def match(self, observed, kind=None, top=1):
+		'''
+		Find the best-matching entries of a batch of observations: either
+		12-bit pitch-class masks shaped (n,), or chroma vectors shaped (n, 12).
+		Only entries of one kind ('scales' or 'chords') are considered if
+		given. Returns the entry indexes and scores of the best top matches
+		of each observation, best first, both shaped (n, top).
+		'''
+		observed = np.asarray(observed)
+		observed = observed.astype(np.float32) if observed.ndim == 2 else observed.astype(np.uint16) & 0xFFF
+		candidates = np.flatnonzero(self.kinds == kind) if kind else np.arange(len(self))
+		top = min(top, len(candidates))
+		indexes = np.empty((len(observed), top), dtype=np.int64)
+		scores = np.empty((len(observed), top), dtype=np.float32)
+		for start in range(0, len(observed), _MATCH_BATCH):
+			batch_scores = self._scores(observed[start:start + _MATCH_BATCH], candidates)
+			best = _top_indexes(batch_scores, top)
+			indexes[start:start + len(best)] = candidates[best]
+			scores[start:start + len(best)] = np.take_along_axis(batch_scores, best, axis=1)
+		return indexes, scores
+
+
+def _top_indexes(scores, top):
+	'''
+	The column indexes of the top scores of each row, best first. Ties go to
+	the lower index, i.e. the formula listed first.
+	'''
+	if top == 1:
+		return np.argmax(scores, axis=1)[:, None]
+	# The top-th best score of each row, and the columns scoring above it or, lowest first, equal to it
+	threshold = -np.partition(-scores, top - 1, axis=1)[:, top - 1:top]
+	above = scores > threshold
+	tied = scores == threshold
+	selected = above | (tied & (np.cumsum(tied, axis=1) <= top - above.sum(axis=1, keepdims=True)))
+	best = np.nonzero(selected)[1].reshape(len(scores), top)
+	# Order the few best by score; the stable sort keeps ties by index
+	order = np.argsort(-np.take_along_axis(scores, best, axis=1), axis=1, kind='stable')
+	return np.take_along_axis(best, order, axis=1)
+
+
+@lru_cache(maxsize=None)
+def pitch_class_sets():
+	''' The PitchClassSets of formulas, built on first use. '''
+	return PitchClassSets()
+
+
+def __getattr__(name):
+	''' Build the module's lookup tables lazily, on first access. '''
+	if name == 'modes':
+		return make_modes()
+	raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def main():
+	''' Print the scales, chords and modes of the article. '''
+	intervs = make_intervals('C')
+	print('Major     :', ','.join(make_formula('P1,M2,M3,P4,P5,M6,M7,P8', intervs)))  # Major
+	print('Minor     :', ','.join(make_formula('P1,M2,m3,P4,P5,m6,m7,P8', intervs)))  # Natural Minor
+	print('Mel. Minor:', ','.join(make_formula('P1,M2,m3,P4,P5,M6,M7,P8', intervs)))  # Melodic Minor
+	print('Har. Minor:', ','.join(make_formula('P1,M2,m3,P4,P5,m6,M7,P8', intervs)))  # Harmonic Minor
+	#TODO#FIX#print('Major     :', ','.join(make_formula('1,2,3,4,5,6,7', intervs)))  # Major
+
+	intervs = make_intervals_major('C')
+	for key in formulas:
+		print(key)
+		for name, formula in formulas[key].items():
+			v = make_formula(formula, intervs)
+			print('\t', name, ':', dump(v))
+
+	#TODO#FIX#v = make_formula(formulas['scales']['major_I'], intervs)
+	print(dump(mode(v, major_mode_rotations['Phrygian'])))
+
+	print(find_note_index(notes, 'A'))
+	print(find_note_index(alphabet, 'A'))
+
+	pprint.pprint(make_intervals_standard('C'), sort_dicts=False)
+
+	formula = 'P1,M2,M3,P4,P5,M6,M7,P8'
+	for key in alphabet:
+		print(key, make_formula(formula, make_intervals_standard(key)))
+
+	for key in alphabet:
+		scale = make_formula(formula, make_intervals_standard(key))
+		print('{}: {}'.format(key, dump(scale)))
+
+	intervs = make_intervals('C', 'major')
+	for ftype in formulas:
+		print(ftype)
+		for name, formula in formulas[ftype].items():
+			v = make_formula(formula, intervs)
+			print('\t{}: {}'.format(name, dump(v)))
+
+	print('\n\n')
+	intervs = make_intervals('C', 'major')
 	c_major_scale = make_formula(formulas['scales']['major'], intervs)
 	for m in major_mode_rotations:
 		v = mode(c_major_scale, major_mode_rotations[m])
-		if v[0] not in modes:
-			modes[v[0]] = {}
-		modes[v[0]][m] = v
+		print('{} {}: {}'.format(dump([v[0]]), m, dump(v)))
+
+	pprint.pprint(make_modes()['C'])
+
 
-pprint.pprint(modes['C'])
\ No newline at end of file
+if __name__ == '__main__':
+	main()
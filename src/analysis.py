@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Frame-energy analysis: RMS and peak levels, silence regions, onsets and the slices derived from them.
+
+All per-sample work is done with NumPy on whole blocks. Each block is reshaped into hop-sized chunks, and
+overlapping analysis frames are strided windows over the per-chunk sums and maxima, so the cost per sample
+is a handful of vectorized operations regardless of the frame overlap.
+"""
+from dataclasses import dataclass, asdict, field
+import hashlib
+import json
+
+import numpy as np
+from scipy.ndimage import maximum_filter1d
+
+# Floor applied to levels before converting them to dB
+_LEVEL_FLOOR = np.float32(1e-10)
+
+
+@dataclass(frozen=True)
+class AnalysisParams:
+	"""Parameters of the frame-energy analysis."""
+	hop_ms: float = 10.0
+	overlap: int = 2
+	silence_db: float = -48.0
+	min_silence_ms: float = 50.0
+	onset_db: float = 6.0
+	min_onset_ms: float = 50.0
+	min_slice_ms: float = 20.0
+
+	def hop(self, sample_rate):
+		""" Number of samples between consecutive analysis frames.
+		:rtype: int
+		"""
+		return max(1, int(round(sample_rate * self.hop_ms / 1000)))
+
+	def min_slice_frames(self, sample_rate):
+		""" The fewest frames a slice has.
+		:rtype: int
+		"""
+		return max(int(sample_rate * self.min_slice_ms / 1000), 1)
+
+	def digest(self):
+		""" A stable hash of the parameters, for keying stored results.
+		:rtype: str
+		"""
+		return hashlib.sha1(json.dumps(asdict(self), sort_keys=True).encode()).hexdigest()[:16]
+
+
+@dataclass
+class AnalysisResult:
+	"""Compact per-file analysis result. Frame arrays are per hop; positions are in sample frames."""
+	sample_rate: int
+	frames: int
+	channels: int
+	hop: int
+	frame_len: int
+	rms: np.ndarray = field(repr=False)
+	peak: np.ndarray = field(repr=False)
+	silences: np.ndarray = field(repr=False)
+	onsets: np.ndarray = field(repr=False)
+	slices: np.ndarray = field(repr=False)
+
+	@property
+	def duration(self):
+		""" Duration of the analyzed audio in seconds.
+		:rtype: float
+		"""
+		return self.frames / self.sample_rate if self.sample_rate else 0.0
+
+	def summary(self):
+		""" Summarize the result as plain values.
+		:rtype: dict
+		"""
+		peak = float(self.peak.max()) if len(self.peak) else 0.0
+		return {
+			'sample_rate': self.sample_rate,
+			'channels': self.channels,
+			'duration': round(self.duration, 3),
+			'peak_db': round(float(_to_db(np.float32(peak))), 2),
+			'silences': len(self.silences),
+			'onsets': len(self.onsets),
+			'slices': len(self.slices),
+		}
+
+
+def _to_db(level):
+	return 20 * np.log10(np.maximum(level, _LEVEL_FLOOR))
+
+
+def frame_energy(reader, hop, overlap=2):
+	""" Measure the RMS and peak level of overlapping frames of frame_len = hop * overlap samples, across all
+	channels. Frame k covers samples [k * hop, k * hop + frame_len), zero-padded past the end of the file.
+	:param reader: An open WavReader.
+	:param hop: Number of samples between frames.
+	:param overlap: Number of hops per frame.
+	:return: RMS and peak level per frame, as float32 arrays.
+	:rtype: tuple[np.ndarray, np.ndarray]
+	"""
+	info = reader.info
+	if not info.frames:
+		return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+	n_chunks = -(-info.frames // hop)
+	chunk_sq = np.zeros(n_chunks + overlap - 1, dtype=np.float32)
+	chunk_peak = np.zeros(n_chunks + overlap - 1, dtype=np.float32)
+
+	# Blocks hold a whole number of hops, so chunks never straddle blocks.
+	block_frames = max(1, reader.block_frames // hop) * hop
+	for offset, block in reader.float_blocks(block_frames=block_frames):
+		pad = -len(block) % hop
+		if pad:
+			block = np.pad(block, ((0, pad), (0, 0)))
+		chunks = block.reshape(-1, hop * info.channels)
+		first = offset // hop
+		chunk_sq[first:first + len(chunks)] = np.einsum('ij,ij->i', chunks, chunks)
+		chunk_peak[first:first + len(chunks)] = np.abs(chunks).max(axis=1)
+
+	if overlap > 1:
+		windows = np.lib.stride_tricks.sliding_window_view
+		chunk_sq = windows(chunk_sq, overlap).sum(axis=1)
+		chunk_peak = windows(chunk_peak, overlap).max(axis=1)
+	rms = np.sqrt(chunk_sq / np.float32(hop * overlap * info.channels))
+	return rms.astype(np.float32, copy=False), chunk_peak
+
+
+def runs(mask):
+	""" Find the runs of True in a boolean array.
+	:param mask: The boolean array.
+	:return: (start, stop) rows of each run.
+	:rtype: np.ndarray
+	"""
+	edges = np.diff(mask.astype(np.int8), prepend=0, append=0)
+	return np.column_stack((np.flatnonzero(edges == 1), np.flatnonzero(edges == -1))).astype(np.int64)
+
+
+def merge_gaps(regions, min_gap):
+	""" Merge consecutive regions separated by fewer than min_gap elements.
+	:param regions: (start, stop) rows, sorted and non-overlapping.
+	:param min_gap: Smallest gap that keeps two regions apart.
+	:return: The merged (start, stop) rows.
+	:rtype: np.ndarray
+	"""
+	if len(regions) < 2:
+		return regions
+	keep_gap = (regions[1:, 0] - regions[:-1, 1]) >= min_gap
+	starts = regions[np.concatenate(([True], keep_gap)), 0]
+	stops = regions[np.concatenate((keep_gap, [True])), 1]
+	return np.column_stack((starts, stops))
+
+
+def detect_onsets(rms_db, loud, min_gap, lag=1):
+	""" Pick onset frames from the rise of frame level: local maxima of the positive level difference that
+	exceed the onset threshold in loud frames, at least min_gap frames apart.
+	:param rms_db: The frame levels in dB, relative to the onset threshold.
+	:param loud: The non-silent frames.
+	:param min_gap: Smallest distance between onsets, in frames.
+	:param lag: Distance between the frames compared, in frames. Set to the overlap, frames compared don't overlap.
+	:return: The onset frame indices.
+	:rtype: np.ndarray
+	"""
+	rise = np.zeros_like(rms_db)
+	np.subtract(rms_db[lag:], rms_db[:-lag], out=rise[lag:])
+	np.maximum(rise, 0, out=rise)
+	local_max = rise == maximum_filter1d(rise, size=2 * max(min_gap, 1) + 1, mode='constant')
+	return np.flatnonzero(local_max & loud & (rise >= 1.0))
+
+
+def slice_regions(regions, onsets):
+	""" Split regions at the onsets inside them.
+	:param regions: (start, stop) rows, sorted and non-overlapping.
+	:param onsets: Sorted split positions.
+	:return: The (start, stop) rows of the split regions.
+	:rtype: np.ndarray
+	"""
+	if regions.size == 0:
+		return regions
+	region_of = np.searchsorted(regions[:, 0], onsets, side='right') - 1
+	inside = (region_of >= 0) & (onsets > regions[np.maximum(region_of, 0), 0]) \
+		& (onsets < regions[np.maximum(region_of, 0), 1])
+	starts = np.concatenate((regions[:, 0], onsets[inside]))
+	owner = np.concatenate((np.arange(len(regions)), region_of[inside]))
+	order = np.lexsort((starts, owner))
+	starts, owner = starts[order], owner[order]
+	stops = np.append(starts[1:], 0)
+	last_of_region = np.append(owner[1:] != owner[:-1], True)
+	stops[last_of_region] = regions[owner[last_of_region], 1]
+	return np.column_stack((starts, stops))
+
+
+def analyze(reader, params=AnalysisParams()):
+	""" Analyze the frame energy of a file, and derive its silences, onsets and slices.
+	:param reader: An open WavReader.
+	:param params: The analysis parameters.
+	:return: The analysis result.
+	:rtype: AnalysisResult
+	"""
+	info = reader.info
+	hop = params.hop(info.sample_rate)
+	rms, peak = frame_energy(reader, hop, params.overlap)
+	rms_db = _to_db(rms)
+	loud = rms_db >= params.silence_db
+
+	def frames_of(milliseconds):
+		return int(np.ceil(info.sample_rate * milliseconds / 1000 / hop))
+
+	def to_samples(positions):
+		return np.minimum(positions * hop, info.frames)
+
+	silences = runs(~loud)
+	silences = silences[(silences[:, 1] - silences[:, 0]) >= frames_of(params.min_silence_ms)]
+	sounding = merge_gaps(runs(loud), frames_of(params.min_silence_ms))
+	onsets = detect_onsets(rms_db / np.float32(params.onset_db), loud, frames_of(params.min_onset_ms), params.overlap)
+
+	# Onsets rising out of silence already start a sounding region
+	split_at = onsets[loud[np.maximum(onsets - params.overlap, 0)]]
+	slices = to_samples(slice_regions(sounding, split_at))
+	slices = slices[(slices[:, 1] - slices[:, 0]) >= params.min_slice_frames(info.sample_rate)]
+
+	return AnalysisResult(sample_rate=info.sample_rate, frames=info.frames, channels=info.channels, hop=hop,
+						  frame_len=hop * params.overlap, rms=rms, peak=peak, silences=to_samples(silences),
+						  onsets=to_samples(onsets), slices=slices)
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Opening audio files of any supported format, by file extension."""
+from pathlib import Path
+
+from .flacreader import FlacReader, flac_supported, is_flac_complete, read_flac_info
+from .resample import ConvertedReader
+from .wavreader import DEFAULT_BLOCK_FRAMES, WavReader, is_wav_complete, read_wav_info
+
+
+def read_extensions():
+	""" The file extensions that can be read: FLAC only if its decoder is installed.
+	:rtype: set[str]
+	"""
+	return {'wav', 'flac'} if flac_supported() else {'wav'}
+
+
+def _is_flac(filename):
+	return Path(filename).suffix.lower() == '.flac'
+
+
+def open_audio(filename, block_frames=DEFAULT_BLOCK_FRAMES, target=None):
+	""" Open an audio file with the reader of its format.
+	:param filename: The audio file.
+	:param block_frames: Default number of frames per block.
+	:param target: A TargetFormat to convert the audio to while it is read. The source format if None.
+	:rtype: WavReader | FlacReader | ConvertedReader
+	"""
+	reader = FlacReader(filename, block_frames) if _is_flac(filename) else WavReader(filename, block_frames)
+	if target is not None and target.converts(reader.info):
+		return ConvertedReader(reader, target)
+	return reader
+
+
+def read_audio_info(filename):
+	""" Read the format and length of an audio file, without decoding any audio.
+	:rtype: WavInfo
+	"""
+	return read_flac_info(filename) if _is_flac(filename) else read_wav_info(filename)
+
+
+def is_audio_complete(filename):
+	""" Check whether an audio file has been completely written.
+	:rtype: bool
+	"""
+	return is_flac_complete(filename) if _is_flac(filename) else is_wav_complete(filename)
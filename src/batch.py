@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Process-pool batch execution over the files of a file iterator."""
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+import collections
+from dataclasses import dataclass
+import itertools
+import logging
+import os
+import traceback
+
+from .profiling import profile_file
+
+# Number of submitted files per worker, kept in flight so workers never wait on the parent
+_IN_FLIGHT_PER_JOB = 4
+
+
+@dataclass
+class FileResult:
+	"""The outcome of processing one file: either a value, or the error that stopped it."""
+	path: object
+	value: object = None
+	error: str = None
+	profile: object = None
+
+	@property
+	def ok(self):
+		""" True if the file was processed without error.
+		:rtype: bool
+		"""
+		return self.error is None
+
+
+def resolve_jobs(jobs):
+	""" Resolve a --jobs value to a number of worker processes; 0 or less means one per CPU.
+	:rtype: int
+	"""
+	return jobs if jobs > 0 else (os.cpu_count() or 1)
+
+
+def _call(func, path, args, profile=False):
+	""" Run func on one file, turning any exception into an error result. Runs in the worker process. """
+	with profile_file(path, enabled=profile) as record:
+		try:
+			result = FileResult(path, value=func(path, *args))
+		except Exception as ex:  # pylint: disable=broad-except
+			logging.debug(traceback.format_exc())
+			result = FileResult(path, error=f"{type(ex).__name__}: {ex}")
+	result.profile = record
+	return result
+
+
+def run_batch(func, paths, jobs=1, args=(), profile=False):
+	""" Apply func to each file, in a pool of worker processes. Files are submitted lazily, a few per worker at
+	a time, so a huge file iterator is never materialized. An error in one file is reported as that file's result
+	and the batch carries on. When a worker dies (e.g. OOM-killed), the pool is restarted and the files that
+	were in flight are retried one at a time, so only the file that kills a worker alone is reported failed.
+	:param func: A picklable function, called as func(path, *args).
+	:param paths: An iterable of files, e.g. a file_iterator.
+	:param jobs: Number of worker processes. 1 runs in-process, 0 or less uses one per CPU.
+	:param args: Extra arguments passed to func.
+	:param profile: Profile each file, into FileResult.profile.
+	:return: A generator of FileResult, in completion order.
+	:rtype: FileResult
+	"""
+	jobs = resolve_jobs(jobs)
+	paths = iter(paths)
+
+	if jobs == 1:
+		for path in paths:
+			yield _call(func, path, args, profile)
+		return
+
+	executor = ProcessPoolExecutor(max_workers=jobs)
+	pending = {}
+	# Files in flight when a worker died. Each is retried alone, so a crash can be pinned on its file.
+	suspects = collections.deque()
+	try:
+		while True:
+			if suspects:
+				if not pending:
+					path = suspects.popleft()
+					pending[executor.submit(_call, func, path, args, profile)] = path
+			else:
+				for path in itertools.islice(paths, jobs * _IN_FLIGHT_PER_JOB - len(pending)):
+					pending[executor.submit(_call, func, path, args, profile)] = path
+			if not pending:
+				break
+
+			done, _ = wait(pending, return_when=FIRST_COMPLETED)
+			alone = len(pending) == 1
+			broken = False
+			for future in done:
+				path = pending.pop(future)
+				try:
+					yield future.result()
+				except BrokenProcessPool as ex:
+					broken = True
+					if alone:
+						yield FileResult(path, error=f"{type(ex).__name__}: {ex}")
+					else:
+						suspects.append(path)
+
+			if broken:
+				logging.warning("Worker process died, restarting process pool.")
+				for future, path in pending.items():
+					if future.done() and future.exception() is None:
+						yield future.result()
+					else:
+						suspects.append(path)
+				pending = {}
+				executor.shutdown(wait=False, cancel_futures=True)
+				executor = ProcessPoolExecutor(max_workers=jobs)
+	finally:
+		executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Memory budget for files processed concurrently.
+
+The footprint of each file is estimated from its header before it is admitted: small files are decoded as a
+single block, larger ones are streamed in fixed-size blocks, so no file's footprint grows past a block's worth
+of samples plus its per-hop analysis arrays. The read stage adds the working buffers of the optional stages the
+file goes through: features, pitch, key, fingerprints and format conversion. Files are admitted in order while
+their total footprint fits the budget; a file that doesn't fit waits for earlier files to finish, and one larger
+than the whole budget runs alone.
+"""
+import re
+import threading
+import time
+
+from .wavreader import DEFAULT_BLOCK_FRAMES
+
+# Bytes held per decoded sample while a block is analyzed: the float32 block and its temporaries
+BYTES_PER_BLOCK_SAMPLE = 12
+
+# Bytes held per analysis hop: chunk sums and peaks, RMS, peak and dB levels
+BYTES_PER_HOP = 32
+
+# Fixed bytes held per file: header, memory mapping and result bookkeeping
+BYTES_PER_FILE = 64 << 10
+
+# Files whose single-block footprint is at most this are decoded as one block
+SINGLE_BLOCK_BYTES = 16 << 20
+
+# Seconds between checks for cancellation while waiting for budget
+_POLL_S = 0.1
+
+_SIZE_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+def parse_size(text):
+	""" Parse a size in bytes, with an optional binary unit suffix: 512M, 4G, 1.5G, 65536.
+	:rtype: int
+	"""
+	match = re.fullmatch(r'\s*(\d+(?:\.\d*)?)\s*([KMGT]?)(?:i?B)?\s*', str(text), re.IGNORECASE)
+	if not match:
+		raise ValueError(f"invalid size: '{text}'")
+	return int(float(match.group(1)) * _SIZE_UNITS[match.group(2).upper()])
+
+
+def plan_blocks(info, hop, max_bytes=None):
+	""" Choose how a file is decoded, and estimate its footprint.
+	:param info: The WavInfo of the file.
+	:param hop: Number of samples between analysis frames.
+	:param max_bytes: The memory budget. A file is decoded as one block only if that fits in a quarter of it.
+	:return: Number of frames per block, and the estimated peak footprint in bytes.
+	:rtype: tuple[int, int]
+	"""
+	single_block_bytes = SINGLE_BLOCK_BYTES if max_bytes is None else min(SINGLE_BLOCK_BYTES, max_bytes // 4)
+	block_frames = max(1, info.frames)
+	if block_frames * info.channels * BYTES_PER_BLOCK_SAMPLE > single_block_bytes:
+		block_frames = min(block_frames, DEFAULT_BLOCK_FRAMES)
+	footprint = (block_frames * info.channels * BYTES_PER_BLOCK_SAMPLE + -(-info.frames // hop) * BYTES_PER_HOP +
+				 BYTES_PER_FILE)
+	return block_frames, footprint
+
+
+class MemoryBudget:
+	""" Admits reservations in arrival order while their total fits a byte bound. Safe to share between threads. """
+
+	def __init__(self, max_bytes):
+		"""
+		:param max_bytes: The bound on the bytes reserved at any time.
+		"""
+		self.max_bytes = max_bytes
+		self.in_use = 0
+		self.peak = 0
+		self.waits = 0
+		self.wait_s = 0.0
+		self._cond = threading.Condition()
+		self._next_ticket = 0
+		self._serving = 0
+		self._abandoned = set()
+
+	def acquire(self, nbytes, cancelled=None):
+		""" Reserve bytes, waiting until they fit behind the reservations that arrived first. A reservation larger
+		than the bound is clamped to it, so it waits for everything else to finish and then runs alone.
+		:param nbytes: The bytes to reserve.
+		:param cancelled: A threading.Event that ends the wait.
+		:return: The bytes reserved, to release() later, or None if cancelled.
+		:rtype: int
+		"""
+		nbytes = min(nbytes, self.max_bytes)
+		with self._cond:
+			ticket = self._next_ticket
+			self._next_ticket += 1
+			started = None
+			while ticket != self._serving or self.in_use + nbytes > self.max_bytes:
+				if cancelled is not None and cancelled.is_set():
+					self._abandon(ticket)
+					return None
+				if started is None:
+					started = time.perf_counter()
+					self.waits += 1
+				self._cond.wait(_POLL_S)
+			if started is not None:
+				self.wait_s += time.perf_counter() - started
+			self.in_use += nbytes
+			self.peak = max(self.peak, self.in_use)
+			self._advance()
+		return nbytes
+
+	def release(self, nbytes):
+		""" Return reserved bytes to the budget. """
+		with self._cond:
+			self.in_use -= nbytes
+			self._cond.notify_all()
+
+	def _abandon(self, ticket):
+		self._abandoned.add(ticket)
+		if ticket == self._serving:
+			self._advance()
+
+	def _advance(self):
+		""" Serve the next ticket that is still waiting. """
+		self._serving += 1
+		while self._serving in self._abandoned:
+			self._abandoned.discard(self._serving)
+			self._serving += 1
+		self._cond.notify_all()
+
+	def to_dict(self):
+		""" The usage statistics as plain values.
+		:rtype: dict
+		"""
+		return {'max_bytes': self.max_bytes, 'peak_bytes': self.peak, 'waits': self.waits,
+				'wait_s': round(self.wait_s, 6)}
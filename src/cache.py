@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Persistent, size-bounded cache of per-file analysis results.
+
+Entries are keyed by the resolved path, size and modification time of the source file and by the hash of the
+analysis parameters, so a file is analyzed again only when it, or the way it is analyzed, changes. Entries are
+stored as uncompressed NumPy .npz files. A hit bumps the modification time of its entry, which makes eviction
+least-recently-used: the oldest entries go first once the cache outgrows its size bound.
+"""
+from dataclasses import fields
+import hashlib
+import logging
+import os
+from pathlib import Path
+import threading
+
+import numpy as np
+
+from .analysis import AnalysisResult
+
+# Bump when the stored layout of AnalysisResult changes, to invalidate all existing entries
+CACHE_VERSION = 1
+
+# Default size bound of a cache, in bytes
+DEFAULT_CACHE_BYTES = 1 << 30
+
+# Fraction of the size bound an eviction shrinks the cache to, so eviction doesn't run on every put
+_EVICT_TO = 0.9
+
+_ENTRY_SUFFIX = '.npz'
+
+
+class AnalysisCache:
+	""" On-disk cache of AnalysisResult entries. Safe to share between threads and processes. """
+	_instances = {}
+	_instances_lock = threading.Lock()
+
+	def __init__(self, cache_dir, max_bytes=DEFAULT_CACHE_BYTES):
+		"""
+		:param cache_dir: Directory to store the entries in. Created if missing.
+		:param max_bytes: Size bound of the cache.
+		"""
+		self.cache_dir = Path(cache_dir)
+		self.max_bytes = max_bytes
+		self.cache_dir.mkdir(parents=True, exist_ok=True)
+		self._lock = threading.Lock()
+		self._total_bytes = None
+
+	@classmethod
+	def open(cls, cache_dir, max_bytes=DEFAULT_CACHE_BYTES):
+		""" Get the cache of a directory, shared within the process so its size is scanned only once.
+		:rtype: AnalysisCache
+		"""
+		with cls._instances_lock:
+			key = (str(Path(cache_dir).resolve()), max_bytes)
+			if key not in cls._instances:
+				cls._instances[key] = cls(cache_dir, max_bytes)
+			return cls._instances[key]
+
+	def entry_filename(self, audio_filename, params):
+		""" Name the entry of a file. Raises OSError if the file doesn't exist.
+		:param audio_filename: The analyzed file.
+		:param params: The AnalysisParams (or any object with a digest() method) of the analysis.
+		:rtype: Path
+		"""
+		resolved = Path(audio_filename).resolve()
+		stat = resolved.stat()
+		key = f"{CACHE_VERSION}\0{resolved}\0{stat.st_size}\0{stat.st_mtime_ns}\0{params.digest()}"
+		return self.cache_dir / f"{hashlib.sha1(key.encode()).hexdigest()}{_ENTRY_SUFFIX}"
+
+	def get(self, audio_filename, params):
+		""" Look up the stored analysis of a file.
+		:param audio_filename: The analyzed file.
+		:param params: The parameters of the analysis.
+		:return: The stored result, or None on a miss.
+		:rtype: AnalysisResult
+		"""
+		try:
+			entry = self.entry_filename(audio_filename, params)
+			with np.load(entry) as stored:
+				result = AnalysisResult(**{f.name: _from_array(stored[f.name]) for f in fields(AnalysisResult)})
+			os.utime(entry)
+		except (OSError, KeyError, ValueError):
+			return None
+		logging.debug(f"\tcache hit: '{audio_filename}'")
+		return result
+
+	def put(self, audio_filename, params, result):
+		""" Store the analysis of a file, evicting least recently used entries if the cache outgrows its bound.
+		:param audio_filename: The analyzed file.
+		:param params: The parameters of the analysis.
+		:param result: The AnalysisResult to store.
+		"""
+		entry = self.entry_filename(audio_filename, params)
+		tmp_entry = entry.with_name(f"{entry.stem}.{os.getpid()}.{threading.get_ident()}.tmp{_ENTRY_SUFFIX}")
+		np.savez(tmp_entry, **{f.name: np.asarray(getattr(result, f.name)) for f in fields(result)})
+		try:
+			# An entry stored again replaces the old one, whose size no longer counts
+			replaced_bytes = entry.stat().st_size
+		except OSError:
+			replaced_bytes = 0
+		os.replace(tmp_entry, entry)
+
+		with self._lock:
+			if self._total_bytes is None:
+				self._total_bytes = self._scan()[1]
+			else:
+				self._total_bytes += entry.stat().st_size - replaced_bytes
+			if self._total_bytes > self.max_bytes:
+				self._evict()
+
+	def _scan(self):
+		""" List the entries, oldest use first.
+		:return: (mtime, size, path) of each entry, and their total size.
+		:rtype: tuple[list, int]
+		"""
+		entries = []
+		with os.scandir(self.cache_dir) as scanner:
+			for dir_entry in scanner:
+				if dir_entry.name.endswith(_ENTRY_SUFFIX) and '.tmp' not in dir_entry.name:
+					try:
+						stat = dir_entry.stat()
+					except OSError:
+						continue
+					entries.append((stat.st_mtime_ns, stat.st_size, dir_entry.path))
+		entries.sort()
+		return entries, sum(size for _, size, _ in entries)
+
+	def _evict(self):
+		""" Remove the least recently used entries, until the cache is below its eviction target. """
+		entries, total = self._scan()
+		target = self.max_bytes * _EVICT_TO
+		evicted = 0
+		for _, size, path in entries:
+			if total <= target:
+				break
+			try:
+				os.remove(path)
+			except OSError:
+				continue
+			total -= size
+			evicted += 1
+		self._total_bytes = total
+		logging.debug(f"\tcache evicted {evicted} entries, {total} bytes left")
+
+
+def _from_array(value):
+	return value.item() if value.ndim == 0 else value
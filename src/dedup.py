@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Near-duplicate slice detection with 64-bit fingerprints and a locality-sensitive hash index.
+
+The fingerprint of a slice packs two parts into one integer. The low ENVELOPE_BITS bits are a SimHash of its
+level envelope: the analysis RMS frames of the slice, averaged into a few points, in dB below the peak of the
+slice, and projected onto fixed random hyperplanes. The high SPECTRAL_BITS bits are a SimHash of the log
+energies of SPECTRAL_BANDS log-spaced bands of its attack, relative to their mean, so a spectrum whose energy
+sits in other bands flips many of them. Neither part depends on the gain of the slice, and similar slices
+differ in few bits. The fingerprints of a file are computed with array operations, the attacks transformed in
+batches.
+
+Bits alone can't tell notes a semitone apart, so each fingerprint also carries the pitch of its slice, and
+near-duplicates must match in pitch too: both unpitched, or within a fraction of a semitone.
+
+The index splits fingerprints into LSH_BANDS bands of 16 bits and keeps a hash table per band. Fingerprints
+within LSH_BANDS - 1 bits of each other agree on at least one band, so looking up the band values of a slice
+finds all of its near-duplicates in constant time on average, without comparing it to every indexed slice.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+import math
+import threading
+
+import numpy as np
+import scipy.fft
+
+from .features import band_edges
+from .pitch import gather_windows, slice_pitches
+
+ENVELOPE_BITS = 48
+SPECTRAL_BITS = 16
+
+# Log-spaced bands of the attack spectrum hashed into the spectral bits
+SPECTRAL_BANDS = 32
+
+# Bands of the LSH index, of 16 bits each
+LSH_BANDS = 4
+
+# Slices whose attacks are transformed together, bounding the batch to ~8 MiB at n_fft 2048
+FINGERPRINT_BATCH = 512
+
+# Seed of the SimHash hyperplanes, fixed so fingerprints are comparable across runs and processes
+_PROJECTION_SEED = 0x5eed
+
+
+@dataclass(frozen=True)
+class FingerprintParams:
+	"""Parameters of the slice fingerprints, and of what counts as a near-duplicate."""
+	envelope_points: int = 32
+	floor_db: float = -60.0
+	n_fft: int = 2048
+	max_distance: int = LSH_BANDS - 1
+	max_duration_ratio: float = 1.25
+	max_pitch_semitones: float = 0.5
+
+
+@dataclass
+class SliceFingerprints:
+	"""The fingerprint, duration in seconds and pitch in Hz (NaN if unpitched) of each slice of a file."""
+	fingerprint: np.ndarray
+	duration: np.ndarray
+	pitch: np.ndarray
+
+
+@lru_cache(maxsize=8)
+def _hyperplanes(points, bits):
+	return np.random.default_rng((_PROJECTION_SEED, points, bits)).standard_normal((points, bits)).astype(np.float32)
+
+
+def envelopes(result, boundaries, params=FingerprintParams()):
+	""" Average the RMS frames of an analysis over each slice into params.envelope_points equal segments, with
+	fractional segment edges so slices shorter than the points still get a smooth envelope.
+	:param result: The AnalysisResult of the file.
+	:param boundaries: The slice boundaries as (start frame, stop frame) rows.
+	:param params: The fingerprint parameters.
+	:return: The envelopes in dB below the peak of each slice, floored at params.floor_db, shaped (slices, points).
+	:rtype: np.ndarray
+	"""
+	rms = result.rms.astype(np.float64)
+	integral = np.concatenate(([0], np.cumsum(rms)))
+	first = boundaries[:, 0] / result.hop
+	last = np.maximum(boundaries[:, 1] / result.hop, first + 1e-3)
+	edges = first[:, None] + (last - first)[:, None] * np.linspace(0, 1, params.envelope_points + 1)
+	edges = np.minimum(edges, len(rms))
+	levels = np.diff(np.interp(edges, np.arange(len(integral)), integral), axis=1) / np.maximum(np.diff(edges), 1e-9)
+	levels_db = 20 * np.log10(np.maximum(levels, 1e-10))
+	return np.maximum(levels_db - levels_db.max(axis=1, keepdims=True), params.floor_db).astype(np.float32)
+
+
+def spectral_bits(windows, sample_rate, n_fft):
+	""" SimHash the log energies of the log-spaced bands of each window, relative to their mean.
+	:param windows: Windows shaped (count, n_fft).
+	:return: Booleans shaped (count, SPECTRAL_BITS).
+	:rtype: np.ndarray
+	"""
+	power = np.abs(scipy.fft.rfft(windows * np.hanning(n_fft).astype(np.float32), axis=1)) ** 2
+	bands = np.add.reduceat(power, band_edges(sample_rate, n_fft, SPECTRAL_BANDS)[:-1], axis=1)
+	# Floored 60 dB below the strongest band, so bands of rounding noise don't outweigh the spectrum
+	levels = np.log(np.maximum(bands, 1e-6 * bands.max(axis=1, keepdims=True) + 1e-20))
+	centered = (levels - levels.mean(axis=1, keepdims=True)).astype(np.float32)
+	return centered @ _hyperplanes(SPECTRAL_BANDS, SPECTRAL_BITS) > 0
+
+
+def slice_fingerprints(reader, result, params=FingerprintParams(), pitches=None):
+	""" Fingerprint each slice of a file.
+	:param reader: An open WavReader or FlacReader.
+	:param result: The AnalysisResult of the file.
+	:param params: The fingerprint parameters.
+	:param pitches: The SlicePitches of the slices, if already estimated. Estimated with the default PitchParams if
+		None.
+	:rtype: SliceFingerprints
+	"""
+	sample_rate = reader.info.sample_rate
+	boundaries = np.asarray(result.slices, dtype=np.int64).reshape(-1, 2)
+	envelope = envelopes(result, boundaries, params)
+	centered = envelope - envelope.mean(axis=1, keepdims=True)
+	bits = np.zeros((len(boundaries), ENVELOPE_BITS + SPECTRAL_BITS), dtype=bool)
+	bits[:, :ENVELOPE_BITS] = centered @ _hyperplanes(params.envelope_points, ENVELOPE_BITS) > 0
+
+	# The attack of each slice: its first n_fft frames
+	starts = boundaries[:, 0]
+	stops = np.minimum(boundaries[:, 1], starts + params.n_fft)
+	for first in range(0, len(boundaries), FINGERPRINT_BATCH):
+		batch = slice(first, first + FINGERPRINT_BATCH)
+		windows = gather_windows(reader, starts[batch], stops[batch], params.n_fft)
+		bits[batch, ENVELOPE_BITS:] = spectral_bits(windows, sample_rate, params.n_fft)
+
+	fingerprint = np.packbits(bits, axis=1, bitorder='little').view('<u8').reshape(-1)
+	duration = ((boundaries[:, 1] - boundaries[:, 0]) / sample_rate).astype(np.float32)
+	if pitches is None:
+		pitches = slice_pitches(reader, boundaries)
+	return SliceFingerprints(fingerprint, duration, pitches.frequency)
+
+
+def fingerprints_footprint(hops, slices, params=FingerprintParams()):
+	""" Estimate the bytes held while the slices of a file are fingerprinted: the envelopes of the slices, one
+	batch of attack spectra, and the fingerprint of each slice. The pitches the fingerprints are given are not
+	included.
+	:param hops: The number of analysis hops of the file.
+	:param slices: The most slices the file has.
+	:rtype: int
+	"""
+	return (hops * 16 + slices * (params.envelope_points * 40 + 96) +
+			min(slices, FINGERPRINT_BATCH) * params.n_fft * 16)
+
+
+class FingerprintIndex:
+	""" LSH index of the fingerprints of the unique slices seen so far. Safe to share between threads. """
+
+	def __init__(self, params=FingerprintParams()):
+		"""
+		:param params: The fingerprint parameters, bounding the bits, durations and pitches near-duplicates differ in.
+		"""
+		self.params = params
+		self._tables = [{} for _ in range(LSH_BANDS)]
+		self._fingerprints = []
+		self._durations = []
+		self._pitches = []
+		self._names = []
+		self._lock = threading.Lock()
+
+	def __len__(self):
+		return len(self._names)
+
+	def _candidates(self, fingerprint):
+		""" The entries sharing a band with a fingerprint, oldest first. """
+		found = set()
+		for band, table in enumerate(self._tables):
+			found.update(table.get((fingerprint >> (16 * band)) & 0xFFFF, ()))
+		return sorted(found)
+
+	def _same_pitch(self, entry, pitch):
+		""" Both unpitched, or both pitched within the maximum interval. """
+		other = self._pitches[entry]
+		if math.isnan(other) or math.isnan(pitch):
+			return math.isnan(other) and math.isnan(pitch)
+		return abs(12 * math.log2(pitch / other)) <= self.params.max_pitch_semitones
+
+	def _is_near(self, entry, fingerprint, duration, pitch):
+		longer, shorter = max(self._durations[entry], duration), min(self._durations[entry], duration)
+		return (bin(fingerprint ^ self._fingerprints[entry]).count('1') <= self.params.max_distance
+				and longer <= self.params.max_duration_ratio * shorter and self._same_pitch(entry, pitch))
+
+	def add(self, audio_filename, fingerprints):
+		""" Look up the near-duplicates of the slices of a file, and index the slices that have none. Slices are
+		looked up in order, so a slice can also duplicate an earlier slice of the same file.
+		:param audio_filename: The file of the slices.
+		:param fingerprints: The SliceFingerprints of the slices.
+		:return: The (file, slice index) of an earlier near-duplicate, by the index of each duplicate slice.
+		:rtype: dict[int, tuple[str, int]]
+		"""
+		duplicates = {}
+		with self._lock:
+			for index, (fingerprint, duration, pitch) in enumerate(zip(fingerprints.fingerprint.tolist(),
+																	   fingerprints.duration.tolist(),
+																	   fingerprints.pitch.tolist())):
+				original = next((entry for entry in self._candidates(fingerprint)
+								 if self._is_near(entry, fingerprint, duration, pitch)), None)
+				if original is not None:
+					duplicates[index] = self._names[original]
+					continue
+				entry = len(self._names)
+				self._names.append((str(audio_filename), index))
+				self._fingerprints.append(fingerprint)
+				self._durations.append(duration)
+				self._pitches.append(pitch)
+				for band, table in enumerate(self._tables):
+					table.setdefault((fingerprint >> (16 * band)) & 0xFFFF, []).append(entry)
+		return duplicates
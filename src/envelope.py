@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Min/max envelopes of audio files, for plotting.
+
+A plot can't show more than one value pair per pixel, so the signal is reduced to the minimum and maximum of
+each bin of samples before plotting. Envelopes can be stored as a multi-resolution pyramid, so a file can be
+re-plotted, or zoomed into, without reading its samples again.
+"""
+import os
+from pathlib import Path
+
+import numpy as np
+
+from .slicer import source_stem
+from .wavreader import DEFAULT_BLOCK_FRAMES
+
+
+def _reduce(values, group, func):
+	""" Reduce groups of `group` consecutive rows with func, padding the last group with its last row. """
+	pad = -len(values) % group
+	if pad:
+		values = np.concatenate((values, np.repeat(values[-1:], pad, axis=0)))
+	return func(values.reshape(-1, group, values.shape[1]), axis=1)
+
+
+def minmax_envelope(reader, samples_per_bin):
+	""" Reduce a file to the minimum and maximum normalized sample of each bin, per channel.
+	:param reader: An open WavReader.
+	:param samples_per_bin: Number of frames per bin.
+	:return: The per-bin minima and maxima, each shaped (bins, channels).
+	:rtype: tuple[np.ndarray, np.ndarray]
+	"""
+	info = reader.info
+	bins = -(-info.frames // samples_per_bin)
+	mins = np.zeros((bins, info.channels), dtype=np.float32)
+	maxs = np.zeros((bins, info.channels), dtype=np.float32)
+
+	# Blocks hold a whole number of bins, so bins never straddle blocks.
+	block_frames = max(1, DEFAULT_BLOCK_FRAMES // samples_per_bin) * samples_per_bin
+	for offset, block in reader.float_blocks(block_frames=block_frames):
+		first = offset // samples_per_bin
+		block_min = _reduce(block, samples_per_bin, np.min)
+		mins[first:first + len(block_min)] = block_min
+		maxs[first:first + len(block_min)] = _reduce(block, samples_per_bin, np.max)
+	return mins, maxs
+
+
+def reduce_envelope(mins, maxs, factor):
+	""" Reduce an envelope to a coarser one, with `factor` bins per bin.
+	:return: The coarser minima and maxima.
+	:rtype: tuple[np.ndarray, np.ndarray]
+	"""
+	return _reduce(mins, factor, np.min), _reduce(maxs, factor, np.max)
+
+
+class EnvelopePyramid:
+	""" Min/max envelopes of a file at decreasing resolutions. Level n has base * factor**n frames per bin. """
+	FILE_VERSION = 1
+
+	def __init__(self, frames, sample_rate, base, factor, levels):
+		"""
+		:param frames: Number of frames of the file.
+		:param sample_rate: Sample rate of the file.
+		:param base: Frames per bin of the finest level.
+		:param factor: Bins merged into one bin of the next level.
+		:param levels: (mins, maxs) per level, finest first.
+		"""
+		self.frames = frames
+		self.sample_rate = sample_rate
+		self.base = base
+		self.factor = factor
+		self.levels = levels
+
+	@classmethod
+	def build(cls, reader, base=64, factor=4, min_bins=256):
+		""" Build the pyramid of a file, reading its samples once.
+		:param reader: An open WavReader.
+		:param base: Frames per bin of the finest level.
+		:param factor: Bins merged into one bin of the next level.
+		:param min_bins: No coarser levels are built once a level has fewer bins than this.
+		:rtype: EnvelopePyramid
+		"""
+		levels = [minmax_envelope(reader, base)]
+		while len(levels[-1][0]) > min_bins:
+			levels.append(reduce_envelope(*levels[-1], factor))
+		return cls(reader.info.frames, reader.info.sample_rate, base, factor, levels)
+
+	def samples_per_bin(self, level):
+		""" Number of frames per bin at a level.
+		:rtype: int
+		"""
+		return self.base * self.factor ** level
+
+	def query(self, bins, start=0, stop=None):
+		""" Get the envelope of a frame range in about `bins` bins, from the coarsest level that has enough.
+		:param bins: Number of bins wanted, e.g. the plot width in pixels. At most this many are returned.
+		:param start: First frame of the range.
+		:param stop: Frame the range ends at. End of file if None.
+		:return: The frames per bin, the first frame of the first bin, and the minima and maxima.
+		:rtype: tuple[int, int, np.ndarray, np.ndarray]
+		"""
+		stop = self.frames if stop is None else min(stop, self.frames)
+		span = max(stop - start, 1)
+		level = 0
+		while level + 1 < len(self.levels) and span // self.samples_per_bin(level + 1) >= bins:
+			level += 1
+
+		samples_per_bin = self.samples_per_bin(level)
+		first, last = start // samples_per_bin, -(-stop // samples_per_bin)
+		mins, maxs = (values[first:last] for values in self.levels[level])
+		group = max(1, -(-len(mins) // bins))
+		if group > 1:
+			mins, maxs = reduce_envelope(mins, maxs, group)
+		return samples_per_bin * group, first * samples_per_bin, mins, maxs
+
+	def save(self, filename):
+		""" Store the pyramid as a NumPy .npz file. """
+		arrays = {}
+		for level, (mins, maxs) in enumerate(self.levels):
+			arrays[f"min{level}"], arrays[f"max{level}"] = mins, maxs
+		header = np.array([self.FILE_VERSION, self.frames, self.sample_rate, self.base, self.factor, len(self.levels)])
+		tmp_filename = f"{filename}.tmp.npz"
+		np.savez(tmp_filename, header=header, **arrays)
+		os.replace(tmp_filename, filename)
+
+	@classmethod
+	def load(cls, filename):
+		""" Load a pyramid stored with save().
+		:rtype: EnvelopePyramid
+		"""
+		with np.load(filename) as stored:
+			version, frames, sample_rate, base, factor, n_levels = (int(v) for v in stored['header'])
+			if version != cls.FILE_VERSION:
+				raise ValueError(f"Unsupported envelope pyramid version {version}: '{filename}'")
+			levels = [(stored[f"min{level}"], stored[f"max{level}"]) for level in range(n_levels)]
+		return cls(frames, sample_rate, base, factor, levels)
+
+
+def pyramid_filename(pyramid_dir, audio_filename):
+	""" Name the stored pyramid of a file, unique per resolved source path.
+	:rtype: Path
+	"""
+	return Path(pyramid_dir, f"{source_stem(audio_filename)}.npz")
+
+
+def load_or_build_pyramid(reader, pyramid_dir):
+	""" Load the stored pyramid of a file, or build and store it if missing or older than the file.
+	:param reader: An open WavReader.
+	:param pyramid_dir: Directory pyramids are stored in.
+	:rtype: EnvelopePyramid
+	"""
+	filename = pyramid_filename(pyramid_dir, reader.filename)
+	try:
+		if filename.stat().st_mtime_ns >= os.stat(reader.filename).st_mtime_ns:
+			pyramid = EnvelopePyramid.load(filename)
+			if pyramid.frames == reader.info.frames:
+				return pyramid
+	except (OSError, ValueError, KeyError):
+		pass
+
+	pyramid = EnvelopePyramid.build(reader)
+	Path(pyramid_dir).mkdir(parents=True, exist_ok=True)
+	pyramid.save(filename)
+	return pyramid
+
+
+def file_envelope(reader, width, pyramid_dir=None):
+	""" Get the envelope of a whole file in about `width` bins, from its stored pyramid if a directory is given.
+	:param reader: An open WavReader.
+	:param width: Number of bins wanted, about the plot width in pixels.
+	:param pyramid_dir: Directory to load or store the envelope pyramid of the file. Not stored if None.
+	:return: The frames per bin, the first frame of the first bin, and the minima and maxima.
+	:rtype: tuple[int, int, np.ndarray, np.ndarray]
+	"""
+	if pyramid_dir:
+		return load_or_build_pyramid(reader, pyramid_dir).query(width)
+	samples_per_bin = max(1, -(-reader.info.frames // width))
+	return (samples_per_bin, 0) + minmax_envelope(reader, samples_per_bin)
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Spectral features of slices: centroid, flatness, band energies and MFCC-like vectors.
+
+A file is transformed once, by a windowed STFT over its mono downmix, streamed block by block, with frames
+centered on multiples of the hop. Frames are transformed in batches of FRAMES_PER_BATCH, each batch reduced
+to its per-frame features straight away, so only the compact frame feature matrix is kept, never the
+spectrogram. Each slice then gets the mean of its frames' features, from cumulative sums over the matrix,
+without transforming anything again.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+import os
+
+import numpy as np
+import scipy.fft
+
+from .slicer import source_stem
+
+# Frames transformed per batch, bounding the spectrogram held at a time (~4 MiB at n_fft 2048)
+FRAMES_PER_BATCH = 512
+
+# Floor applied to powers before taking logarithms
+_POWER_FLOOR = np.float32(1e-12)
+
+# Lowest frequency of the band and mel filter banks, in Hz
+_MIN_FREQUENCY = 50.0
+
+
+@dataclass(frozen=True)
+class FeatureParams:
+	"""Parameters of the spectral features."""
+	n_fft: int = 2048
+	hop_ms: float = 10.0
+	n_bands: int = 8
+	n_mels: int = 40
+	n_mfcc: int = 13
+
+	def hop(self, sample_rate):
+		""" Number of samples between consecutive STFT frames.
+		:rtype: int
+		"""
+		return max(1, int(round(sample_rate * self.hop_ms / 1000)))
+
+
+@lru_cache(maxsize=32)
+def _window(n_fft):
+	return np.hanning(n_fft + 1)[:-1].astype(np.float32)
+
+
+@lru_cache(maxsize=32)
+def band_edges(sample_rate, n_fft, n_bands):
+	""" FFT bin edges of log-spaced bands from 50 Hz to Nyquist. The first band also holds the bins below 50 Hz.
+	:return: n_bands + 1 increasing bin indices.
+	:rtype: np.ndarray
+	"""
+	nyquist = sample_rate / 2
+	edges_hz = np.geomspace(min(_MIN_FREQUENCY, nyquist / 2), nyquist, n_bands + 1)
+	edges = np.round(edges_hz / sample_rate * n_fft).astype(np.int64)
+	edges[0], edges[-1] = 0, n_fft // 2 + 1
+	# At least one bin per band
+	index = np.arange(n_bands + 1)
+	return np.maximum.accumulate(edges - index) + index
+
+
+def _mel(hz):
+	return 2595 * np.log10(1 + hz / 700)
+
+
+def _hz(mel):
+	return 700 * (10 ** (mel / 2595) - 1)
+
+
+@lru_cache(maxsize=32)
+def mel_filterbank(sample_rate, n_fft, n_mels):
+	""" Triangular mel filters over the rFFT bins, shaped (n_fft // 2 + 1, n_mels).
+	:rtype: np.ndarray
+	"""
+	bin_hz = np.arange(n_fft // 2 + 1) * sample_rate / n_fft
+	points = _hz(np.linspace(_mel(_MIN_FREQUENCY), _mel(sample_rate / 2), n_mels + 2))
+	lower, center, upper = points[:-2, None], points[1:-1, None], points[2:, None]
+	rising = (bin_hz - lower) / (center - lower)
+	falling = (upper - bin_hz) / (upper - center)
+	return np.maximum(0, np.minimum(rising, falling)).T.astype(np.float32)
+
+
+@dataclass
+class FrameFeatures:
+	"""Per-frame spectral features of a file. Frame k is centered on sample k * hop."""
+	sample_rate: int
+	hop: int
+	n_fft: int
+	centroid: np.ndarray
+	flatness: np.ndarray
+	bands: np.ndarray
+	mfcc: np.ndarray
+
+	def slice_features(self, boundaries):
+		""" The mean features of the frames centered within each slice, or of the nearest frame if the slice is
+		shorter than a hop.
+		:param boundaries: The slice boundaries as (start frame, stop frame) rows, in samples.
+		:rtype: SliceFeatures
+		"""
+		boundaries = np.asarray(boundaries, dtype=np.int64).reshape(-1, 2)
+		count = len(self.centroid)
+		first = np.minimum(boundaries[:, 0] // self.hop, max(count - 1, 0))
+		last = np.clip(-(-boundaries[:, 1] // self.hop), first + 1, count)
+		means = (_range_means(values, first, last) for values in (self.centroid, self.flatness, self.bands, self.mfcc))
+		return SliceFeatures(self.sample_rate, self.hop, self.n_fft, boundaries, *means)
+
+
+def _range_means(values, first, last):
+	""" Means of values[first[i]:last[i]] for each i, from one cumulative sum. """
+	if len(values) == 0:
+		return np.zeros((len(first),) + values.shape[1:], dtype=np.float32)
+	sums = np.concatenate((np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0, dtype=np.float64)))
+	counts = np.maximum(last - first, 1).reshape((-1,) + (1,) * (values.ndim - 1))
+	return ((sums[last] - sums[first]) / counts).astype(np.float32)
+
+
+@dataclass
+class SliceFeatures:
+	"""Mean spectral features per slice, storable as a compact .npz file."""
+	FILE_VERSION = 1
+	sample_rate: int
+	hop: int
+	n_fft: int
+	boundaries: np.ndarray
+	centroid: np.ndarray
+	flatness: np.ndarray
+	bands: np.ndarray
+	mfcc: np.ndarray
+
+	def save(self, filename):
+		""" Store the features as a NumPy .npz file. """
+		header = np.array([self.FILE_VERSION, self.sample_rate, self.hop, self.n_fft])
+		tmp_filename = f"{filename}.tmp.npz"
+		np.savez(tmp_filename, header=header, boundaries=self.boundaries, centroid=self.centroid,
+				 flatness=self.flatness, bands=self.bands, mfcc=self.mfcc)
+		os.replace(tmp_filename, filename)
+
+	@classmethod
+	def load(cls, filename):
+		""" Load features stored with save().
+		:rtype: SliceFeatures
+		"""
+		with np.load(filename) as stored:
+			version, sample_rate, hop, n_fft = (int(v) for v in stored['header'])
+			if version != cls.FILE_VERSION:
+				raise ValueError(f"Unsupported feature store version {version}: '{filename}'")
+			return cls(sample_rate, hop, n_fft, *(stored[name] for name in
+												  ('boundaries', 'centroid', 'flatness', 'bands', 'mfcc')))
+
+
+def _batch_features(frames, params, sample_rate):
+	""" Features of a batch of frames, shaped (frames, n_fft). """
+	power = np.abs(scipy.fft.rfft(frames * _window(params.n_fft), axis=1)) ** 2
+	power = power.astype(np.float32, copy=False)
+	total = power.sum(axis=1)
+	bin_hz = np.arange(power.shape[1], dtype=np.float32) * np.float32(sample_rate / params.n_fft)
+	centroid = power @ bin_hz / np.maximum(total, _POWER_FLOOR)
+	log_power = np.log(np.maximum(power, _POWER_FLOOR))
+	flatness = np.exp(log_power.mean(axis=1)) / np.maximum(power.mean(axis=1), _POWER_FLOOR)
+	edges = band_edges(sample_rate, params.n_fft, params.n_bands)
+	bands = 10 * np.log10(np.maximum(np.add.reduceat(power, edges[:-1], axis=1), _POWER_FLOOR))
+	mels = np.log(np.maximum(power @ mel_filterbank(sample_rate, params.n_fft, params.n_mels), _POWER_FLOOR))
+	mfcc = scipy.fft.dct(mels, type=2, norm='ortho', axis=1)[:, :params.n_mfcc]
+	return centroid, flatness, bands, mfcc
+
+
+def frame_batches(reader, n_fft, hop, batch_frames=FRAMES_PER_BATCH):
+	""" Stream the mono downmix of a file as batches of STFT frames. Frame k is centered on sample k * hop, and
+	frames running past either end of the file are zero-padded.
+	:param reader: An open WavReader or FlacReader.
+	:param n_fft: The frame length.
+	:param hop: The number of samples between consecutive frames.
+	:param batch_frames: The most frames per batch.
+	:return: A generator of (index of the first frame, frames shaped (count, n_fft)) tuples. The frames are
+		strided views, valid until the next batch.
+	:rtype: tuple[int, np.ndarray]
+	"""
+	n_frames = -(-reader.info.frames // hop)
+	done = 0
+
+	def batches(samples, count):
+		nonlocal done
+		windows = np.lib.stride_tricks.sliding_window_view(samples, n_fft)[::hop]
+		for start in range(0, count, batch_frames):
+			batch = windows[start:min(start + batch_frames, count)]
+			yield done, batch
+			done += len(batch)
+
+	# Frames are centered, so the first half-frame before the start of the file is zero-padded
+	carry = np.zeros(n_fft // 2, dtype=np.float32)
+	for _, block in reader.float_blocks():
+		samples = np.concatenate((carry, block.mean(axis=1, dtype=np.float32)))
+		count = min((len(samples) - n_fft) // hop + 1 if len(samples) >= n_fft else 0, n_frames - done)
+		if count:
+			yield from batches(samples, count)
+		carry = samples[count * hop:]
+
+	# Frames running past the end of the file are zero-padded
+	remaining = n_frames - done
+	if remaining:
+		yield from batches(np.pad(carry, (0, max(0, (remaining - 1) * hop + n_fft - len(carry)))), remaining)
+
+
+def frame_features(reader, params=FeatureParams()):
+	""" Run one streamed STFT over the mono downmix of a file, reducing each frame to its features.
+	:param reader: An open WavReader or FlacReader.
+	:param params: The feature parameters.
+	:rtype: FrameFeatures
+	"""
+	info = reader.info
+	hop, n_fft = params.hop(info.sample_rate), params.n_fft
+	n_frames = -(-info.frames // hop)
+	features = FrameFeatures(info.sample_rate, hop, n_fft,
+							 centroid=np.zeros(n_frames, dtype=np.float32),
+							 flatness=np.zeros(n_frames, dtype=np.float32),
+							 bands=np.zeros((n_frames, params.n_bands), dtype=np.float32),
+							 mfcc=np.zeros((n_frames, params.n_mfcc), dtype=np.float32))
+	for first, batch in frame_batches(reader, n_fft, hop):
+		stop = first + len(batch)
+		(features.centroid[first:stop], features.flatness[first:stop], features.bands[first:stop],
+		 features.mfcc[first:stop]) = _batch_features(batch, params, info.sample_rate)
+	return features
+
+
+def features_footprint(info, params=FeatureParams()):
+	""" Estimate the bytes held while the features of a file are extracted: the frame feature matrix and one batch
+	of spectra.
+	:rtype: int
+	"""
+	n_frames = -(-info.frames // params.hop(info.sample_rate))
+	return n_frames * (2 + params.n_bands + params.n_mfcc) * 4 + FRAMES_PER_BATCH * params.n_fft * 16
+
+
+def features_filename(features_dir, audio_filename):
+	""" Name the feature store of a file, unique per resolved source path, like its slices.
+	:rtype: str
+	"""
+	return os.path.join(features_dir, f"{source_stem(audio_filename)}_features.npz")
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Block-streaming FLAC reader, with the block interface of WavReader.
+
+FLAC is decoded with libsndfile through the optional `soundfile` package. Each block iterator runs its decoder
+in a background thread, which decodes up to DECODE_AHEAD_BLOCKS blocks ahead into a bounded queue while the
+consumer works on the current one, so decoding overlaps analysis and memory stays bounded to a few blocks.
+
+Blocks have the same layout as the blocks of a WAV file of the same format: 24-bit samples come left-aligned
+into int32, and raw blocks hold little-endian PCM bytes, so slicing a FLAC file writes WAV slices.
+"""
+import queue
+import threading
+
+import numpy as np
+
+from . import profiling
+from .wavreader import DEFAULT_BLOCK_FRAMES, WavFormatError, WavInfo, frame_range, normalize, to_raw
+
+try:
+	import soundfile
+except ImportError:  # FLAC input is unavailable without soundfile
+	soundfile = None
+
+# Blocks decoded ahead of the consumer, per block iterator
+DECODE_AHEAD_BLOCKS = 2
+
+# Seconds between checks for a closed consumer while the queue is full
+_POLL_S = 0.1
+
+# Stored bits per sample of the libsndfile FLAC subtypes
+_SUBTYPE_BITS = {'PCM_S8': 8, 'PCM_16': 16, 'PCM_24': 24}
+
+_END = object()
+
+
+def flac_supported():
+	""" Check whether FLAC files can be read, i.e. whether soundfile is installed.
+	:rtype: bool
+	"""
+	return soundfile is not None
+
+
+def _require_soundfile():
+	if soundfile is None:
+		raise ImportError("Reading FLAC files requires the 'soundfile' package: pip install soundfile")
+
+
+def read_flac_info(filename):
+	""" Read the stream information of a FLAC file, without decoding any audio.
+	:param filename: The FLAC file.
+	:return: The format of the decoded samples, as a WavInfo. data_offset is 0, as the samples are not stored
+		as PCM anywhere in the file.
+	:rtype: WavInfo
+	"""
+	_require_soundfile()
+	try:
+		stream = soundfile.info(str(filename))
+	except RuntimeError as ex:
+		raise WavFormatError(f"Not a readable FLAC file: '{filename}' ({ex})") from ex
+	if stream.format != 'FLAC' or stream.subtype not in _SUBTYPE_BITS:
+		raise WavFormatError(f"Unsupported FLAC format {stream.format}/{stream.subtype}: '{filename}'")
+	bits = _SUBTYPE_BITS[stream.subtype]
+	return WavInfo(sample_rate=stream.samplerate, channels=stream.channels, bits_per_sample=bits, is_float=False,
+				   frames=stream.frames, data_offset=0, block_align=stream.channels * bits // 8)
+
+
+def is_flac_complete(filename):
+	""" Check whether a FLAC file has been completely written: its stream information reads, and announces audio.
+	:param filename: The FLAC file to check.
+	:rtype: bool
+	"""
+	try:
+		return read_flac_info(filename).frames > 0
+	except (OSError, ImportError, WavFormatError):
+		return False
+
+
+class FlacReader:
+	""" Streaming FLAC reader, handing out the decoded samples as blocks of frames. Use as a context manager.
+	Unlike WavReader it has no memory mapping; `raw` and `samples` are not available.
+	"""
+
+	def __init__(self, filename, block_frames=DEFAULT_BLOCK_FRAMES):
+		"""
+		:param filename: The FLAC file to open.
+		:param block_frames: Default number of frames per block.
+		"""
+		self.filename = filename
+		self.info = read_flac_info(filename)
+		self.block_frames = block_frames
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def __len__(self):
+		return self.info.frames
+
+	def close(self):
+		"""Nothing to release: each block iterator opens and closes its own decoder."""
+
+	def _decoded_blocks(self, block_frames, start, stop, dtype):
+		""" Decode blocks in a background thread, a few blocks ahead of the consumer. """
+		block_frames = block_frames or self.block_frames
+		start, stop = frame_range(start, stop, self.info.frames)
+		if start >= stop:
+			return
+		blocks = queue.Queue(DECODE_AHEAD_BLOCKS)
+		closed = threading.Event()
+
+		def put(item):
+			while not closed.is_set():
+				try:
+					blocks.put(item, timeout=_POLL_S)
+					return True
+				except queue.Full:
+					continue
+			return False
+
+		def decode():
+			try:
+				with soundfile.SoundFile(str(self.filename)) as flac:
+					flac.seek(start)
+					for block_start in range(start, stop, block_frames):
+						block = flac.read(min(block_frames, stop - block_start), dtype=dtype, always_2d=True)
+						if not put((block_start, block)):
+							return
+				put(_END)
+			except Exception as ex:  # pylint: disable=broad-except
+				put(ex)
+
+		decoder = threading.Thread(target=decode, name=f"flac-decode-{self.filename}", daemon=True)
+		decoder.start()
+		try:
+			while True:
+				item = blocks.get()
+				if item is _END:
+					return
+				if isinstance(item, Exception):
+					raise item
+				# Counted as the PCM bytes decoded, whichever form the blocks are handed out in
+				profiling.add_bytes_read(len(item[1]) * self.info.block_align)
+				yield item
+		finally:
+			closed.set()
+			decoder.join()
+
+	def _blocks(self, block_frames, start, stop):
+		if self.info.bits_per_sample == 8:
+			for block_start, block in self._decoded_blocks(block_frames, start, stop, 'int16'):
+				yield block_start, ((block >> 8) + 128).astype(np.uint8)
+		else:
+			dtype = 'int16' if self.info.bits_per_sample == 16 else 'int32'
+			yield from self._decoded_blocks(block_frames, start, stop, dtype)
+
+	def _raw_blocks(self, block_frames, start, stop):
+		for block_start, block in self._blocks(block_frames, start, stop):
+			yield block_start, to_raw(block, self.info)
+
+	def raw_blocks(self, block_frames=None, start=0, stop=None):
+		""" Iterate over blocks of frame bytes, laid out as in a WAV file of the same format.
+		:param block_frames: Number of frames per block. Reader default if None.
+		:param start: First frame to read.
+		:param stop: Frame to stop reading at. End of file if None.
+		:return: A generator of (frame offset, array shaped (frames, block_align)) tuples.
+		:rtype: tuple[int, np.ndarray]
+		"""
+		return profiling.timed_iter('decode', self._raw_blocks(block_frames, start, stop))
+
+	def blocks(self, block_frames=None, start=0, stop=None):
+		""" Iterate over blocks of samples, in the dtype WavReader.blocks() uses for the same format.
+		:param block_frames: Number of frames per block. Reader default if None.
+		:param start: First frame to read.
+		:param stop: Frame to stop reading at. End of file if None.
+		:return: A generator of (frame offset, array shaped (frames, channels)) tuples.
+		:rtype: tuple[int, np.ndarray]
+		"""
+		return profiling.timed_iter('decode', self._blocks(block_frames, start, stop))
+
+	def float_blocks(self, block_frames=None, start=0, stop=None):
+		""" Iterate over blocks of samples, normalized to float32 in the range [-1, 1].
+		:param block_frames: Number of frames per block. Reader default if None.
+		:param start: First frame to read.
+		:param stop: Frame to stop reading at. End of file if None.
+		:return: A generator of (frame offset, array shaped (frames, channels)) tuples.
+		:rtype: tuple[int, np.ndarray]
+		"""
+		return profiling.timed_iter('decode', self._float_blocks(block_frames, start, stop))
+
+	def _float_blocks(self, block_frames, start, stop):
+		for block_start, block in self._blocks(block_frames, start, stop):
+			yield block_start, normalize(block, self.info)
@@ -5,95 +5,125 @@
 # -----------------------------------------------------------------------------
 """ CLI utility for slicing audio files for SampleBrain."""
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from dataclasses import dataclass
+from functools import partial
+from operator import attrgetter
 from itertools import takewhile
 from enum import Enum
 import logging
 import os
 from pathlib import Path
 import sys
+import time
 
-from scipy.io import wavfile
 import numpy as np
 import matplotlib.pyplot as plt
 
+if not __package__:
+	# Run as a script: import this package, and the modules beside it, from the repository root
+	sys.path[0] = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+	__package__ = 'src'  # pylint: disable=redefined-builtin
+
+from . import profiling
+from .analysis import AnalysisParams, analyze
+from .audio import is_audio_complete, open_audio, read_audio_info, read_extensions
+from .batch import resolve_jobs, run_batch
+from .budget import MemoryBudget, parse_size, plan_blocks
+from .cache import AnalysisCache
+from .dedup import FingerprintIndex, FingerprintParams, fingerprints_footprint, slice_fingerprints
+from .envelope import file_envelope
+from .features import FeatureParams, features_filename, features_footprint, frame_features
+from .key import KeyParams, detect_key, key_footprint
+from .manifest import SliceManifest, manifest_filename
+from .pipeline import DEFAULT_QUEUE_DEPTH, Pipeline
+from .pitch import PitchParams, pitch_footprint, slice_pitches
+from .profiling import ProfileReport
+from .render import channel_names, render_file
+from .resample import TargetFormat, conversion_footprint
+from .scanner import DEFAULT_SCAN_WORKERS, extension_set, file_key, has_extension, scan_tree
+from .slicer import source_stem, write_slices
+from .watch import watch_changes
+from .wavreader import DEFAULT_BLOCK_FRAMES, WavInfo, prefetch
+from .writers import DEFAULT_WRITE_THREADS, WRITE_FORMATS, SliceWriter
+
 # import webrtcvad
 
 # Default supported extensions
-SUPPORTED_READ_EXTENSIONS = {'wav'}  # , 'flac'}
-# SUPPORTED_WRITE_EXTENSIONS = {'wav', 'aiff', 'aifc'}
+SUPPORTED_READ_EXTENSIONS = read_extensions()  # 'flac' needs soundfile
+SUPPORTED_WRITE_EXTENSIONS = set(WRITE_FORMATS)
 
 __version__ = 0.0
 
+# Number of envelope bins plotted per file
+PLOT_WIDTH = 2048
+
+# Parameters of the frame-energy analysis
+ANALYSIS_PARAMS = AnalysisParams()
+
+# Parameters of the spectral features of slices
+FEATURE_PARAMS = FeatureParams()
+
+# Parameters of the pitch estimation of slices
+PITCH_PARAMS = PitchParams()
+
+# Parameters of the key detection of files
+KEY_PARAMS = KeyParams()
 
-def file_iterator(path_list: list, top=os.getcwd(), file_ext_filters=None):
+# Parameters of the fingerprints slices are deduplicated by
+FINGERPRINT_PARAMS = FingerprintParams()
+
+# Default size bound of the analysis cache, in MiB
+DEFAULT_CACHE_SIZE = 1024
+
+# Most sample data of a file prefetched while it waits for analysis, in bytes
+PREFETCH_BYTES = 256 << 20
+
+
+def file_iterator(path_list: list, top=os.getcwd(), file_ext_filters=None, scan_workers=DEFAULT_SCAN_WORKERS):
 	""" Create a file iterator based on a list of search paths.
 	:param path_list: A list of paths (files, directories) for which to search for files.
 	:param top: The top level directory to begin searching.
 	:param file_ext_filters: A list of file extensions used to validate each file find. No filtering if None.
+	:param scan_workers: Number of threads listing directories in parallel.
 	:return: A generator returning files found withing the search paths
 	:rtype: Path
 	"""
-
-	def __is_file_ext_valid(filepath: Path, extensions: list[str]):
-		""" Verify if a file has an extension as specified by input.
-		:param filepath: The file path to verify.
-		:param extensions: A list of extension that validate a file path.
-		:return: True if file path has a valid extension, False if not
-		:rtype: bool
-		"""
-		matches_extension = True
-		for extension in extensions:
-			matches_extension = False
-			if filepath.name.lower().endswith(extension):
-				matches_extension = True
-				break
-
-		return matches_extension
-
 	positionals = [Path(p) for p in path_list]
-	file_extension_filters = file_ext_filters if file_ext_filters else []
+	file_extension_filters = extension_set(file_ext_filters) if file_ext_filters else frozenset()
+	seen = set()  # (device, inode) of files and directories found, to skip duplicates and symlink cycles
 
 	# Resolve each positional for file(s), until empty
 	for positional in takewhile(lambda p: p is not None, positionals):
+		location = Path(top, positional)
 
 		# Skip positional, if it doesn't actually exist
-		if not positional.exists:
+		if not location.exists():
+			print(f"Skipping \"{positional}\", it does not exist.", file=sys.stderr)
 			continue
 
 		# Yield, if a valid file. Otherwise, skip
-		if positional.is_file():
-			if __is_file_ext_valid(positional, file_extension_filters):
+		if location.is_file():
+			key = file_key(location)
+			if key not in seen and has_extension(positional.name, file_extension_filters):
+				seen.add(key)
 				yield positional
-			else:
-				continue
-
-		# Iterate over OS Walker for files, if a directory
-		elif positional.is_dir():
-			current_oswalker = \
-				os.walk(os.path.join(top, positional.name), topdown=True, onerror=None, followlinks=True)
-
-			# Yield, all files found in OSWalker
-			for osw_root, _, osw_files in current_oswalker:
-				for osw_file in osw_files:
-					osw_pathfile = Path(osw_root).relative_to(top).joinpath(osw_file)
 
-					# Yield, if a valid file. Otherwise, skip
-					if __is_file_ext_valid(osw_pathfile, file_extension_filters):
-						yield osw_pathfile
-					else:
-						continue
+		# Yield, all files found in directory tree
+		elif location.is_dir():
+			yield from scan_tree(location, positional, file_extension_filters, seen, workers=scan_workers)
 
 		else:
-			print("Entered unknown \"file\" state.", file=sys.stderr)
-			return
-
-	return
+			print(f"Skipping \"{positional}\", entered unknown \"file\" state.", file=sys.stderr)
 
 
 class RC(Enum):
 	"""Possible return codes of CLI application."""
 	PASS = 0
 	SYNTAX_ERR = 1
+	PATH_ERR = 2
+	FILE_ERR = 3
 
 
 def parse_args(*args, **kwargs):
@@ -124,7 +154,53 @@ def parse_args(*args, **kwargs):
 	mutux.required = True  # Require a mutux option
 	mutux.add_argument("--analyze", default=False, action='store_true', help="Analyze each file.")
 	mutux.add_argument("--plot-audio", default=False, action='store_true', help="Plot each file.")
+	mutux.add_argument("--plot-dir", type=str, default=None,
+					   help="Path to render a waveform thumbnail of each file to, as PNG, without a display. "
+							"Thumbnails newer than their file are kept.")
 	mutux.add_argument("--write-dir", type=str, default=None, help="Path to write audio file slices.")
+	parser.add_argument("--write-format", choices=sorted(SUPPORTED_WRITE_EXTENSIONS), default='wav',
+						help="Format of the written slices.")
+	parser.add_argument("--target-rate", type=int, default=None,
+						help="Sample rate to resample the written slices to. The rate of each source if omitted.")
+	parser.add_argument("--target-channels", type=int, default=None,
+						help="Number of channels to mix the written slices to. Those of each source if omitted.")
+	parser.add_argument("--manifest", default=False, action='store_true',
+						help="With --write-dir, index the slices, their features and tags in one manifest.npz in it, "
+							 "as virtual slices of the source files, instead of writing a file per slice.")
+	parser.add_argument("--write-threads", type=int, default=DEFAULT_WRITE_THREADS,
+						help="Number of threads writing slice files.")
+	parser.add_argument("--features-dir", type=str, default=None,
+						help="Path to store the spectral features of each file's slices in, one .npz file per file.")
+	parser.add_argument("--pitch", default=False, action='store_true',
+						help="Estimate the pitch of each slice, and add its note name to the analysis output and to "
+							 "the slice file names.")
+	parser.add_argument("--key", default=False, action='store_true',
+						help="Estimate the musical key of each file, and add it to the analysis output.")
+	parser.add_argument("--dedup", choices=('report', 'skip'), default=None,
+						help="Find slices that nearly duplicate earlier slices of any file, and report them, or skip "
+							 "writing them.")
+	parser.add_argument("--pyramid-dir", type=str, default=None,
+						help="Path to store envelope pyramids, so files plot instantly the next time.")
+	parser.add_argument("--cache-dir", type=str, default=None,
+						help="Path to cache analysis results, so unchanged files aren't analyzed again.")
+	parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE,
+						help="Size bound of the analysis cache in MiB. Least recently used results are evicted.")
+	parser.add_argument("--watch", default=False, action='store_true',
+						help="Keep running, and process files created or modified under the positionals.")
+	parser.add_argument("--watch-interval", type=float, default=2.0,
+						help="Seconds between polls for changes. Files must stay unchanged this long to be processed.")
+	parser.add_argument("--profile", type=str, default=None,
+						help="Path to write a per-file, per-stage profile to, as CSV if it ends with .csv, else JSON.")
+	parser.add_argument("-j", "--jobs", type=int, default=1,
+						help="Number of files analyzed in parallel, in worker processes if more than 1. "
+							 "0 uses one per CPU.")
+	parser.add_argument("--readers", type=int, default=2, help="Number of threads reading files ahead of analysis.")
+	parser.add_argument("--writers", type=int, default=2, help="Number of threads caching and writing slices.")
+	parser.add_argument("--queue-depth", type=int, default=DEFAULT_QUEUE_DEPTH,
+						help="Number of files each pipeline stage may queue for the next before it waits.")
+	parser.add_argument("--max-memory", type=parse_size, default=None,
+						help="Bound on the estimated memory of the files in flight, e.g. 2G. Files wait to be admitted "
+							 "while it is used up; files larger than it stream alone. Unbounded if omitted.")
 	parser.add_argument("-v", "--verbose", action="count", default=0, help="Amount of output during runtime.")
 	parser.add_argument("--version", action='version', version=f"cli {__version__}")
 
@@ -139,33 +215,308 @@ def parse_args(*args, **kwargs):
 	return parsed_params
 
 
-def plot_audio(audio_filename):
-	"""Plot audio file with Matplotlib"""
-	sample_rate, data = wavfile.read(audio_filename)
-	duration = len(data) / sample_rate
-	data_type = data.dtype
-	amplitude_max = np.iinfo(data_type).max
+def plot_audio(audio_filename, pyramid_dir=None, width=PLOT_WIDTH):
+	""" Plot the min/max envelope of audio file with Matplotlib.
+	:param audio_filename: The audio file to plot.
+	:param pyramid_dir: Directory to load or store the envelope pyramid of the file. Not stored if None.
+	:param width: Number of envelope bins to plot, about the plot width in pixels.
+	"""
+	with open_audio(audio_filename) as reader:
+		info = reader.info
+		logging.info(f"Plotting audio_filename:'{audio_filename}'")
+		logging.info(f"\tsample_rate:'{info.sample_rate}', duration:{info.duration}s, "
+					 f"bits_per_sample:{info.bits_per_sample}")
+
+		with profiling.stage('envelope'):
+			samples_per_bin, first, mins, maxs = file_envelope(reader, width, pyramid_dir)
+
+	timeline = (first + np.arange(len(mins)) * samples_per_bin) / info.sample_rate
+	logging.info(f"\tlen(timeline):{len(timeline)}, samples_per_bin:{samples_per_bin}")
+
+	with profiling.stage('render'):
+		for channel, name in enumerate(channel_names(info.channels)):
+			plt.fill_between(timeline, mins[:, channel], maxs[:, channel], step='post', linewidth=0.5, label=name)
+		plt.xlabel('Time (s)')
+		plt.ylabel(f"Amplitude ({info.bits_per_sample}-bit)")
+		plt.ylim([-1, 1])
+		plt.title(f"{Path(audio_filename).name}")
+
+		if info.channels == 2:
+			plt.legend()
+
+		plt.grid()
+	plt.show()
 
-	logging.info(f"Plotting audio_filename:'{audio_filename}'")
-	logging.info(f"\tsample_rate:'{sample_rate}', duration:{duration}s, data_type:{data_type}")
 
-	timeline = np.arange(0, duration, 1 / sample_rate)
-	logging.info(f"\tlen(timeline):{len(timeline)}, timeline:{timeline}, ...")
+def _open_cache(cache_dir, cache_size):
+	""" Open the analysis cache of a directory, or None if caching is disabled. """
+	return AnalysisCache.open(cache_dir, cache_size * (1 << 20)) if cache_dir else None
+
+
+@dataclass
+class FileJob:
+	"""A file passed between the stages of the pipeline, with what is known about it so far."""
+	path: object
+	info: WavInfo = None
+	result: object = None
+	cached: bool = False
+	block_frames: int = DEFAULT_BLOCK_FRAMES
+	footprint: int = 0
+	want_features: bool = False
+	features: object = None
+	want_pitch: bool = False
+	pitches: object = None
+	want_key: bool = False
+	key: object = None
+	want_fingerprints: bool = False
+	fingerprints: object = None
+	duplicates: dict = None
+
+	def summary(self):
+		""" Summarize the analysis of the file, the pitches of its slices and its key if they were estimated, and
+		the number of its slices that duplicate earlier slices if they were deduplicated.
+		:rtype: dict
+		"""
+		summary = self.result.summary()
+		if self.pitches is not None:
+			summary.update(self.pitches.summary())
+		if self.key is not None:
+			summary.update(self.key.summary())
+		if self.duplicates is not None:
+			summary['duplicates'] = len(self.duplicates)
+		return summary
+
+
+def read_file(audio_filename, cache=None, prefetch_data=True, max_memory=None, features=False, pitch=False,
+			  key=False, fingerprints=False, target=None):
+	""" Read stage: parse the header of a file, plan how it is decoded, estimate its footprint through analysis
+	and writing, and look up its analysis in the cache. The sample data is prefetched into the page cache while the
+	file waits for analysis, unless neither analysis nor slicing needs it.
+	:param audio_filename: The audio file.
+	:param cache: The AnalysisCache to check, or None.
+	:param prefetch_data: Prefetch the sample data even if the analysis is cached, e.g. to slice the file.
+	:param max_memory: The memory budget in bytes, which bounds the blocks the file is decoded in. None if unbounded.
+	:param features: Extract the spectral features of the slices of the file.
+	:param pitch: Estimate the pitch of the slices of the file.
+	:param key: Estimate the key of the file.
+	:param fingerprints: Fingerprint the slices of the file, to deduplicate them.
+	:param target: The TargetFormat the slices are converted to when written, or None.
+	:rtype: FileJob
+	"""
+	with profiling.stage('read'):
+		info = read_audio_info(audio_filename)
+	job = FileJob(audio_filename, info, _cached_analysis(audio_filename, cache))
+	job.block_frames, job.footprint = plan_blocks(info, ANALYSIS_PARAMS.hop(info.sample_rate), max_memory)
+	job.cached = job.result is not None
+	job.want_features = features
+	job.want_pitch = pitch
+	job.want_key = key
+	job.want_fingerprints = fingerprints
+	hops = -(-info.frames // ANALYSIS_PARAMS.hop(info.sample_rate))
+	# The slices of a file are at least min_slice_ms long, so that bounds their number until they are known
+	min_slice = ANALYSIS_PARAMS.min_slice_frames(info.sample_rate)
+	slices = len(job.result.slices) if job.cached else -(-info.frames // min_slice)
+	if features:
+		job.footprint += features_footprint(info, FEATURE_PARAMS)
+	if pitch or fingerprints:
+		job.footprint += pitch_footprint(info.sample_rate, slices, PITCH_PARAMS)
+	if key:
+		job.footprint += key_footprint(KEY_PARAMS)
+	if fingerprints:
+		job.footprint += fingerprints_footprint(hops, slices, FINGERPRINT_PARAMS)
+	job.footprint += conversion_footprint(info, target)
+	if prefetch_data or features or pitch or key or fingerprints or not job.cached:
+		with profiling.stage('read'):
+			prefetch(audio_filename, info.data_offset, min(info.data_bytes, PREFETCH_BYTES))
+	return job
+
+
+def _cached_analysis(audio_filename, cache):
+	""" Look up the analysis of a file in the cache, if there is one. """
+	if not cache:
+		return None
+	with profiling.stage('cache'):
+		return cache.get(audio_filename, ANALYSIS_PARAMS)
+
+
+def analyze_file(job):
+	""" Analysis stage: analyze the frame energy, silences and onsets of a file, unless its analysis was cached, and
+	extract the spectral features, estimate the pitches and compute the fingerprints of its slices and estimate its
+	key if wanted. Picklable, to run in worker processes.
+	:param job: The FileJob from the read stage.
+	:rtype: FileJob
+	"""
+	if job.result is None or job.want_features or job.want_pitch or job.want_key or job.want_fingerprints:
+		with open_audio(job.path, job.block_frames) as reader:
+			if job.result is None:
+				logging.info(f"Analyzing audio_filename:'{job.path}'")
+				with profiling.stage('analyze'):
+					job.result = analyze(reader, ANALYSIS_PARAMS)
+			if job.want_features:
+				with profiling.stage('features'):
+					job.features = frame_features(reader, FEATURE_PARAMS).slice_features(job.result.slices)
+			if job.want_pitch:
+				with profiling.stage('pitch'):
+					job.pitches = slice_pitches(reader, job.result.slices, PITCH_PARAMS)
+			if job.want_key:
+				with profiling.stage('key'):
+					job.key = detect_key(reader, KEY_PARAMS)
+			if job.want_fingerprints:
+				with profiling.stage('fingerprint'):
+					job.fingerprints = slice_fingerprints(reader, job.result, FINGERPRINT_PARAMS, job.pitches)
+	return job
+
+
+def write_file(job, write_dir=None, cache=None, write_format='wav', writer=None, features_dir=None, target=None,
+			   manifest=None, dedup=None, skip_duplicates=False):
+	""" Write stage: store a new analysis in the cache, look up the duplicates of its slices, and slice the file if
+	there is a write directory, or index its slices in a manifest.
+	:param job: The FileJob from the analysis stage.
+	:param write_dir: Directory to write the slices to. Nothing is sliced if None.
+	:param cache: The AnalysisCache to store the analysis in, or None.
+	:param write_format: The format of the slices: 'wav', 'aiff' or 'aifc'.
+	:param writer: The SliceWriter to write slices on. Written in the calling thread if None.
+	:param features_dir: Directory to store the spectral features of the slices in, if they were extracted.
+	:param target: The TargetFormat to convert the slices to. The source format if None.
+	:param manifest: The SliceManifest to index the slices in instead of writing them, or None.
+	:param dedup: The FingerprintIndex to look up and index the fingerprints of the slices in, or None.
+	:param skip_duplicates: Neither write nor index the slices that duplicate earlier slices.
+	:return: The paths of the written slices if slicing, else the job, with the analysis result.
+	:rtype: list[Path] | FileJob
+	"""
+	if cache and not job.cached:
+		with profiling.stage('cache'):
+			cache.put(job.path, ANALYSIS_PARAMS, job.result)
+	if features_dir and job.features is not None:
+		with profiling.stage('write'):
+			job.features.save(features_filename(features_dir, job.path))
+	keep = None
+	if dedup is not None:
+		with profiling.stage('dedup'):
+			job.duplicates = dedup.add(job.path, job.fingerprints)
+		for index, (original, original_index) in job.duplicates.items():
+			logging.warning(f"'{job.path}' slice {index} duplicates '{original}' slice {original_index}")
+		if skip_duplicates:
+			keep = np.setdiff1d(np.arange(len(job.result.slices)), list(job.duplicates))
+	if manifest is not None:
+		with profiling.stage('write'):
+			manifest.add(job.path, job.result.slices, job.features, job.pitches, job.key, keep)
+		return job
+	if write_dir is None:
+		return job
+	with open_audio(job.path, target=target) as reader:
+		logging.info(f"Slicing audio_filename:'{job.path}'")
+		boundaries = job.result.slices
+		if target is not None:
+			# The analysis is of the source audio; its boundaries are moved to the matching converted frames
+			boundaries = target.convert_frames(boundaries, job.info)
+		tags = job.pitches.names() if job.pitches is not None else None
+		if keep is not None:
+			boundaries = boundaries[keep]
+			tags = [tags[index] for index in keep] if tags is not None else None
+		return write_slices(reader, boundaries, write_dir, source_stem(job.path), write_format, writer, tags, keep,
+							len(job.result.slices))
+
+
+def analyze_audio(audio_filename, cache_dir=None, cache_size=DEFAULT_CACHE_SIZE):
+	""" Analyze the frame energy, silences and onsets of audio file.
+	:param audio_filename: The audio file to analyze.
+	:param cache_dir: Directory of the analysis cache, checked before the file is read. No caching if None.
+	:param cache_size: Size bound of the analysis cache, in MiB.
+	:return: The analysis result.
+	:rtype: AnalysisResult
+	"""
+	cache = _open_cache(cache_dir, cache_size)
+	return write_file(analyze_file(read_file(audio_filename, cache, prefetch_data=False)), None, cache).result
+
+
+def slice_audio(audio_filename, write_dir, cache_dir=None, cache_size=DEFAULT_CACHE_SIZE, write_format='wav',
+				target=None):
+	""" Slice audio file at its silences and onsets.
+	:param audio_filename: The audio file to slice.
+	:param write_dir: Directory to write the slices to.
+	:param cache_dir: Directory of the analysis cache. No caching if None.
+	:param cache_size: Size bound of the analysis cache, in MiB.
+	:param write_format: The format of the slices: 'wav', 'aiff' or 'aifc'.
+	:param target: The TargetFormat to convert the slices to. The source format if None.
+	:return: The paths of the written slices.
+	:rtype: list[Path]
+	"""
+	cache = _open_cache(cache_dir, cache_size)
+	return write_file(analyze_file(read_file(audio_filename, cache)), write_dir, cache, write_format, target=target)
+
+
+def file_pipeline(params, profile=False, writer=None, manifest=None, dedup=None):
+	""" Build the read → analyze → write pipeline of the --analyze and --write-dir modes.
+	:param params: The parsed parameters.
+	:param profile: Profile each file.
+	:param writer: The SliceWriter to write slices on.
+	:param manifest: The SliceManifest to index slices in instead of writing them, with --manifest.
+	:param dedup: The FingerprintIndex to deduplicate slices with, with --dedup.
+	:rtype: Pipeline
+	"""
+	cache = _open_cache(params.cache_dir, params.cache_size)
+	jobs = resolve_jobs(params.jobs)
+	# The features of the slices are stored with --features-dir, and in the manifest with --manifest
+	features = params.features_dir is not None or manifest is not None
+	return Pipeline(partial(read_file, cache=cache, prefetch_data=params.write_dir is not None,
+							max_memory=params.max_memory, features=features, pitch=params.pitch, key=params.key,
+							fingerprints=dedup is not None, target=target_format(params)),
+					analyze_file,
+					partial(write_file, write_dir=params.write_dir, cache=cache, write_format=params.write_format,
+							writer=writer, features_dir=params.features_dir, target=target_format(params),
+							manifest=manifest, dedup=dedup, skip_duplicates=params.dedup == 'skip'),
+					readers=params.readers, analyzers=jobs, writers=params.writers, queue_depth=params.queue_depth,
+					executor_factory=partial(ProcessPoolExecutor, max_workers=jobs) if jobs > 1 else None,
+					profile=profile, budget=MemoryBudget(params.max_memory) if params.max_memory else None,
+					footprint=attrgetter('footprint'))
+
+
+def target_format(params):
+	""" The TargetFormat of the --target-rate and --target-channels options, or None if neither is given.
+	:rtype: TargetFormat
+	"""
+	if params.target_rate is None and params.target_channels is None:
+		return None
+	return TargetFormat(params.target_rate, params.target_channels)
 
-	# Normalize amplitude to unit
-	plot_data = data / amplitude_max
 
-	plt.plot(timeline, plot_data)
-	plt.xlabel('Time (s)')
-	plt.ylabel(f"Amplitude ({data_type.name})")
-	plt.ylim([-1, 1])
-	plt.title(f"{audio_filename.name}")
+def timed_files(files, scan_times):
+	""" Record the time taken to find each file of an iterator, e.g. a file_iterator.
+	:param files: The file iterator.
+	:param scan_times: A dict to record the seconds taken per file in.
+	:return: A generator of the files.
+	:rtype: Path
+	"""
+	files = iter(files)
+	while True:
+		started = time.perf_counter()
+		file = next(files, None)
+		if file is None:
+			return
+		scan_times[file] = time.perf_counter() - started
+		yield file
 
-	if data.ndim == 2:
-		plt.legend(["Left channel", "Right channel"])
 
-	plt.grid()
-	plt.show()
+def report_results(results, analyze_summary=False, profile_report=None, scan_times=None):
+	""" Report each file result as it completes.
+	:param results: An iterable of FileResult.
+	:param analyze_summary: Print the analysis summary of each processed file.
+	:param profile_report: A ProfileReport to add the profile of each file to.
+	:param scan_times: Seconds taken to find each file, added to its profile as the 'scan' stage.
+	:return: The number of files that failed.
+	:rtype: int
+	"""
+	failures = 0
+	for result in results:
+		if profile_report is not None:
+			profile_report.add(result.profile, scan=scan_times.pop(result.path, 0.0))
+		if not result.ok:
+			failures += 1
+			print(f"{result.path}: {result.error}", file=sys.stderr)
+		elif analyze_summary:
+			print(f"{result.path}: {result.value.summary()}")
+	return failures
 
 
 def main(params):
@@ -186,20 +537,81 @@ def main(params):
 	logging.debug(f"params: {params}")
 	# logging.debug(f"webrtcvad: {dir(webrtcvad)}")
 
-	# Initialize filter iterator based on search paths and file extension filter.
-	fpi = file_iterator(params.positionals, file_ext_filters=SUPPORTED_READ_EXTENSIONS)
-
-	# 'analyze', 'plot_audio', 'write_dir'
-	if params.plot_audio:
-		for file in list(fpi):
-			plot_audio(file)
-	elif params.analyze:
-		pass
-	elif params.write_dir:
-		pass
-
-	return 0
-
+	if params.write_dir and not os.path.isdir(params.write_dir):
+		print(f"Write directory does not exist: '{params.write_dir}'", file=sys.stderr)
+		return RC.PATH_ERR.value
+	if params.plot_dir and not os.path.isdir(params.plot_dir):
+		print(f"Plot directory does not exist: '{params.plot_dir}'", file=sys.stderr)
+		return RC.PATH_ERR.value
+	if any(value is not None and value < 1 for value in (params.target_rate, params.target_channels)):
+		print(f"Target rate and channels must be positive: {params.target_rate}, {params.target_channels}",
+			  file=sys.stderr)
+		return RC.SYNTAX_ERR.value
+	if params.manifest and (params.write_dir is None or target_format(params) is not None):
+		print("--manifest requires --write-dir, and indexes the source format: no --target-rate or --target-channels",
+			  file=sys.stderr)
+		return RC.SYNTAX_ERR.value
+	if params.features_dir and not os.path.isdir(params.features_dir):
+		print(f"Features directory does not exist: '{params.features_dir}'", file=sys.stderr)
+		return RC.PATH_ERR.value
+
+	profile_report = ProfileReport() if params.profile else None
+	scan_times = {}
+
+	# Slices are indexed in the manifest of the write directory, adding to the one of an earlier run
+	manifest = None
+	if params.manifest:
+		filename = manifest_filename(params.write_dir)
+		manifest = SliceManifest.load(filename) if filename.exists() else SliceManifest(FEATURE_PARAMS)
+	# Duplicates are looked up among all files processed, also across batches while watching
+	dedup = FingerprintIndex(FINGERPRINT_PARAMS) if params.dedup else None
+
+	def list_files():
+		# Initialize filter iterator based on search paths and file extension filter.
+		return file_iterator(params.positionals, file_ext_filters=SUPPORTED_READ_EXTENSIONS)
+
+	def process(files):
+		if profile_report is not None:
+			files = timed_files(files, scan_times)
+		# 'analyze', 'plot_audio', 'plot_dir', 'write_dir'
+		if params.plot_audio:
+			yield from run_batch(plot_audio, list(files), args=(params.pyramid_dir,), profile=params.profile)
+			return
+		if params.plot_dir:
+			yield from run_batch(render_file, files, jobs=params.jobs, args=(params.plot_dir, params.pyramid_dir),
+								 profile=params.profile)
+			return
+		with SliceWriter(params.write_threads) if params.write_dir and manifest is None else nullcontext() as writer:
+			pipeline = file_pipeline(params, profile=profile_report is not None, writer=writer, manifest=manifest,
+									 dedup=dedup)
+			yield from pipeline.run(files)
+		if manifest is not None:
+			manifest.save(manifest_filename(params.write_dir))
+			logging.info(f"Indexed {len(manifest)} slices of {len(manifest.sources)} files in '{params.write_dir}'")
+		if profile_report is not None:
+			profile_report.add_queue_stats(pipeline.stats)
+
+	# Process the files found once, or each batch of new or changed files while watching
+	if params.watch:
+		file_batches = watch_changes(list_files, interval=params.watch_interval, settle=params.watch_interval,
+									 is_complete=is_audio_complete)
+	else:
+		file_batches = [list_files()]
+
+	failures = 0
+	try:
+		for files in file_batches:
+			failures += report_results(process(files), params.analyze, profile_report, scan_times)
+	except KeyboardInterrupt:
+		if not params.watch:
+			raise
+		logging.info("Stopped watching.")
+	finally:
+		if profile_report is not None:
+			profile_report.write(params.profile)
+			logging.info(f"Wrote profile of {len(profile_report.files)} files to '{params.profile}'")
+
+	return RC.FILE_ERR.value if failures else RC.PASS.value
 
 if __name__ == '__main__':
 	main_params = parse_args(sys.argv[1:])
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Key detection: a chroma vector per file, correlated against scale templates of every key.
+
+The chroma vector of a file is accumulated over one streamed STFT, transformed in batches of frames, whose
+magnitude spectra are folded into the twelve pitch classes by a single matrix product per batch. The
+templates are the scales of music_theory.formulas in all twelve keys, weighted toward their tonic triad so
+relative major and minor keys are told apart. They are built once per process, centered and normalized, so
+correlating any number of chroma vectors against all of them is one matrix product.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+import scipy.fft
+
+import music_theory
+from .features import frame_batches
+
+# Frames transformed per batch, bounding the spectrogram held at a time (~8 MiB at n_fft 8192)
+FRAMES_PER_BATCH = 64
+
+# Extra template weight of the tonic, and of the third and fifth of a scale if it has them
+_TONIC_WEIGHT = 1.0
+_TRIAD_WEIGHT = 0.5
+
+# Frames below this summed magnitude are silent, and left out of the chroma vector
+_SILENT_MAGNITUDE = 1e-3
+
+
+@dataclass(frozen=True)
+class KeyParams:
+	"""Parameters of the key detection."""
+	n_fft: int = 8192
+	overlap: int = 2
+	min_hz: float = 55.0
+	max_hz: float = 4000.0
+
+	def hop(self):
+		""" Number of samples between consecutive STFT frames.
+		:rtype: int
+		"""
+		return self.n_fft // self.overlap
+
+
+@dataclass
+class KeyEstimate:
+	"""The best-matching key of a file, and how well its chroma correlates with it."""
+	key: str
+	score: float
+	chroma: np.ndarray
+
+	def summary(self):
+		""" Summarize the estimate as plain values.
+		:rtype: dict
+		"""
+		return {'key': self.key, 'key_score': round(self.score, 3)}
+
+
+@lru_cache(maxsize=32)
+def chroma_filterbank(sample_rate, n_fft, min_hz, max_hz):
+	""" The matrix folding the rFFT bins between min_hz and max_hz into the pitch class nearest to each.
+	:return: A (n_fft // 2 + 1, 12) float32 array.
+	:rtype: np.ndarray
+	"""
+	bin_hz = np.arange(n_fft // 2 + 1) * sample_rate / n_fft
+	inside = (bin_hz >= min_hz) & (bin_hz <= min(max_hz, sample_rate / 2))
+	pitch_classes = np.rint(69 + 12 * np.log2(np.maximum(bin_hz, 1e-6) / 440)).astype(np.int64) % 12
+	filterbank = np.zeros((len(bin_hz), 12), dtype=np.float32)
+	filterbank[np.flatnonzero(inside), pitch_classes[inside]] = 1
+	return filterbank
+
+
+@lru_cache(maxsize=None)
+def key_templates():
+	""" The templates of every scale of music_theory.formulas in every key, built once per process.
+	:return: The label of each template, e.g. 'A minor', and the templates as a (count, 12) float32 array,
+		centered and unit-normalized so that a product with a centered chroma vector is a correlation.
+	:rtype: tuple[tuple[str], np.ndarray]
+	"""
+	sets = music_theory.pitch_class_sets()
+	# Scales holding every pitch class (chromatic) have no tonality to match
+	scales = np.flatnonzero((sets.kinds == 'scales') & (sets.templates.sum(axis=1) < 12))
+	templates = sets.templates[scales].copy()
+	roots = sets.roots[scales].astype(np.int64)
+	rows = np.arange(len(scales))
+	member = templates > 0
+	major_third, minor_third, fifth = ((roots + interval) % 12 for interval in (4, 3, 7))
+	# The major third if the scale has one, else its minor third
+	third = np.where(member[rows, major_third], major_third, minor_third)
+	templates[rows, roots] += _TONIC_WEIGHT
+	templates[rows, third] += _TRIAD_WEIGHT * member[rows, third]
+	templates[rows, fifth] += _TRIAD_WEIGHT * member[rows, fifth]
+	centered = templates - templates.mean(axis=1, keepdims=True)
+	labels = tuple(sets.label(index) for index in scales)
+	return labels, (centered / np.linalg.norm(centered, axis=1, keepdims=True)).astype(np.float32)
+
+
+def file_chroma(reader, params=KeyParams()):
+	""" Accumulate the chroma vector of a file over one streamed STFT. Each frame's chroma is normalized to unit
+	sum before it is added, so loud passages don't outweigh quiet ones.
+	:param reader: An open WavReader or FlacReader.
+	:param params: The key detection parameters.
+	:return: The chroma vector, summing to 1, or zeros for a silent file.
+	:rtype: np.ndarray
+	"""
+	info = reader.info
+	window = np.hanning(params.n_fft + 1)[:-1].astype(np.float32)
+	filterbank = chroma_filterbank(info.sample_rate, params.n_fft, params.min_hz, params.max_hz)
+	chroma = np.zeros(12, dtype=np.float64)
+	for _, batch in frame_batches(reader, params.n_fft, params.hop(), FRAMES_PER_BATCH):
+		magnitude = np.abs(scipy.fft.rfft(batch * window, axis=1)).astype(np.float32, copy=False)
+		frames = magnitude @ filterbank
+		totals = frames.sum(axis=1, keepdims=True)
+		chroma += (frames / np.maximum(totals, _SILENT_MAGNITUDE))[totals[:, 0] > _SILENT_MAGNITUDE].sum(axis=0)
+	total = chroma.sum()
+	return (chroma / total if total > 0 else chroma).astype(np.float32)
+
+
+def key_footprint(params=KeyParams()):
+	""" Estimate the bytes held while the key of a file is detected: one batch of spectra, whatever its length.
+	:rtype: int
+	"""
+	return FRAMES_PER_BATCH * params.n_fft * 16
+
+
+def match_keys(chromas):
+	""" Correlate chroma vectors against every key template in one matrix product.
+	:param chromas: Chroma vectors shaped (count, 12).
+	:return: The label of the best key of each vector, and its correlation.
+	:rtype: tuple[list[str], np.ndarray]
+	"""
+	labels, templates = key_templates()
+	chromas = np.asarray(chromas, dtype=np.float32).reshape(-1, 12)
+	centered = chromas - chromas.mean(axis=1, keepdims=True)
+	centered /= np.maximum(np.linalg.norm(centered, axis=1, keepdims=True), 1e-12)
+	correlations = centered @ templates.T
+	best = np.argmax(correlations, axis=1)
+	return [labels[index] for index in best], correlations[np.arange(len(best)), best]
+
+
+def detect_key(reader, params=KeyParams()):
+	""" Estimate the key of a file.
+	:param reader: An open WavReader or FlacReader.
+	:param params: The key detection parameters.
+	:rtype: KeyEstimate
+	"""
+	chroma = file_chroma(reader, params)
+	if not chroma.any():
+		return KeyEstimate('', 0.0, chroma)
+	(key,), (score,) = match_keys(chroma)
+	return KeyEstimate(key, float(score), chroma)
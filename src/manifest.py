@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Columnar manifest of virtual slices.
+
+Instead of a file per slice, a manifest holds one row per slice in a NumPy structured array: the source file,
+the index of the slice in it, its start and stop frames, its pitch and tag, and its spectral features. The
+sources are kept in a table of their resolved paths, sizes and modification times, and the whole manifest is
+stored as one uncompressed .npz file, under two hundred bytes per slice. Slices are served as views of the
+memory-mapped source files, and are only written out as audio files when asked to.
+"""
+from collections import OrderedDict
+import os
+from pathlib import Path
+import threading
+
+import numpy as np
+
+from .audio import open_audio
+from .features import FeatureParams
+from .slicer import source_stem, write_slices
+
+# Name of the manifest in a write directory
+MANIFEST_FILENAME = 'manifest.npz'
+
+# Longest tag stored per slice; longer tags are truncated
+MAX_TAG_LENGTH = 16
+
+# Source files kept open by a manifest serving slices, least recently used closed first
+OPEN_SOURCES = 16
+
+
+def slice_dtype(feature_params=FeatureParams()):
+	""" The row layout of a manifest whose features were extracted with feature_params.
+	:rtype: np.dtype
+	"""
+	return np.dtype([('source', '<i4'), ('index', '<i4'), ('start', '<i8'), ('stop', '<i8'), ('pitch', '<f4'),
+					 ('tag', f'<U{MAX_TAG_LENGTH}'), ('centroid', '<f4'), ('flatness', '<f4'),
+					 ('bands', '<f4', (feature_params.n_bands,)), ('mfcc', '<f4', (feature_params.n_mfcc,))])
+
+
+def manifest_filename(write_dir):
+	""" Name the manifest of a write directory.
+	:rtype: Path
+	"""
+	return Path(write_dir, MANIFEST_FILENAME)
+
+
+def _stat(path):
+	stat = os.stat(path)
+	return stat.st_size, stat.st_mtime_ns
+
+
+class SliceManifest:
+	""" Index of the slices of many source files, one row per slice. Sources may be added from several threads;
+	use as a context manager to close the sources opened to serve slices.
+	"""
+	FILE_VERSION = 2
+
+	def __init__(self, feature_params=FeatureParams()):
+		"""
+		:param feature_params: The parameters the features of the slices are extracted with.
+		"""
+		self.dtype = slice_dtype(feature_params)
+		self._entries = {}
+		self._lock = threading.Lock()
+		self._table = None
+		self._readers = OrderedDict()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def __len__(self):
+		return len(self.slices)
+
+	def close(self):
+		"""Close the sources opened to serve slices. Views served before keep their mapping alive."""
+		for reader in self._readers.values():
+			reader.close()
+		self._readers.clear()
+
+	def add(self, audio_filename, boundaries, features=None, pitches=None, key=None, keep=None):
+		""" Index the slices of a source file, replacing those it had if it was indexed before.
+		:param audio_filename: The source file.
+		:param boundaries: The slice boundaries as (start frame, stop frame) rows.
+		:param features: The SliceFeatures of the slices, or None if they weren't extracted.
+		:param pitches: The SlicePitches of the slices, or None if they weren't estimated. Tags are their note names.
+		:param key: The KeyEstimate of the file, or None if it wasn't estimated.
+		:param keep: The indexes of the slices to index, e.g. leaving out duplicates. All slices if None.
+		"""
+		path = str(Path(audio_filename).resolve())
+		boundaries = np.asarray(boundaries, dtype=np.int64).reshape(-1, 2)
+		rows = np.zeros(len(boundaries), dtype=self.dtype)
+		rows['index'] = np.arange(len(boundaries))
+		rows['start'], rows['stop'] = boundaries[:, 0], boundaries[:, 1]
+		rows['pitch'] = np.nan if pitches is None else pitches.frequency
+		if pitches is not None:
+			rows['tag'] = pitches.names()
+		for name in ('centroid', 'flatness', 'bands', 'mfcc'):
+			rows[name] = np.nan if features is None else getattr(features, name)
+		if keep is not None:
+			rows = rows[keep]
+		with self._lock:
+			self._entries[path] = (*_stat(path), len(boundaries), key.key if key is not None else '', rows)
+			self._table = None
+
+	def _build_table(self):
+		with self._lock:
+			if self._table is None:
+				paths = sorted(self._entries)
+				entries = [self._entries[path] for path in paths]
+				stats = np.array([(size, mtime_ns, len(rows), count) for size, mtime_ns, count, _, rows in entries],
+								 dtype=np.int64).reshape(-1, 4)
+				slices = np.concatenate([rows for *_, rows in entries]) if entries else np.zeros(0, self.dtype)
+				slices['source'] = np.repeat(np.arange(len(paths), dtype=np.int32), stats[:, 2])
+				self._table = (tuple(paths), stats, tuple(entry[3] for entry in entries), slices)
+			return self._table
+
+	@property
+	def sources(self):
+		""" The resolved paths of the source files, indexed by the 'source' column of the slices.
+		:rtype: tuple[str]
+		"""
+		return self._build_table()[0]
+
+	@property
+	def keys(self):
+		""" The key of each source file, '' if it wasn't estimated.
+		:rtype: tuple[str]
+		"""
+		return self._build_table()[2]
+
+	@property
+	def slices(self):
+		""" All slices as a structured array, grouped by source and in order within each source. Select slices with
+		its columns, e.g. np.flatnonzero(manifest.slices['tag'] == 'A4').
+		:rtype: np.ndarray
+		"""
+		return self._build_table()[3]
+
+	def save(self, filename):
+		""" Store the manifest as a NumPy .npz file. """
+		paths, stats, keys, slices = self._build_table()
+		header = np.array([self.FILE_VERSION, len(paths), len(slices)])
+		tmp_filename = f"{filename}.tmp.npz"
+		np.savez(tmp_filename, header=header, source_paths=np.array(paths, dtype=str), source_stats=stats,
+				 source_keys=np.array(keys, dtype=str), slices=slices)
+		os.replace(tmp_filename, filename)
+
+	@classmethod
+	def load(cls, filename):
+		""" Load a manifest stored with save().
+		:rtype: SliceManifest
+		"""
+		with np.load(filename) as stored:
+			version = int(stored['header'][0])
+			if version != cls.FILE_VERSION:
+				raise ValueError(f"Unsupported manifest version {version}: '{filename}'")
+			paths, stats, keys, slices = (stored[name] for name in
+										  ('source_paths', 'source_stats', 'source_keys', 'slices'))
+		manifest = cls()
+		manifest.dtype = slices.dtype
+		per_source = np.split(slices, np.cumsum(stats[:, 2])[:-1])
+		for path, (size, mtime_ns, _, count), key, rows in zip(paths, stats, keys, per_source):
+			manifest._entries[str(path)] = (int(size), int(mtime_ns), int(count), str(key), rows)
+		return manifest
+
+	def open_source(self, source):
+		""" Open a source file to serve its slices, checking that it is unchanged since it was indexed.
+		:param source: The index of the source in sources.
+		:rtype: WavReader | FlacReader
+		"""
+		reader = self._readers.get(source)
+		if reader is not None:
+			self._readers.move_to_end(source)
+			return reader
+		path = self.sources[source]
+		size, mtime_ns = self._build_table()[1][source, :2]
+		if _stat(path) != (size, mtime_ns):
+			raise ValueError(f"Source changed since it was indexed: '{path}'")
+		reader = self._readers[source] = open_audio(path)
+		if len(self._readers) > OPEN_SOURCES:
+			self._readers.popitem(last=False)[1].close()
+		return reader
+
+	def raw(self, index):
+		""" The sample bytes of a slice as stored on disk, shaped (frames, block_align). A view of the memory-mapped
+		source for WAV files, decoded for FLAC files.
+		:param index: The row of the slice.
+		:rtype: np.ndarray
+		"""
+		row = self.slices[index]
+		reader = self.open_source(int(row['source']))
+		raw = getattr(reader, 'raw', None)
+		if raw is not None:
+			return raw[row['start']:row['stop']]
+		empty = np.zeros((0, reader.info.block_align), dtype=np.uint8)
+		return _concatenate(reader.raw_blocks(start=int(row['start']), stop=int(row['stop'])), empty)
+
+	def samples(self, index):
+		""" The samples of a slice in their stored dtype, shaped (frames, channels). A view of the memory-mapped
+		source where the format allows it, decoded for FLAC files and packed 24-bit WAV files.
+		:param index: The row of the slice.
+		:rtype: np.ndarray
+		"""
+		row = self.slices[index]
+		reader = self.open_source(int(row['source']))
+		samples = getattr(reader, 'samples', None)
+		if samples is not None:
+			return samples[row['start']:row['stop']]
+		empty = np.zeros((0, reader.info.channels), dtype=reader.info.dtype or np.int32)
+		return _concatenate(reader.blocks(start=int(row['start']), stop=int(row['stop'])), empty)
+
+	def materialize(self, write_dir, indexes=None, fmt='wav', writer=None, target=None):
+		""" Write slices out as audio files, named as if the source files had been sliced directly.
+		:param write_dir: Directory to write the slices to.
+		:param indexes: The rows of the slices to write. All slices if None.
+		:param fmt: The output format: 'wav', 'aiff' or 'aifc'.
+		:param writer: A SliceWriter to write memory-mapped slices on. Written in the calling thread if None.
+		:param target: The TargetFormat to convert the slices to. The source format if None.
+		:return: The paths of the written slices, in the order of the rows.
+		:rtype: list[Path]
+		"""
+		paths, stats, _, slices = self._build_table()
+		rows = np.arange(len(slices)) if indexes is None else np.unique(np.asarray(indexes, dtype=np.int64))
+		written = {}
+		for source in np.unique(slices['source'][rows]):
+			source_rows = rows[slices['source'][rows] == source]
+			selected = slices[source_rows]
+			info = self.open_source(int(source)).info
+			with open_audio(paths[source], target=target) as reader:
+				boundaries = np.column_stack((selected['start'], selected['stop']))
+				if target is not None:
+					boundaries = target.convert_frames(boundaries, info)
+				filenames = write_slices(reader, boundaries, write_dir, source_stem(paths[source]), fmt, writer,
+										 list(selected['tag']), selected['index'], int(stats[source, 3]))
+			written.update(zip(source_rows.tolist(), filenames))
+		order = rows if indexes is None else np.asarray(indexes, dtype=np.int64)
+		return [written[row] for row in order.tolist()]
+
+
+def _concatenate(blocks, empty):
+	""" Join the blocks of a reader into one array, or return empty if there are none. """
+	arrays = [block for _, block in blocks]
+	return np.concatenate(arrays) if arrays else empty
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Staged read → analyze → write pipeline over bounded queues.
+
+Reader threads, analysis workers and writer threads run concurrently, connected by bounded queues, so reading
+the next file overlaps analysis of the current one and writing of the previous one. A full queue blocks its
+producers (backpressure) and an empty one starves its consumers; both are measured per queue, to show which
+stage limits throughput.
+
+Analysis workers are threads, which either run the analysis themselves or hand it to a process pool.
+With a MemoryBudget, reader threads also admit each file: a file is passed on only once its estimated footprint
+fits the budget, and its reservation is released when it leaves the write stage.
+"""
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+import logging
+import queue
+import threading
+import time
+import traceback
+
+from .batch import FileResult
+from .profiling import profile_file
+
+# Default number of items each queue holds before it blocks its producers
+DEFAULT_QUEUE_DEPTH = 4
+
+# Seconds between checks for cancellation while blocked on a queue
+_POLL_S = 0.1
+
+_DONE = object()
+
+
+@dataclass
+class QueueStats:
+	"""Backpressure statistics of one queue."""
+	items: int = 0
+	max_depth: int = 0
+	blocked_puts: int = 0
+	put_wait_s: float = 0.0
+	get_wait_s: float = 0.0
+
+	def to_dict(self):
+		""" The statistics as plain values.
+		:rtype: dict
+		"""
+		return {'items': self.items, 'max_depth': self.max_depth, 'blocked_puts': self.blocked_puts,
+				'put_wait_s': round(self.put_wait_s, 6), 'get_wait_s': round(self.get_wait_s, 6)}
+
+
+class _Cancelled(Exception):
+	"""Raised in pipeline threads once the pipeline is cancelled."""
+
+
+class _StatQueue:
+	""" A bounded queue measuring how long producers block and consumers starve. """
+
+	def __init__(self, maxsize, cancelled):
+		self._queue = queue.Queue(maxsize)
+		self._cancelled = cancelled
+		self._lock = threading.Lock()
+		self.stats = QueueStats()
+
+	def put(self, item):
+		""" Put an item, blocking while the queue is full. """
+		try:
+			self._queue.put_nowait(item)
+		except queue.Full as full:
+			started = time.perf_counter()
+			while True:
+				if self._cancelled.is_set():
+					raise _Cancelled() from full
+				try:
+					self._queue.put(item, timeout=_POLL_S)
+					break
+				except queue.Full:
+					continue
+			with self._lock:
+				self.stats.blocked_puts += 1
+				self.stats.put_wait_s += time.perf_counter() - started
+		with self._lock:
+			self.stats.items += item is not _DONE
+			self.stats.max_depth = max(self.stats.max_depth, self._queue.qsize())
+
+	def get(self):
+		""" Get an item, blocking while the queue is empty. """
+		started = time.perf_counter()
+		while True:
+			if self._cancelled.is_set():
+				raise _Cancelled()
+			try:
+				item = self._queue.get(timeout=_POLL_S)
+				break
+			except queue.Empty:
+				continue
+		with self._lock:
+			self.stats.get_wait_s += time.perf_counter() - started
+		return item
+
+
+@dataclass
+class _Item:
+	"""A file on its way through the pipeline."""
+	path: object
+	value: object = None
+	error: str = None
+	profile: object = None
+	reserved: int = 0
+
+
+def _run_stage(func, item, profile):
+	""" Run one stage function on an item's value, profiled. May run in a worker process.
+	:return: The new value, the error if any, and the stage's profile.
+	:rtype: tuple
+	"""
+	with profile_file(item.path, enabled=profile) as record:
+		try:
+			return func(item.value), None, record
+		except Exception as ex:  # pylint: disable=broad-except
+			logging.debug(traceback.format_exc())
+			return None, f"{type(ex).__name__}: {ex}", record
+
+
+class Pipeline:
+	""" Runs files through read, analyze and write stage functions. Each function takes the value returned by the
+	previous one; read takes the path. Results come back in completion order, with per-file errors isolated.
+	"""
+
+	def __init__(self, read, analyze, write, readers=2, analyzers=1, writers=2, queue_depth=DEFAULT_QUEUE_DEPTH,
+				 executor_factory=None, profile=False, budget=None, footprint=None):
+		"""
+		:param read: Read stage function, run in reader threads.
+		:param analyze: Analysis stage function. Must be picklable if run in a process pool.
+		:param write: Write stage function, run in writer threads.
+		:param readers: Number of reader threads.
+		:param analyzers: Number of analysis workers.
+		:param writers: Number of writer threads.
+		:param queue_depth: Capacity of each queue between stages.
+		:param executor_factory: Creates the executor (e.g. a ProcessPoolExecutor) analysis runs in. Analysis runs
+			in the analysis worker threads if None.
+		:param profile: Profile each file, into FileResult.profile.
+		:param budget: A MemoryBudget to admit files by, after they are read. No admission control if None.
+		:param footprint: Estimates the bytes a file holds until it is written, from the value read returns.
+		"""
+		self.stages = [('read', read, readers), ('analyze', analyze, analyzers), ('write', write, writers)]
+		self.queue_depth = queue_depth
+		self.executor_factory = executor_factory
+		self.profile = profile
+		self.budget = budget
+		self.footprint = footprint
+		self.queue_names = ['input', 'read→analyze', 'analyze→write', 'results']
+		self.queues = []
+		self._executor = None
+		self._executor_lock = threading.Condition()
+		# Items running in the executor, items waiting to be retried alone, and whether one is being retried
+		self._running = 0
+		self._suspects = 0
+		self._isolated = False
+
+	@property
+	def stats(self):
+		""" Backpressure statistics of each queue, of the last run.
+		:rtype: dict[str, QueueStats]
+		"""
+		return {name: q.stats for name, q in zip(self.queue_names, self.queues)}
+
+	def _submit(self, func, item):
+		""" Run a stage function in the current executor, restarting the pool if a worker process died.
+		:return: The stage result, and the error if the pool broke.
+		"""
+		with self._executor_lock:
+			executor = self._executor
+		try:
+			return executor.submit(_run_stage, func, item, self.profile).result(), None
+		except BrokenProcessPool as ex:
+			with self._executor_lock:
+				if self._executor is executor:
+					logging.warning("Worker process died, restarting process pool.")
+					executor.shutdown(wait=False, cancel_futures=True)
+					self._executor = self.executor_factory()
+			return None, f"{type(ex).__name__}: {ex}"
+
+	def _call_in_executor(self, func, item):
+		""" Run a stage function in the executor. When a worker process dies, the pool is restarted and the items
+		that were in flight become suspects: each is retried alone, with no other item in the pool, and new items
+		wait until all suspects are retried. Only an item that kills a worker by itself is reported failed.
+		"""
+		with self._executor_lock:
+			self._executor_lock.wait_for(lambda: not self._suspects and not self._isolated)
+			self._running += 1
+		try:
+			result, error = self._submit(func, item)
+		finally:
+			with self._executor_lock:
+				self._running -= 1
+				self._executor_lock.notify_all()
+		if error is None:
+			return result
+
+		with self._executor_lock:
+			self._suspects += 1
+			self._executor_lock.wait_for(lambda: not self._isolated and not self._running)
+			self._suspects -= 1
+			self._isolated = True
+		try:
+			result, error = self._submit(func, item)
+		finally:
+			with self._executor_lock:
+				self._isolated = False
+				self._executor_lock.notify_all()
+		return result if error is None else (None, error, None)
+
+	def _admit(self, item, cancelled):
+		""" Reserve the footprint of a read item, waiting until it fits the budget. """
+		try:
+			nbytes = self.footprint(item.value)
+		except Exception as ex:  # pylint: disable=broad-except
+			item.error = f"{type(ex).__name__}: {ex}"
+			return
+		item.reserved = self.budget.acquire(nbytes, cancelled)
+		if item.reserved is None:
+			raise _Cancelled()
+
+	def _worker(self, stage_index, func, cancelled):
+		""" Move items to the next queue through a stage function. Failed items skip later stages. """
+		in_queue, out_queue = self.queues[stage_index], self.queues[stage_index + 1]
+		in_executor = stage_index == 1 and self._executor is not None
+		admit = stage_index == 0 and self.budget is not None
+		release = stage_index == len(self.stages) - 1 and self.budget is not None
+		while True:
+			item = in_queue.get()
+			if item is _DONE:
+				return
+			if item.error is None:
+				if in_executor:
+					value, error, record = self._call_in_executor(func, item)
+				else:
+					value, error, record = _run_stage(func, item, self.profile)
+				item.value, item.error = value, error
+				if record is not None:
+					item.profile = record if item.profile is None else item.profile.merge(record)
+				if admit and item.error is None:
+					self._admit(item, cancelled)
+			if release and item.reserved:
+				self.budget.release(item.reserved)
+				item.reserved = 0
+			out_queue.put(item)
+
+	def _stage_threads(self, stage_index, func, count, cancelled):
+		""" Start the threads of a stage. The last one to finish passes end-of-input on to the next stage. """
+		out_queue = self.queues[stage_index + 1]
+		next_count = self.stages[stage_index + 1][2] if stage_index + 1 < len(self.stages) else 1
+		remaining = [count]
+		lock = threading.Lock()
+
+		def run():
+			try:
+				self._worker(stage_index, func, cancelled)
+				with lock:
+					remaining[0] -= 1
+					last = remaining[0] == 0
+				if last:
+					for _ in range(next_count):
+						out_queue.put(_DONE)
+			except _Cancelled:
+				pass
+
+		threads = [threading.Thread(target=run, name=f"gcrslicer-{self.stages[stage_index][0]}-{index}",
+									daemon=True) for index in range(count)]
+		for thread in threads:
+			thread.start()
+		return threads
+
+	def run(self, paths):
+		""" Run files through the pipeline.
+		:param paths: An iterable of files, e.g. a file_iterator. Consumed lazily by a feeder thread.
+		:return: A generator of FileResult, in completion order.
+		:rtype: FileResult
+		"""
+		cancelled = threading.Event()
+		self.queues = [_StatQueue(self.queue_depth, cancelled) for _ in self.queue_names]
+		self._executor = self.executor_factory() if self.executor_factory else None
+
+		def feed():
+			try:
+				for path in paths:
+					self.queues[0].put(_Item(path, value=path))
+			except _Cancelled:
+				return
+			except Exception as ex:  # pylint: disable=broad-except
+				logging.error(f"Listing files failed: {type(ex).__name__}: {ex}")
+			try:
+				for _ in range(self.stages[0][2]):
+					self.queues[0].put(_DONE)
+			except _Cancelled:
+				pass
+
+		threads = [threading.Thread(target=feed, name='gcrslicer-feed', daemon=True)]
+		threads[0].start()
+		for stage_index, (_, func, count) in enumerate(self.stages):
+			threads += self._stage_threads(stage_index, func, count, cancelled)
+
+		try:
+			while True:
+				item = self.queues[-1].get()
+				if item is _DONE:
+					break
+				yield FileResult(item.path, value=item.value, error=item.error, profile=item.profile)
+		finally:
+			cancelled.set()
+			for thread in threads:
+				thread.join()
+			if self._executor is not None:
+				self._executor.shutdown(wait=True, cancel_futures=True)
+			logging.info("Pipeline queues: %s", ", ".join(
+				f"{name} {stats.to_dict()}" for name, stats in self.stats.items()))
+			if self.budget is not None:
+				logging.info(f"Memory budget: {self.budget.to_dict()}")
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Batched YIN pitch estimation of slices, named after the notes of music_theory.
+
+One window is taken from the middle of each slice, and the windows of up to PITCH_BATCH slices are stacked
+into a matrix. The YIN difference function of every window of the batch is computed at once from an FFT
+autocorrelation, and the period of each window is picked from its cumulative mean normalized difference
+with array operations only, so the cost per slice is a share of a few batched transforms.
+"""
+from dataclasses import dataclass
+
+import numpy as np
+import scipy.fft
+
+import music_theory
+
+# Slices whose windows are estimated together, bounding the batch to ~PITCH_BATCH * 4 window lengths of floats
+PITCH_BATCH = 256
+
+# The name of each pitch class: the shortest spelling in music_theory.notes, sharps before flats
+NOTE_NAMES = tuple(min(names, key=len) for names in music_theory.notes)
+
+# Windows below this RMS level are silent, and have no pitch
+_SILENCE_RMS = 1e-4
+
+
+@dataclass(frozen=True)
+class PitchParams:
+	"""Parameters of the pitch estimation."""
+	min_hz: float = 40.0
+	max_hz: float = 2000.0
+	threshold: float = 0.15
+	max_aperiodicity: float = 0.35
+
+	def max_period(self, sample_rate):
+		""" The longest period searched, in samples.
+		:rtype: int
+		"""
+		return int(np.ceil(sample_rate / self.min_hz))
+
+	def min_period(self, sample_rate):
+		""" The shortest period searched, in samples.
+		:rtype: int
+		"""
+		return max(2, int(sample_rate / self.max_hz))
+
+	def window(self, sample_rate):
+		""" The number of samples of a slice that are analyzed: two of the longest periods.
+		:rtype: int
+		"""
+		return 2 * self.max_period(sample_rate)
+
+
+def note_names(frequencies):
+	""" Name the nearest equal-tempered notes of frequencies, e.g. 'A4' for 440 Hz. Unpitched (NaN) gives ''.
+	:param frequencies: Frequencies in Hz.
+	:rtype: list[str]
+	"""
+	frequencies = np.asarray(frequencies, dtype=np.float64)
+	pitched = np.isfinite(frequencies) & (frequencies > 0)
+	midi = np.zeros(len(frequencies), dtype=np.int64)
+	midi[pitched] = np.rint(69 + 12 * np.log2(frequencies[pitched] / 440))
+	return [f"{NOTE_NAMES[note % 12]}{note // 12 - 1}" if voiced else '' for note, voiced in zip(midi, pitched)]
+
+
+@dataclass
+class SlicePitches:
+	"""The estimated fundamental of each slice, NaN where a slice has no clear pitch."""
+	frequency: np.ndarray
+	aperiodicity: np.ndarray
+
+	def names(self):
+		""" The note name of each slice, '' where it has no pitch.
+		:rtype: list[str]
+		"""
+		return note_names(self.frequency)
+
+	def summary(self):
+		""" Summarize the pitches as plain values.
+		:rtype: dict
+		"""
+		return {'pitched': int(np.isfinite(self.frequency).sum()), 'pitches': [name or '-' for name in self.names()]}
+
+
+def yin(windows, sample_rate, params=PitchParams()):
+	""" Estimate the fundamental of each row of a window matrix with YIN.
+	:param windows: float32 windows shaped (count, params.window(sample_rate)).
+	:param sample_rate: The sample rate of the windows.
+	:param params: The pitch parameters.
+	:return: The frequency of each window in Hz (NaN if unpitched), and its aperiodicity.
+	:rtype: tuple[np.ndarray, np.ndarray]
+	"""
+	count = len(windows)
+	max_period, min_period = params.max_period(sample_rate), params.min_period(sample_rate)
+	span = windows.shape[1] - max_period
+	# Autocorrelation of the first span samples with every lag, for all windows in one transform
+	size = scipy.fft.next_fast_len(windows.shape[1] + span)
+	spectrum = scipy.fft.rfft(windows, size, axis=1)
+	head = scipy.fft.rfft(windows[:, :span], size, axis=1)
+	correlation = scipy.fft.irfft(np.conj(head) * spectrum, size, axis=1)[:, :max_period + 1]
+	energy = np.concatenate((np.zeros((count, 1), np.float32), np.cumsum(windows ** 2, axis=1)), axis=1)
+	lags = np.arange(max_period + 1)
+	shifted = energy[:, lags + span] - energy[:, lags]
+	difference = np.maximum(energy[:, span:span + 1] + shifted - 2 * correlation, 0)
+
+	# Cumulative mean normalized difference, 1 at lag 0
+	cumulative = np.cumsum(difference[:, 1:], axis=1)
+	normalized = np.ones_like(difference)
+	normalized[:, 1:] = difference[:, 1:] * lags[1:] / np.maximum(cumulative, 1e-12)
+	searched = normalized[:, min_period:max_period]
+
+	# The first dip below the threshold, followed down to its minimum; the deepest dip if there is none
+	below = searched < params.threshold
+	first = np.where(below.any(axis=1), np.argmax(below, axis=1), np.argmin(searched, axis=1))
+	rising = np.append(searched[:, 1:] >= searched[:, :-1], np.ones((count, 1), bool), axis=1)
+	rising &= np.arange(searched.shape[1]) >= first[:, None]
+	best = np.argmax(rising, axis=1)
+
+	# Parabolic interpolation of the period around the minimum
+	rows = np.arange(count)
+	left = searched[rows, np.maximum(best - 1, 0)]
+	center = searched[rows, best]
+	right = searched[rows, np.minimum(best + 1, searched.shape[1] - 1)]
+	curvature = left - 2 * center + right
+	offset = np.where(np.abs(curvature) > 1e-12, 0.5 * (left - right) / np.where(curvature == 0, 1, curvature), 0)
+	period = min_period + best + np.clip(offset, -1, 1)
+
+	rms = np.sqrt(energy[:, -1] / windows.shape[1])
+	pitched = (center < params.max_aperiodicity) & (rms > _SILENCE_RMS)
+	frequency = np.where(pitched, sample_rate / period, np.nan).astype(np.float32)
+	return frequency, center.astype(np.float32)
+
+
+def gather_windows(reader, starts, stops, width):
+	""" Read the mono downmix of the frames starts[i] to stops[i] into row i of a zero-padded window matrix, in
+	one pass over the frames they span. The ranges must be sorted and must not overlap.
+	"""
+	windows = np.zeros((len(starts), width), dtype=np.float32)
+	if starts.size == 0:
+		return windows
+	for offset, block in reader.float_blocks(start=int(starts[0]), stop=int(stops[-1])):
+		mono = block.mean(axis=1, dtype=np.float32)
+		block_stop = offset + len(block)
+		for i in range(np.searchsorted(stops, offset, 'right'), np.searchsorted(starts, block_stop, 'left')):
+			first, last = max(starts[i], offset), min(stops[i], block_stop)
+			windows[i, first - starts[i]:last - starts[i]] = mono[first - offset:last - offset]
+	return windows
+
+
+def pitch_footprint(sample_rate, slices, params=PitchParams()):
+	""" Estimate the bytes held while the pitches of the slices of a file are estimated: one batch of windows with
+	their spectra and YIN difference functions, and the pitch of each slice.
+	:param sample_rate: The sample rate of the file.
+	:param slices: The most slices the file has.
+	:rtype: int
+	"""
+	width, max_period = params.window(sample_rate), params.max_period(sample_rate)
+	size = scipy.fft.next_fast_len(2 * width - max_period)
+	return min(slices, PITCH_BATCH) * (width * 12 + size * 16 + max_period * 32) + slices * 8
+
+
+def slice_pitches(reader, boundaries, params=PitchParams()):
+	""" Estimate the fundamental of each slice of a file from a window in its middle.
+	:param reader: An open WavReader or FlacReader.
+	:param boundaries: The slice boundaries as (start frame, stop frame) rows, sorted and not overlapping.
+	:param params: The pitch parameters.
+	:rtype: SlicePitches
+	"""
+	sample_rate = reader.info.sample_rate
+	width = params.window(sample_rate)
+	boundaries = np.asarray(boundaries, dtype=np.int64).reshape(-1, 2)
+	lengths = np.clip(boundaries[:, 1] - boundaries[:, 0], 0, width)
+	starts = boundaries[:, 0] + np.maximum(0, (boundaries[:, 1] - boundaries[:, 0] - width) // 2)
+	stops = starts + lengths
+	frequency = np.full(len(boundaries), np.nan, dtype=np.float32)
+	aperiodicity = np.ones(len(boundaries), dtype=np.float32)
+	for first in range(0, len(boundaries), PITCH_BATCH):
+		batch = slice(first, first + PITCH_BATCH)
+		windows = gather_windows(reader, starts[batch], stops[batch], width)
+		frequency[batch], aperiodicity[batch] = yin(windows, sample_rate, params)
+	return SlicePitches(frequency, aperiodicity)
@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Per-stage profiling of file processing.
+
+Code marks its stages with `with stage('analyze'):` and counts I/O with add_bytes_read()/add_bytes_written().
+These record into the profile of the file being processed in the current thread or task, opened with
+profile_file(). Without an open profile they do nothing but a context variable lookup, so instrumentation
+stays in place at next to no cost when profiling is disabled.
+
+Stage times are exclusive: time spent in a nested stage (e.g. 'decode' inside 'analyze') is only counted
+for the nested stage.
+"""
+from contextlib import contextmanager, nullcontext
+import contextvars
+import csv
+from dataclasses import dataclass, field
+import json
+import logging
+import math
+import os
+import sys
+import time
+
+try:
+	import resource
+except ImportError:  # Not available on Windows
+	resource = None
+
+_current = contextvars.ContextVar('gcrslicer_profile', default=None)
+_NULL_CONTEXT = nullcontext()
+
+# Wall time histogram buckets are powers of two of this many seconds
+_HISTOGRAM_UNIT = 1e-6
+
+
+@dataclass
+class StageStats:
+	"""Accumulated exclusive time of one stage."""
+	calls: int = 0
+	wall_s: float = 0.0
+	cpu_s: float = 0.0
+
+
+@dataclass
+class FileProfile:
+	"""The profile of one processed file."""
+	path: str
+	stages: dict = field(default_factory=dict)
+	bytes_read: int = 0
+	bytes_written: int = 0
+	rss_bytes: int = None
+	peak_rss_increase_bytes: int = None
+	_stack: list = field(default_factory=list, repr=False)
+
+	def __getstate__(self):
+		state = self.__dict__.copy()
+		state['_stack'] = []
+		return state
+
+	def enter(self):
+		""" Start a stage. """
+		self._stack.append([time.perf_counter(), time.thread_time(), 0.0, 0.0])
+
+	def leave(self, name):
+		""" End the innermost stage, attributing its exclusive time to name. """
+		wall_start, cpu_start, child_wall, child_cpu = self._stack.pop()
+		wall, cpu = time.perf_counter() - wall_start, time.thread_time() - cpu_start
+		stats = self.stages.get(name)
+		if stats is None:
+			stats = self.stages[name] = StageStats()
+		stats.calls += 1
+		stats.wall_s += wall - child_wall
+		stats.cpu_s += cpu - child_cpu
+		if self._stack:
+			self._stack[-1][2] += wall
+			self._stack[-1][3] += cpu
+
+	def merge(self, other):
+		""" Add the stages and I/O of another profile of the same file, e.g. one recorded in another thread or
+		process by a later pipeline stage.
+		:return: This profile.
+		:rtype: FileProfile
+		"""
+		for name, stats in other.stages.items():
+			total = self.stages.setdefault(name, StageStats())
+			total.calls += stats.calls
+			total.wall_s += stats.wall_s
+			total.cpu_s += stats.cpu_s
+		self.bytes_read += other.bytes_read
+		self.bytes_written += other.bytes_written
+		self.rss_bytes = other.rss_bytes if other.rss_bytes is not None else self.rss_bytes
+		if other.peak_rss_increase_bytes is not None:
+			self.peak_rss_increase_bytes = (self.peak_rss_increase_bytes or 0) + other.peak_rss_increase_bytes
+		return self
+
+
+@contextmanager
+def _stage(profile, name):
+	profile.enter()
+	try:
+		yield
+	finally:
+		profile.leave(name)
+
+
+def stage(name):
+	""" Time a stage of the file being profiled. Does nothing if no file is being profiled.
+	:param name: The stage name.
+	:rtype: contextlib.AbstractContextManager
+	"""
+	profile = _current.get()
+	return _NULL_CONTEXT if profile is None else _stage(profile, name)
+
+
+def timed_iter(name, iterable):
+	""" Attribute the time spent producing each item of an iterable to a stage. Returns the iterable itself if no
+	file is being profiled.
+	:param name: The stage name.
+	:param iterable: The iterable to time, e.g. a block generator.
+	:rtype: collections.abc.Iterable
+	"""
+	profile = _current.get()
+	return iterable if profile is None else _timed_iter(profile, name, iter(iterable))
+
+
+def _timed_iter(profile, name, iterator):
+	while True:
+		profile.enter()
+		try:
+			item = next(iterator)
+		except StopIteration:
+			return
+		finally:
+			profile.leave(name)
+		yield item
+
+
+def add_bytes_read(count):
+	""" Count bytes read for the file being profiled. """
+	profile = _current.get()
+	if profile is not None:
+		profile.bytes_read += count
+
+
+def add_bytes_written(count):
+	""" Count bytes written for the file being profiled. """
+	profile = _current.get()
+	if profile is not None:
+		profile.bytes_written += count
+
+
+def _rss_bytes():
+	""" Current resident set size, where the platform exposes it cheaply. """
+	try:
+		with open('/proc/self/statm', 'rb') as statm:
+			return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+	except (OSError, ValueError, IndexError):
+		return None
+
+
+def peak_rss_bytes():
+	""" Peak resident set size of the process so far, or None where the platform doesn't expose it. """
+	if resource is None:
+		return None
+	# ru_maxrss is in KiB on Linux, and in bytes on macOS
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+
+@contextmanager
+def profile_file(path, enabled=True):
+	""" Open the profile of a file, for the stages run in the current context. Besides the stages, it records the
+	resident set size once the file is done, and how much the file raised the peak RSS of the process. The peak
+	is process-wide, so the increase includes whatever ran concurrently.
+	:param path: The file being processed.
+	:param enabled: Yield None and profile nothing if False.
+	:return: The FileProfile, complete once the context exits.
+	:rtype: FileProfile
+	"""
+	if not enabled:
+		yield None
+		return
+	profile = FileProfile(str(path))
+	peak_before = peak_rss_bytes()
+	token = _current.set(profile)
+	profile.enter()
+	try:
+		yield profile
+	finally:
+		profile.leave('other')
+		_current.reset(token)
+		profile.rss_bytes = _rss_bytes()
+		peak_after = peak_rss_bytes()
+		if peak_before is not None and peak_after is not None:
+			profile.peak_rss_increase_bytes = peak_after - peak_before
+
+
+def _bucket(seconds):
+	""" Histogram bucket of a duration: n such that the duration is in [2**(n-1), 2**n) units. """
+	return max(0, math.frexp(seconds / _HISTOGRAM_UNIT)[1]) if seconds > 0 else 0
+
+
+class ProfileReport:
+	""" Collects file profiles and aggregates them per stage, with wall time histograms. """
+
+	def __init__(self):
+		self.files = []
+		self.aggregate = {}
+		self.queues = {}
+
+	def add(self, profile, **extra_stages):
+		""" Add a file profile.
+		:param profile: The FileProfile, or None.
+		:param extra_stages: Wall times of stages measured outside the file's own profile, e.g. scan=0.01. Their
+			CPU time isn't measured, and is reported as 0.
+		"""
+		if profile is None:
+			return
+		for name, wall_s in extra_stages.items():
+			profile.stages[name] = StageStats(1, wall_s, 0.0)
+		self.files.append(profile)
+
+		for name, stats in profile.stages.items():
+			total = self.aggregate.setdefault(name, {'files': 0, 'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0,
+													 'histogram': {}})
+			total['files'] += 1
+			total['calls'] += stats.calls
+			total['wall_s'] += stats.wall_s
+			total['cpu_s'] += stats.cpu_s
+			bucket = _bucket(stats.wall_s)
+			total['histogram'][bucket] = total['histogram'].get(bucket, 0) + 1
+
+		logging.info(f"\tprofile '{profile.path}': " + ", ".join(
+			f"{name} {stats.wall_s:.4f}s" for name, stats in profile.stages.items()) +
+			f", read {profile.bytes_read}B, wrote {profile.bytes_written}B")
+
+	def add_queue_stats(self, stats):
+		""" Add the backpressure statistics of a pipeline run, summed over runs.
+		:param stats: QueueStats per queue name, e.g. Pipeline.stats.
+		"""
+		for name, queue_stats in stats.items():
+			total = self.queues.setdefault(name, {})
+			for key, value in queue_stats.to_dict().items():
+				total[key] = max(total.get(key, 0), value) if key == 'max_depth' else total.get(key, 0) + value
+
+	def to_dict(self):
+		""" The report as plain values. Histogram keys are the upper bound of each bucket in seconds.
+		:rtype: dict
+		"""
+		aggregate = {}
+		for name, total in self.aggregate.items():
+			aggregate[name] = {**total, 'histogram': {
+				f"{_HISTOGRAM_UNIT * 2 ** bucket:.6g}": count for bucket, count in sorted(total['histogram'].items())}}
+		return {
+			'files': [{'path': p.path, 'bytes_read': p.bytes_read, 'bytes_written': p.bytes_written,
+					   'rss_bytes': p.rss_bytes, 'peak_rss_increase_bytes': p.peak_rss_increase_bytes,
+					   'stages': {name: vars(stats) for name, stats in p.stages.items()}} for p in self.files],
+			'aggregate': aggregate,
+			'queues': self.queues,
+		}
+
+	def write(self, filename):
+		""" Write the report as CSV, one row per file and stage, if filename ends with '.csv'. Otherwise as JSON. """
+		if str(filename).lower().endswith('.csv'):
+			with open(filename, 'w', newline='', encoding='utf-8') as csv_file:
+				writer = csv.writer(csv_file)
+				writer.writerow(['path', 'stage', 'calls', 'wall_s', 'cpu_s', 'bytes_read', 'bytes_written',
+								 'rss_bytes', 'peak_rss_increase_bytes'])
+				for p in self.files:
+					for name, stats in p.stages.items():
+						writer.writerow([p.path, name, stats.calls, f"{stats.wall_s:.6f}", f"{stats.cpu_s:.6f}",
+										 p.bytes_read, p.bytes_written, p.rss_bytes, p.peak_rss_increase_bytes])
+		else:
+			with open(filename, 'w', encoding='utf-8') as json_file:
+				json.dump(self.to_dict(), json_file, indent=2)
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Headless rendering of waveform thumbnails to image files.
+
+Plotting with pyplot creates a figure, axes and artists for every plot, and shows them with an interactive
+backend. For batch rendering, each process instead keeps one figure on the non-interactive Agg canvas: the
+envelope patch of each channel, the time axis and the title are updated in place for every file. What doesn't
+change between files (the amplitude axis, its grid, the frame and the legend) is drawn once per amplitude label
+and channel layout and kept as a background: every thumbnail restores it and draws just the artists of the file
+over it, the way animations are blitted, so most text isn't laid out or rasterized again. A pool of worker
+processes renders a library in parallel.
+"""
+from functools import lru_cache
+import logging
+import os
+from pathlib import Path
+
+import numpy as np
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+from matplotlib.image import imsave
+from matplotlib.ticker import MaxNLocator
+
+from . import profiling
+from .audio import open_audio
+from .envelope import file_envelope
+from .slicer import source_stem
+
+# Size of the thumbnails in pixels
+THUMBNAIL_WIDTH = 800
+THUMBNAIL_HEIGHT = 240
+THUMBNAIL_DPI = 100
+
+# zlib level of the PNG files. Envelopes compress well at any level, and the default level takes longer than drawing.
+PNG_COMPRESS_LEVEL = 1
+
+
+def channel_names(channels):
+	""" Name the channels of a file for a plot legend.
+	:rtype: list[str]
+	"""
+	return ["Left channel", "Right channel"] if channels == 2 else \
+		[f"Channel {channel + 1}" for channel in range(channels)]
+
+
+def plot_filename(plot_dir, audio_filename):
+	""" Name the thumbnail of a file, unique per resolved source path.
+	:rtype: Path
+	"""
+	return Path(plot_dir, f"{source_stem(audio_filename)}.png")
+
+
+class WaveformCanvas:
+	""" A figure for rendering min/max envelopes to images, reused for every file. Not thread-safe. """
+
+	def __init__(self, width=THUMBNAIL_WIDTH, height=THUMBNAIL_HEIGHT, dpi=THUMBNAIL_DPI):
+		"""
+		:param width: Width of the images in pixels.
+		:param height: Height of the images in pixels.
+		:param dpi: Resolution of the images, scaling the text and lines.
+		"""
+		# Fixed margins: a layout engine would measure every tick label again for every file
+		self.figure = Figure(figsize=(width / dpi, height / dpi), dpi=dpi)
+		self.figure.subplots_adjust(left=64 / width, right=1 - 12 / width, bottom=44 / height, top=1 - 26 / height)
+		self.canvas = FigureCanvasAgg(self.figure)
+		self.axes = self.figure.add_subplot()
+		self.axes.set_xlabel('Time (s)')
+		self.axes.set_ylim(-1, 1)
+		self.axes.set_axisbelow(True)
+		self.axes.grid()
+		self.axes.xaxis.set_major_locator(MaxNLocator(8))
+		self.axes.title.set_horizontalalignment('left')
+		self.axes.title.set_x(0)
+		# Artists that change per file are animated: left out of the background, and drawn over it
+		self.axes.xaxis.set_animated(True)
+		self.axes.title.set_animated(True)
+		self._patches = []
+		self._legend = None
+		self._backgrounds = {}
+
+	@property
+	def width(self):
+		""" Width of the images in pixels, about the envelope bins worth plotting.
+		:rtype: int
+		"""
+		return int(self.figure.bbox.width)
+
+	def _patch(self, channel):
+		""" The envelope patch of a channel, created the first time a file has that many channels. """
+		while len(self._patches) <= channel:
+			self._patches.append(self.axes.stairs([0.0], [0.0, 1.0], baseline=[0.0], fill=True, linewidth=0.5,
+												  color=f"C{len(self._patches)}", animated=True))
+		return self._patches[channel]
+
+	def _restore_background(self, ylabel, labels):
+		""" Restore the background of an amplitude label and legend, drawing it the first time they are used. """
+		key = (ylabel, labels)
+		if key not in self._backgrounds:
+			self.axes.set_ylabel(ylabel)
+			if self._legend is not None:
+				self._legend.remove()
+				self._legend = None
+			if labels:
+				self._legend = self.figure.legend(handles=self._patches[:len(labels)], loc='upper right', ncols=2,
+												  frameon=False, fontsize='small')
+			self.canvas.draw()
+			self._backgrounds[key] = self.canvas.copy_from_bbox(self.figure.bbox)
+		else:
+			self.canvas.restore_region(self._backgrounds[key])
+
+	def render(self, filename, info, samples_per_bin, first, mins, maxs, title):
+		""" Render the min/max envelope of a file to an image.
+		:param filename: The PNG file to write.
+		:param info: The WavInfo of the file.
+		:param samples_per_bin: Number of frames per envelope bin.
+		:param first: The first frame of the first bin.
+		:param mins: The per-bin minima, shaped (bins, channels).
+		:param maxs: The per-bin maxima, shaped (bins, channels).
+		:param title: The title of the plot.
+		"""
+		edges = (first + np.arange(len(mins) + 1) * samples_per_bin) / info.sample_rate
+		names = channel_names(info.channels)
+		for channel, name in enumerate(names):
+			patch = self._patch(channel)
+			patch.set_data(maxs[:, channel], edges, mins[:, channel])
+			patch.set_label(name)
+			patch.set_visible(True)
+		for patch in self._patches[info.channels:]:
+			patch.set_visible(False)
+		self.axes.set_xlim(edges[0], max(edges[-1], edges[0] + 1 / info.sample_rate))
+		self.axes.set_title(title)
+
+		self._restore_background(f"Amplitude ({info.bits_per_sample}-bit)",
+								 tuple(names) if info.channels == 2 else None)
+		# The time axis carries the vertical gridlines, so it goes below the envelope, like the static grid
+		self.axes.draw_artist(self.axes.xaxis)
+		for patch in self._patches[:info.channels]:
+			self.axes.draw_artist(patch)
+		self.axes.draw_artist(self.axes.title)
+		imsave(filename, np.asarray(self.canvas.buffer_rgba()), format='png',
+			   pil_kwargs={'compress_level': PNG_COMPRESS_LEVEL})
+
+
+@lru_cache(maxsize=1)
+def _process_canvas():
+	""" The canvas of this process, created on its first render. """
+	return WaveformCanvas()
+
+
+def render_file(audio_filename, plot_dir, pyramid_dir=None):
+	""" Render the waveform thumbnail of a file into a directory, with the canvas of the calling process. A thumbnail
+	newer than the file is kept. Picklable, to run in worker processes.
+	:param audio_filename: The audio file to render.
+	:param plot_dir: Directory to write the thumbnail to.
+	:param pyramid_dir: Directory to load or store the envelope pyramid of the file. Not stored if None.
+	:return: The thumbnail file.
+	:rtype: Path
+	"""
+	filename = plot_filename(plot_dir, audio_filename)
+	try:
+		if filename.stat().st_mtime_ns >= os.stat(audio_filename).st_mtime_ns:
+			return filename
+	except OSError:
+		pass
+
+	canvas = _process_canvas()
+	with open_audio(audio_filename) as reader:
+		logging.info(f"Rendering audio_filename:'{audio_filename}'")
+		with profiling.stage('envelope'):
+			envelope = file_envelope(reader, canvas.width, pyramid_dir)
+	with profiling.stage('render'):
+		canvas.render(filename, reader.info, *envelope, title=Path(audio_filename).name)
+	return filename
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Streaming sample rate and channel conversion to a target output format.
+
+Sample rates are converted by a polyphase FIR resampler, with the filter scipy.signal.resample_poly designs.
+The resampler is fed one block at a time and carries the input history its filter still needs from block to
+block, so a file is never held in memory as a whole, and its output equals resampling the whole file at once.
+Each filter phase is applied to all of its output frames of a block with one matrix product over a strided
+view of the input, rather than frame by frame. Channels are mixed by a matrix, before resampling when the
+target has fewer channels, so the filter runs on as few channels as possible.
+"""
+from dataclasses import dataclass, replace
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+import scipy.signal
+
+from . import profiling
+from .wavreader import DEFAULT_BLOCK_FRAMES, denormalize, frame_range, to_raw
+
+# Half the filter length, in taps per unit of the larger of the reduced up and down factors (as resample_poly)
+_HALF_LEN_PER_RATE = 10
+
+# Kaiser window beta of the anti-aliasing filter (as resample_poly)
+_KAISER_BETA = 5.0
+
+
+def resample_factors(rate_in, rate_out):
+	""" The reduced up and down sampling factors converting one sample rate to another.
+	:rtype: tuple[int, int]
+	"""
+	divisor = gcd(rate_in, rate_out)
+	return rate_out // divisor, rate_in // divisor
+
+
+@lru_cache(maxsize=32)
+def polyphase_filter(up, down):
+	""" Design the anti-aliasing filter of a resampling ratio, split into its phases.
+	:return: The filter delay in upsampled frames, and the phases as a (up, taps) float32 array, each phase
+		reversed so it applies to input frames in ascending order.
+	:rtype: tuple[int, np.ndarray]
+	"""
+	max_rate = max(up, down)
+	half_len = _HALF_LEN_PER_RATE * max_rate
+	coefficients = scipy.signal.firwin(2 * half_len + 1, 1 / max_rate, window=('kaiser', _KAISER_BETA)) * up
+	taps = -(-len(coefficients) // up)
+	coefficients = np.pad(coefficients, (0, taps * up - len(coefficients)))
+	return half_len, np.ascontiguousarray(coefficients.reshape(taps, up).T[:, ::-1], dtype=np.float32)
+
+
+def mix_matrix(channels_in, channels_out):
+	""" The matrix mixing frames of one channel count to another: averaging all channels into mono, copying mono
+	into all channels, and otherwise averaging input channel i into output channel i % channels_out.
+	:return: A (channels_in, channels_out) float32 array.
+	:rtype: np.ndarray
+	"""
+	matrix = np.zeros((channels_in, channels_out), dtype=np.float32)
+	if channels_in == 1:
+		matrix[0, :] = 1
+		return matrix
+	for channel in range(max(channels_in, channels_out)):
+		matrix[channel % channels_in, channel % channels_out] = 1
+	return matrix / matrix.sum(axis=0)
+
+
+class StreamingResampler:
+	""" Polyphase resampler fed consecutive blocks of input frames, carrying its filter history across blocks.
+
+	Output frame m is the filtered input around input position m * rate_in / rate_out, so output frames can be
+	computed from any position: a resampler started at output frame `start` needs the input from `input_start`
+	on, and zero input before the start of the file.
+	"""
+
+	def __init__(self, rate_in, rate_out, channels, start, stop):
+		"""
+		:param rate_in: The input sample rate.
+		:param rate_out: The output sample rate.
+		:param channels: The number of channels.
+		:param start: The first output frame to compute.
+		:param stop: The output frame to stop at.
+		"""
+		self.up, self.down = resample_factors(rate_in, rate_out)
+		self._delay, self._phases = polyphase_filter(self.up, self.down)
+		self._taps = self._phases.shape[1]
+		self.position = start
+		self.stop = stop
+		# Input frame of the first history frame. The history starts with zeros for any input before the file.
+		self._base = self._first_input(start)
+		self._history = np.zeros((max(0, -self._base), channels), dtype=np.float32)
+
+	def _last_input(self, frame):
+		return (frame * self.down + self._delay) // self.up
+
+	def _first_input(self, frame):
+		return self._last_input(frame) - self._taps + 1
+
+	@property
+	def input_start(self):
+		""" The next input frame to feed.
+		:rtype: int
+		"""
+		return self._base + len(self._history)
+
+	@property
+	def input_stop(self):
+		""" The input frame after the last one the output frames before stop depend on.
+		:rtype: int
+		"""
+		return self._last_input(self.stop - 1) + 1
+
+	def process(self, block):
+		""" Feed the input frames following those fed before, and compute the output frames they complete.
+		:param block: float32 input frames shaped (frames, channels).
+		:return: The completed output frames, shaped (frames, channels).
+		:rtype: np.ndarray
+		"""
+		frames = np.concatenate((self._history, block)) if len(self._history) else block
+		available = self._base + len(frames)
+		stop = min((available * self.up - 1 - self._delay) // self.down + 1, self.stop)
+		count = max(0, stop - self.position)
+		out = np.empty((count, frames.shape[1]), dtype=np.float32)
+		if count:
+			windows = np.lib.stride_tricks.sliding_window_view(frames, self._taps, axis=0)
+			for phase_start in range(min(self.up, count)):
+				# Output frames one up apart share a filter phase, and their input windows are one down apart
+				frame = self.position + phase_start
+				first = self._first_input(frame) - self._base
+				phase_count = len(range(phase_start, count, self.up))
+				phase = self._phases[(frame * self.down + self._delay) % self.up]
+				out[phase_start::self.up] = windows[first:first + (phase_count - 1) * self.down + 1:self.down] @ phase
+			self.position += count
+		keep = max(0, min(self._first_input(self.position) - self._base, len(frames)))
+		self._history = frames[keep:].copy()
+		self._base += keep
+		return out
+
+	def flush(self):
+		""" Feed the zero input after the end of the file, to compute the last output frames up to stop.
+		:rtype: np.ndarray
+		"""
+		missing = self.input_stop - self.input_start
+		return self.process(np.zeros((max(0, missing), self._history.shape[1]), dtype=np.float32))
+
+
+@dataclass(frozen=True)
+class TargetFormat:
+	"""A sample rate and channel count to convert audio to. None keeps the one of the source."""
+	sample_rate: int = None
+	channels: int = None
+
+	def converts(self, info):
+		""" Check whether audio of a format needs converting.
+		:rtype: bool
+		"""
+		return (self.sample_rate or info.sample_rate) != info.sample_rate or \
+			(self.channels or info.channels) != info.channels
+
+	def apply(self, info):
+		""" The format of audio of a format once converted. Its sample format is kept.
+		:rtype: WavInfo
+		"""
+		sample_rate, channels = self.sample_rate or info.sample_rate, self.channels or info.channels
+		up, down = resample_factors(info.sample_rate, sample_rate)
+		return replace(info, sample_rate=sample_rate, channels=channels, frames=-(-info.frames * up // down),
+					   data_offset=0, block_align=channels * info.sample_width)
+
+	def convert_frames(self, frames, info):
+		""" Map frame positions of audio of a format to the matching positions of the converted audio.
+		:param frames: An array of frame positions.
+		:param info: The format of the source audio.
+		:rtype: np.ndarray
+		"""
+		up, down = resample_factors(info.sample_rate, self.sample_rate or info.sample_rate)
+		frames = np.asarray(frames, dtype=np.int64)
+		return np.minimum((frames * up + down // 2) // down, self.apply(info).frames)
+
+
+def conversion_footprint(info, target, block_frames=DEFAULT_BLOCK_FRAMES):
+	""" Estimate the bytes held while a file is converted to a target format: a block of source frames with its
+	mixed and filtered copies, the converted frames regrouped into a block with its sample conversions, and the
+	resampling filter.
+	:param info: The format of the source audio.
+	:param target: The TargetFormat, or None.
+	:param block_frames: Number of converted frames per block.
+	:return: The bytes, or 0 if the audio isn't converted.
+	:rtype: int
+	"""
+	if target is None or not target.converts(info):
+		return 0
+	converted = target.apply(info)
+	block_frames = min(block_frames, max(1, converted.frames))
+	up, down = resample_factors(info.sample_rate, converted.sample_rate)
+	source_frames = max(1, block_frames * down // up)
+	filter_bytes = (2 * _HALF_LEN_PER_RATE * max(up, down) + up) * 4 if up != down else 0
+	return source_frames * info.channels * 12 + block_frames * converted.channels * 16 + filter_bytes
+
+
+class ConvertedReader:
+	""" Wraps an open WavReader or FlacReader, and hands out its audio converted to a target format, as blocks
+	with the interface of the wrapped reader. Blocks are streamed: the source is read and converted in blocks too.
+	Like FlacReader it has no `raw` or `samples`. Use as a context manager.
+	"""
+
+	def __init__(self, reader, target):
+		"""
+		:param reader: The open reader of the source. Closed with this reader.
+		:param target: The TargetFormat.
+		"""
+		self.source = reader
+		self.target = target
+		self.filename = reader.filename
+		self.info = target.apply(reader.info)
+		self.block_frames = reader.block_frames
+		self._up, self._down = resample_factors(reader.info.sample_rate, self.info.sample_rate)
+		self._mix = mix_matrix(reader.info.channels, self.info.channels)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def __len__(self):
+		return self.info.frames
+
+	def close(self):
+		"""Close the source reader."""
+		self.source.close()
+
+	def _mixed(self, block, before_resampling):
+		""" Mix the channels of a block, before resampling if that reduces them, else after. """
+		if (self.info.channels < self.source.info.channels) != before_resampling or \
+				self.info.channels == self.source.info.channels:
+			return block
+		return block @ self._mix
+
+	def _converted(self, start, stop):
+		""" Convert output frames start to stop, in blocks of whatever length the resampler completes. """
+		source_frames = max(1, self.block_frames * self._down // self._up)
+		if self._up == self._down:
+			for _, block in self.source.float_blocks(source_frames, start, stop):
+				yield self._mixed(self._mixed(block, True), False)
+			return
+		channels = min(self.info.channels, self.source.info.channels)
+		resampler = StreamingResampler(self.source.info.sample_rate, self.info.sample_rate, channels, start, stop)
+		input_stop = min(resampler.input_stop, self.source.info.frames)
+		for _, block in self.source.float_blocks(source_frames, resampler.input_start, input_stop):
+			yield self._mixed(resampler.process(self._mixed(block, True)), False)
+		yield self._mixed(resampler.flush(), False)
+
+	def _float_blocks(self, block_frames, start, stop):
+		""" Regroup the converted frames into blocks of exactly block_frames, but for the last. """
+		block_frames = block_frames or self.block_frames
+		start, stop = frame_range(start, stop, self.info.frames)
+		if start >= stop:
+			return
+		pending, pending_frames, offset = [], 0, start
+		for converted in profiling.timed_iter('resample', self._converted(start, stop)):
+			pending.append(converted)
+			pending_frames += len(converted)
+			if pending_frames < block_frames:
+				continue
+			frames = np.concatenate(pending)
+			split = len(frames) - len(frames) % block_frames
+			for block_start in range(0, split, block_frames):
+				yield offset, frames[block_start:block_start + block_frames]
+				offset += block_frames
+			pending = [frames[split:]]
+			pending_frames = len(pending[0])
+		if pending_frames:
+			yield offset, np.concatenate(pending)
+
+	def _blocks(self, block_frames, start, stop):
+		for block_start, block in self._float_blocks(block_frames, start, stop):
+			yield block_start, denormalize(block, self.info)
+
+	def _raw_blocks(self, block_frames, start, stop):
+		for block_start, block in self._blocks(block_frames, start, stop):
+			yield block_start, to_raw(block, self.info)
+
+	def raw_blocks(self, block_frames=None, start=0, stop=None):
+		""" Iterate over blocks of converted frame bytes, laid out as in a WAV file of the target format.
+		:param block_frames: Number of frames per block. Reader default if None.
+		:param start: First converted frame to read.
+		:param stop: Converted frame to stop reading at. End of file if None.
+		:return: A generator of (frame offset, array shaped (frames, block_align)) tuples.
+		:rtype: tuple[int, np.ndarray]
+		"""
+		return self._raw_blocks(block_frames, start, stop)
+
+	def blocks(self, block_frames=None, start=0, stop=None):
+		""" Iterate over blocks of converted samples, in the dtype WavReader.blocks() uses for the sample format.
+		:param block_frames: Number of frames per block. Reader default if None.
+		:param start: First converted frame to read.
+		:param stop: Converted frame to stop reading at. End of file if None.
+		:return: A generator of (frame offset, array shaped (frames, channels)) tuples.
+		:rtype: tuple[int, np.ndarray]
+		"""
+		return self._blocks(block_frames, start, stop)
+
+	def float_blocks(self, block_frames=None, start=0, stop=None):
+		""" Iterate over blocks of converted samples, as float32 in the range [-1, 1].
+		:param block_frames: Number of frames per block. Reader default if None.
+		:param start: First converted frame to read.
+		:param stop: Converted frame to stop reading at. End of file if None.
+		:return: A generator of (frame offset, array shaped (frames, channels)) tuples.
+		:rtype: tuple[int, np.ndarray]
+		"""
+		return self._float_blocks(block_frames, start, stop)
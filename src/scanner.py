@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Parallel directory scanner built on os.scandir.
+
+Directories are listed by a pool of threads, a bounded number ahead of the consumer, which hides the
+latency of network mounts. Files are still yielded in a deterministic order: depth-first, files before
+subdirectories, each sorted by name. Directories and files are identified by (device, inode), so symlink
+cycles are never followed and a file reachable through several links is yielded once.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import os
+from pathlib import Path
+
+# Default number of threads listing directories
+DEFAULT_SCAN_WORKERS = 8
+
+# Number of directory listings kept in flight per scan thread
+_LOOKAHEAD_PER_WORKER = 4
+
+
+def extension_set(file_ext_filters):
+	""" Normalize file extension filters into a set of lowercase suffixes, without leading dots.
+	:param file_ext_filters: Extensions like 'wav', '.WAV' or 'tar.xz'.
+	:rtype: set[str]
+	"""
+	return {ext.lower().lstrip('.') for ext in file_ext_filters}
+
+
+def has_extension(name, extensions):
+	""" Check a file name against a set of suffixes from extension_set(). Each dot-separated suffix of the name
+	(e.g. 'xz' and 'tar.xz' for 'a.tar.xz') is one set lookup.
+	:param name: The file name.
+	:param extensions: The suffix set. Everything matches if empty.
+	:rtype: bool
+	"""
+	if not extensions:
+		return True
+	suffix = name.lower()
+	while True:
+		dot = suffix.find('.')
+		if dot < 0:
+			return False
+		suffix = suffix[dot + 1:]
+		if suffix in extensions:
+			return True
+
+
+def file_key(path):
+	""" Identify a file by (device, inode), following symlinks.
+	:rtype: tuple[int, int]
+	"""
+	stat_result = os.stat(path)
+	return stat_result.st_dev, stat_result.st_ino
+
+
+def _list_directory(directory):
+	""" List a directory, following symlinks.
+	:return: The (name, path, is_dir, is_symlink, inode) entries of the directory, sorted by name.
+	:rtype: list[tuple]
+	"""
+	try:
+		with os.scandir(directory) as scanner:
+			entries = []
+			for entry in scanner:
+				try:
+					entries.append((entry.name, entry.path, entry.is_dir(), entry.is_symlink(), entry.inode()))
+				except OSError:
+					continue
+	except OSError as ex:
+		logging.warning(f"Skipping unreadable directory '{directory}': {ex}")
+		return []
+	entries.sort()
+	return entries
+
+
+def scan_tree(directory, prefix, extensions=frozenset(), seen=None, workers=DEFAULT_SCAN_WORKERS):
+	""" Find the files of a directory tree.
+	:param directory: The directory to scan.
+	:param prefix: The path yielded files are relative to, standing in for directory.
+	:param extensions: The suffix set from extension_set() that files must match. Everything matches if empty.
+	:param seen: A set of (device, inode) keys of directories and files to skip; updated while scanning.
+	:param workers: Number of threads listing directories.
+	:return: A generator of the files found, as paths under prefix.
+	:rtype: Path
+	"""
+	seen = set() if seen is None else seen
+	root_key = file_key(directory)
+	if root_key in seen:
+		return
+	seen.add(root_key)
+
+	executor = ThreadPoolExecutor(max_workers=workers)
+	lookahead = workers * _LOOKAHEAD_PER_WORKER
+	# Stack of [relative path, directory, device, listing future or None], the next directory to yield on top
+	stack = [[Path(prefix), directory, root_key[0], executor.submit(_list_directory, directory)]]
+	try:
+		while stack:
+			relative, _, device, listing = stack.pop()
+			entries = listing.result()
+
+			subdirectories = []
+			for name, path, is_dir, is_symlink, inode in entries:
+				if not is_dir and not has_extension(name, extensions):
+					continue
+				try:
+					key = file_key(path) if is_symlink or is_dir else (device, inode)
+				except OSError:
+					continue  # Dangling symlink
+				if key in seen:
+					continue
+				seen.add(key)
+
+				if is_dir:
+					subdirectories.append([relative / name, path, key[0], None])
+				else:
+					yield relative / name
+			stack.extend(reversed(subdirectories))
+
+			# Keep listings of the next directories in flight
+			for pending in stack[:-lookahead - 1:-1]:
+				if pending[3] is None:
+					pending[3] = executor.submit(_list_directory, pending[1])
+	finally:
+		executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Zero-copy slice writing.
+
+Slices are written straight from views into the memory-mapped source data. Sample bytes are never copied
+into a per-slice array nor re-encoded unless the output format requires it (big-endian AIFF); each slice
+costs one header and one or two write calls. Sources without a memory mapping (e.g. FLAC) are decoded once,
+front to back, and each block is written to the slices it overlaps.
+"""
+import hashlib
+import logging
+from pathlib import Path
+
+from . import profiling
+from .writers import HeaderTemplate, StreamedSlice, write_slice
+
+
+def source_stem(audio_filename):
+	""" Name the slices of a file, and the other files derived from it, after its stem and a digest of its
+	resolved path, so same-named files from different directories get different names.
+	:rtype: str
+	"""
+	resolved = Path(audio_filename).resolve()
+	digest = hashlib.sha1(str(resolved).encode()).hexdigest()[:12]
+	return f"{resolved.stem}-{digest}"
+
+
+def slice_filenames(write_dir, stem, count, fmt='wav', tags=None, indexes=None):
+	""" Name the slices of a file.
+	:param write_dir: Directory the slices are written to.
+	:param stem: Name of the source file, without extension, e.g. its source_stem().
+	:param count: Number of slices of the file.
+	:param fmt: The output format, used as the file extension.
+	:param tags: A tag per named slice appended to its name, e.g. its note name. Empty tags are left out.
+	:param indexes: The indexes of the slices to name, for a subset of them. All count slices if None.
+	:return: One path per named slice.
+	:rtype: list[Path]
+	"""
+	width = max(4, len(str(count - 1)))
+	indexes = range(count) if indexes is None else indexes
+	tags = tags if tags is not None else [''] * len(indexes)
+	return [Path(write_dir, f"{stem}_{index:0{width}d}{'_' if tag else ''}{tag}.{fmt}")
+			for index, tag in zip(indexes, tags)]
+
+
+def write_slices(reader, boundaries, write_dir, stem, fmt='wav', writer=None, tags=None, indexes=None, count=None):
+	""" Write each slice of a file, directly from the memory-mapped source data, or from its decoded blocks if it
+	isn't memory-mapped. Each slice is written atomically.
+	:param reader: An open WavReader or FlacReader of the source file.
+	:param boundaries: The slice boundaries as (start frame, stop frame) rows.
+	:param write_dir: Directory to write the slices to.
+	:param stem: Name of the source file, e.g. its source_stem(). Slices are named '<stem>_<index>[_<tag>].<fmt>'.
+	:param fmt: The output format: 'wav', 'aiff' or 'aifc'.
+	:param writer: A SliceWriter to write memory-mapped slices on. Written in the calling thread if None.
+	:param tags: A tag per slice appended to its name, e.g. its note name. None for no tags.
+	:param indexes: The index of each slice among the slices of the file, if the boundaries are a subset of them.
+	:param count: The number of slices of the file, if the boundaries are a subset of them.
+	:return: The paths of the written slices.
+	:rtype: list[Path]
+	"""
+	template = HeaderTemplate(reader.info, fmt)
+	filenames = slice_filenames(write_dir, stem, len(boundaries) if count is None else count, fmt, tags, indexes)
+	if getattr(reader, 'raw', None) is None:
+		_write_streamed(reader, boundaries, filenames, template)
+	else:
+		raw = reader.raw
+		slices = ((filename, template, raw[start:stop]) for filename, (start, stop) in zip(filenames, boundaries))
+		with profiling.stage('write'):
+			if writer is None:
+				written = sum(write_slice(*item) for item in slices)
+			else:
+				written = writer.write_all(slices)
+		profiling.add_bytes_written(written)
+
+	logging.info(f"\twrote {len(filenames)} slices of '{stem}' to '{write_dir}'")
+	return filenames
+
+
+def _write_streamed(reader, boundaries, filenames, template):
+	""" Write slices in one pass over the raw blocks of a reader. Slices must be sorted and must not overlap. """
+	pending = iter(zip(filenames, boundaries))
+	current = next(pending, None)
+	span = (int(boundaries[0][0]), int(boundaries[-1][1])) if len(boundaries) else (0, 0)
+	slice_file = None
+	try:
+		for offset, block in reader.raw_blocks(start=span[0], stop=span[1]):
+			block_stop = offset + len(block)
+			while current is not None and current[1][0] < block_stop:
+				filename, (start, stop) = current
+				with profiling.stage('write'):
+					if slice_file is None:
+						slice_file = StreamedSlice(filename, template, stop - start)
+					slice_file.write(block[max(start, offset) - offset:min(stop, block_stop) - offset])
+					if stop > block_stop:
+						break
+					slice_file.close()
+					profiling.add_bytes_written(slice_file.bytes_written)
+					slice_file = None
+				current = next(pending, None)
+
+		# Empty slices past the last block
+		while current is not None:
+			with StreamedSlice(current[0], template, 0):
+				pass
+			current = next(pending, None)
+	finally:
+		if slice_file is not None:
+			slice_file.discard()
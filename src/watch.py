@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Watch directory trees for new or changed files, by polling.
+
+Each poll lists the trees and compares the (size, mtime) of every file against the previous poll. A created or
+modified file is handed out once it has stopped changing for a settle time and, optionally, once a check says
+it is complete, so files still being written are never picked up half-way.
+"""
+import logging
+import os
+import time
+
+
+def stat_snapshot(paths):
+	""" Take the (size, mtime) of each file.
+	:param paths: An iterable of files.
+	:return: The (size, mtime in ns) of each file that could be stat'ed.
+	:rtype: dict
+	"""
+	snapshot = {}
+	for path in paths:
+		try:
+			stat = os.stat(path)
+		except OSError:
+			continue
+		snapshot[path] = (stat.st_size, stat.st_mtime_ns)
+	return snapshot
+
+
+def watch_changes(list_files, interval=2.0, settle=2.0, is_complete=None, polls=None, sleep=time.sleep):
+	""" Poll for created or modified files. Files present at the first poll are taken as already handled.
+	:param list_files: A function returning an iterable of the watched files, e.g. a new file_iterator.
+	:param interval: Seconds between polls.
+	:param settle: Seconds a file must stay unchanged before it is handed out.
+	:param is_complete: A function telling whether a settled file is complete. Everything is complete if None.
+	:param polls: Number of polls after the first one, e.g. for testing. Polls forever if None.
+	:param sleep: The function to wait between polls with.
+	:return: A generator of lists of files that are ready, one list per poll with any.
+	:rtype: list
+	"""
+	handled = stat_snapshot(list_files())
+	logging.info(f"Watching {len(handled)} files for changes.")
+	changing = {}  # file -> ((size, mtime), monotonic time it was last seen changing)
+
+	poll = 0
+	while polls is None or poll < polls:
+		poll += 1
+		sleep(interval)
+		now = time.monotonic()
+		current = stat_snapshot(list_files())
+
+		for path in handled.keys() - current.keys():
+			del handled[path]
+		for path in changing.keys() - current.keys():
+			del changing[path]
+
+		ready = []
+		for path, state in current.items():
+			if handled.get(path) == state:
+				continue
+			previous = changing.get(path)
+			if previous is None or previous[0] != state:
+				changing[path] = (state, now)
+			elif now - previous[1] >= settle and (is_complete is None or is_complete(path)):
+				del changing[path]
+				handled[path] = state
+				ready.append(path)
+
+		if ready:
+			logging.info(f"{len(ready)} new or changed files ready.")
+			yield ready
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Memory-mapped, block-streaming WAV reader.
+
+The sample data of a WAV file is never loaded as a whole. The data chunk is memory-mapped and handed out as
+fixed-size frame blocks, so peak memory is bounded by the block size rather than by the length of the file.
+"""
+from dataclasses import dataclass
+import os
+import struct
+
+import numpy as np
+
+from . import profiling
+
+# Default number of frames handed out per block (~1.4s of 48kHz audio)
+DEFAULT_BLOCK_FRAMES = 1 << 16
+
+_FORMAT_PCM = 0x0001
+_FORMAT_FLOAT = 0x0003
+_FORMAT_EXTENSIBLE = 0xFFFE
+_RF64_SIZE_PLACEHOLDER = 0xFFFFFFFF
+
+
+class WavFormatError(ValueError):
+	"""Raised when a file is not a WAV file this reader understands."""
+
+
+@dataclass(frozen=True)
+class WavInfo:
+	"""Header information of a WAV file."""
+	sample_rate: int
+	channels: int
+	bits_per_sample: int
+	is_float: bool
+	frames: int
+	data_offset: int
+	block_align: int
+
+	@property
+	def duration(self):
+		""" Duration of the audio in seconds.
+		:rtype: float
+		"""
+		return self.frames / self.sample_rate if self.sample_rate else 0.0
+
+	@property
+	def sample_width(self):
+		""" Number of bytes per sample.
+		:rtype: int
+		"""
+		return self.block_align // self.channels
+
+	@property
+	def dtype(self):
+		""" The NumPy dtype of the samples as stored on disk, or None for packed 24-bit PCM.
+		:rtype: np.dtype
+		"""
+		if self.is_float:
+			return np.dtype(f"<f{self.sample_width}")
+		if self.sample_width == 1:
+			return np.dtype('u1')
+		if self.sample_width in (2, 4, 8):
+			return np.dtype(f"<i{self.sample_width}")
+		return None
+
+	@property
+	def data_bytes(self):
+		""" Size of the sample data in bytes.
+		:rtype: int
+		"""
+		return self.frames * self.block_align
+
+
+def read_wav_info(filename):
+	""" Parse the header of a WAV file, without touching the sample data. A file holding less sample data than
+	its header announces, because it is truncated or still being written, has the frames it holds.
+	:param filename: The WAV file to parse.
+	:return: The header information of the file.
+	:rtype: WavInfo
+	"""
+	fmt, data_offset, data_size = _read_header(filename)
+	data_size = min(data_size, max(0, os.path.getsize(filename) - data_offset))
+	return _make_wav_info(filename, fmt, data_offset, data_size)
+
+
+def _read_header(filename):
+	""" Find the fmt chunk of a WAV file, and the offset and announced size of its data chunk. """
+	with open(filename, 'rb') as wav_file:
+		riff = wav_file.read(12)
+		if len(riff) < 12 or riff[8:12] != b'WAVE' or riff[0:4] not in (b'RIFF', b'RF64'):
+			raise WavFormatError(f"Not a RIFF/RF64 WAVE file: '{filename}'")
+		is_rf64 = riff[0:4] == b'RF64'
+
+		fmt = None
+		ds64_data_size = None
+		while True:
+			chunk_header = wav_file.read(8)
+			if len(chunk_header) < 8:
+				raise WavFormatError(f"No data chunk found: '{filename}'")
+			chunk_id, chunk_size = struct.unpack('<4sI', chunk_header)
+
+			if chunk_id == b'ds64':
+				ds64 = wav_file.read(chunk_size)
+				ds64_data_size = struct.unpack('<Q', ds64[8:16])[0]
+				wav_file.seek(chunk_size % 2, 1)
+			elif chunk_id == b'fmt ':
+				fmt = wav_file.read(chunk_size)
+				wav_file.seek(chunk_size % 2, 1)
+			elif chunk_id == b'data':
+				if fmt is None:
+					raise WavFormatError(f"Data chunk precedes fmt chunk: '{filename}'")
+				if is_rf64 and chunk_size == _RF64_SIZE_PLACEHOLDER and ds64_data_size is not None:
+					chunk_size = ds64_data_size
+				return fmt, wav_file.tell(), chunk_size
+			else:
+				wav_file.seek(chunk_size + chunk_size % 2, 1)
+
+
+def is_wav_complete(filename):
+	""" Check whether a WAV file has been completely written: its header parses, it has sample data, and the file
+	holds all of the data its header announces. Recorders typically finalize the header when they finish.
+	:param filename: The WAV file to check.
+	:rtype: bool
+	"""
+	try:
+		info = _make_wav_info(filename, *_read_header(filename))
+		return info.frames > 0 and info.data_offset + info.data_bytes <= os.path.getsize(filename)
+	except (OSError, WavFormatError, struct.error):
+		return False
+
+
+def prefetch(filename, offset, length):
+	""" Ask the OS to start reading a byte range of a file into the page cache, without waiting for it. Does
+	nothing where the platform has no posix_fadvise.
+	:param filename: The file to prefetch.
+	:param offset: Start of the byte range.
+	:param length: Length of the byte range.
+	"""
+	if not hasattr(os, 'posix_fadvise') or length <= 0:
+		return
+	fd = os.open(filename, os.O_RDONLY)
+	try:
+		os.posix_fadvise(fd, offset, length, os.POSIX_FADV_WILLNEED)
+	finally:
+		os.close(fd)
+
+
+def _make_wav_info(filename, fmt, data_offset, data_size):
+	if len(fmt) < 16:
+		raise WavFormatError(f"Truncated fmt chunk: '{filename}'")
+	format_tag, channels, sample_rate, _, block_align, bits_per_sample = struct.unpack('<HHIIHH', fmt[:16])
+	if format_tag == _FORMAT_EXTENSIBLE and len(fmt) >= 26:
+		format_tag = struct.unpack('<H', fmt[24:26])[0]
+	if format_tag not in (_FORMAT_PCM, _FORMAT_FLOAT):
+		raise WavFormatError(f"Unsupported WAV format tag {format_tag:#06x}: '{filename}'")
+	if channels == 0 or block_align == 0 or block_align % channels:
+		raise WavFormatError(f"Invalid channel layout: '{filename}'")
+
+	sample_width = block_align // channels
+	if sample_width not in ((4, 8) if format_tag == _FORMAT_FLOAT else (1, 2, 3, 4, 8)):
+		raise WavFormatError(f"Unsupported sample width {sample_width}: '{filename}'")
+
+	return WavInfo(sample_rate=sample_rate, channels=channels, bits_per_sample=bits_per_sample,
+				   is_float=format_tag == _FORMAT_FLOAT, frames=data_size // block_align,
+				   data_offset=data_offset, block_align=block_align)
+
+
+def frame_range(start, stop, frames):
+	""" Clamp the frame range of a block iterator to the frames of a file.
+	:param start: First frame to read.
+	:param stop: Frame to stop reading at. End of file if None.
+	:param frames: The number of frames of the file.
+	:rtype: tuple[int, int]
+	"""
+	return max(start, 0), frames if stop is None else min(stop, frames)
+
+
+def normalize(block, info, out=None):
+	""" Convert a block of stored samples to float32 in the range [-1, 1].
+	:param block: Samples as returned by WavReader.blocks().
+	:param info: The header information of the file the block came from.
+	:param out: An optional float32 array of the same shape to write into.
+	:return: The normalized samples.
+	:rtype: np.ndarray
+	"""
+	out = np.empty(block.shape, dtype=np.float32) if out is None else out
+	if info.is_float:
+		np.copyto(out, block, casting='unsafe')
+	elif info.sample_width == 1:
+		np.subtract(block, np.float32(128), out=out)
+		out *= 1 / 128
+	else:
+		# 24-bit blocks are left-aligned into int32, so they scale like 32-bit.
+		bits = 32 if info.sample_width == 3 else 8 * info.sample_width
+		np.multiply(block, np.float32(2.0 ** (1 - bits)), out=out, casting='unsafe')
+	return out
+
+
+def denormalize(block, info):
+	""" Convert a block of float samples in the range [-1, 1] to the dtype WavReader.blocks() uses for a format,
+	rounding and clipping to the range of the format. The inverse of normalize().
+	:param block: Float samples shaped (frames, channels).
+	:param info: The header information of the format.
+	:return: The samples in their stored dtype.
+	:rtype: np.ndarray
+	"""
+	if info.is_float:
+		return block.astype(info.dtype, copy=False)
+	# Packed 24-bit samples are left-aligned into int32
+	bits = 8 * info.sample_width
+	scale = 2.0 ** (bits - 1)
+	samples = np.clip(np.rint(block * np.float64(scale) if bits > 16 else block * np.float32(scale)), -scale, scale - 1)
+	if info.sample_width == 1:
+		return (samples + 128).astype(np.uint8)
+	if info.sample_width == 3:
+		return samples.astype(np.int32) << 8
+	return samples.astype(info.dtype)
+
+
+def to_raw(block, info):
+	""" Lay out a block of samples, as returned by WavReader.blocks(), as the frame bytes of a WAV file.
+	:param block: Samples shaped (frames, channels), in their stored dtype.
+	:param info: The header information of the format.
+	:return: A contiguous array shaped (frames, block_align).
+	:rtype: np.ndarray
+	"""
+	raw = block.astype(block.dtype.newbyteorder('<'), copy=False).view(np.uint8)
+	if info.sample_width == 3:
+		raw = raw.reshape(len(block), info.channels, 4)[:, :, 1:]
+	return np.ascontiguousarray(raw).reshape(len(block), info.block_align)
+
+
+class WavReader:
+	""" Memory-mapped WAV reader, handing out the sample data as blocks of frames.
+	The blocks are views into the mapping wherever the sample format allows it. Use as a context manager.
+	"""
+
+	def __init__(self, filename, block_frames=DEFAULT_BLOCK_FRAMES):
+		"""
+		:param filename: The WAV file to open.
+		:param block_frames: Default number of frames per block.
+		"""
+		self.filename = filename
+		self.info = read_wav_info(filename)
+		self.block_frames = block_frames
+		self._raw = None
+		if self.info.frames:
+			self._raw = np.memmap(filename, dtype=np.uint8, mode='r', offset=self.info.data_offset,
+								  shape=(self.info.frames, self.info.block_align))
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
+
+	def __len__(self):
+		return self.info.frames
+
+	def close(self):
+		"""Release the memory mapping. Views handed out before keep it alive until they are dropped."""
+		self._raw = None
+
+	@property
+	def raw(self):
+		""" The sample data as stored on disk, shaped (frames, block_align) bytes.
+		:rtype: np.ndarray
+		"""
+		if self._raw is None:
+			return np.empty((0, self.info.block_align), dtype=np.uint8)
+		return self._raw
+
+	@property
+	def samples(self):
+		""" The sample data shaped (frames, channels), or None if the format can't be viewed directly (24-bit).
+		:rtype: np.ndarray
+		"""
+		dtype = self.info.dtype
+		if dtype is None:
+			return None
+		return self.raw.view(dtype)
+
+	def _block_ranges(self, block_frames, start, stop):
+		block_frames = block_frames or self.block_frames
+		start, stop = frame_range(start, stop, self.info.frames)
+		for block_start in range(start, stop, block_frames):
+			yield block_start, min(block_start + block_frames, stop)
+
+	def raw_blocks(self, block_frames=None, start=0, stop=None):
+		""" Iterate over blocks of raw frame bytes.
+		:param block_frames: Number of frames per block. Reader default if None.
+		:param start: First frame to read.
+		:param stop: Frame to stop reading at. End of file if None.
+		:return: A generator of (frame offset, view shaped (frames, block_align)) tuples.
+		:rtype: tuple[int, np.ndarray]
+		"""
+		return profiling.timed_iter('decode', self._raw_blocks(block_frames, start, stop))
+
+	def _raw_blocks(self, block_frames, start, stop):
+		raw = self.raw
+		for block_start, block_stop in self._block_ranges(block_frames, start, stop):
+			block = raw[block_start:block_stop]
+			profiling.add_bytes_read(block.nbytes)
+			yield block_start, block
+
+	def blocks(self, block_frames=None, start=0, stop=None):
+		""" Iterate over blocks of samples, in their stored dtype. Packed 24-bit samples are decoded into the
+		upper bytes of int32, which is the only case where a block is a copy rather than a view.
+		:param block_frames: Number of frames per block. Reader default if None.
+		:param start: First frame to read.
+		:param stop: Frame to stop reading at. End of file if None.
+		:return: A generator of (frame offset, array shaped (frames, channels)) tuples.
+		:rtype: tuple[int, np.ndarray]
+		"""
+		return profiling.timed_iter('decode', self._blocks(block_frames, start, stop))
+
+	def _blocks(self, block_frames, start, stop):
+		dtype = self.info.dtype
+		for block_start, raw_block in self._raw_blocks(block_frames, start, stop):
+			if dtype is not None:
+				yield block_start, raw_block.view(dtype)
+			else:
+				yield block_start, _unpack_int24(raw_block, self.info.channels)
+
+	def float_blocks(self, block_frames=None, start=0, stop=None):
+		""" Iterate over blocks of samples, normalized to float32 in the range [-1, 1].
+		:param block_frames: Number of frames per block. Reader default if None.
+		:param start: First frame to read.
+		:param stop: Frame to stop reading at. End of file if None.
+		:return: A generator of (frame offset, array shaped (frames, channels)) tuples.
+		:rtype: tuple[int, np.ndarray]
+		"""
+		return profiling.timed_iter('decode', self._float_blocks(block_frames, start, stop))
+
+	def _float_blocks(self, block_frames, start, stop):
+		for block_start, block in self._blocks(block_frames, start, stop):
+			yield block_start, normalize(block, self.info)
+
+
+def _unpack_int24(raw_block, channels):
+	frames = raw_block.shape[0]
+	packed = raw_block.reshape(frames, channels, 3)
+	unpacked = np.zeros((frames, channels, 4), dtype=np.uint8)
+	unpacked[:, :, 1:] = packed
+	return unpacked.view('<i4').reshape(frames, channels)
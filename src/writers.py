@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# -----------------------------------------------------------------------------
+#   Copyright © <2022> Andrew Moe
+# -----------------------------------------------------------------------------
+""" Slice file formats (WAV, AIFF, AIFC) and a batching, thread-pooled slice writer.
+
+Headers are built once per source file as a template, and only their size fields are patched per slice.
+Sample data is written from views into the source wherever the output format stores it as the source does
+(WAV, and little-endian 'sowt' AIFC); otherwise it is re-encoded in chunks while it is written (big-endian
+AIFF). Small slices are written with a single write call, and slices are handed to the writer threads in
+batches, so thousands of tiny slices don't cost a thread hand-off each. Every file is written under a
+temporary name and renamed into place once complete, so a crash never leaves a partial slice behind.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+from pathlib import Path
+import struct
+import threading
+
+import numpy as np
+
+WRITE_FORMATS = ('wav', 'aiff', 'aifc')
+
+# Default number of writer threads of a SliceWriter
+DEFAULT_WRITE_THREADS = 4
+
+# Slices are handed to the writer threads in batches of about this many bytes
+DEFAULT_BATCH_BYTES = 1 << 20
+
+# Slices smaller than this are joined with their header into a single write
+_SMALL_SLICE_BYTES = 64 << 10
+
+# Frames re-encoded at a time, for formats that can't be written from the source bytes
+_ENCODE_CHUNK_FRAMES = 1 << 16
+
+_WAV_FORMAT_PCM = 0x0001
+_WAV_FORMAT_FLOAT = 0x0003
+_AIFC_VERSION = 0xA2805140
+_TMP_SUFFIX = '.tmp'
+
+
+def wav_header(info, frames):
+	""" Build a canonical WAV header for the given number of frames in the format of a source file.
+	:param info: The WavInfo of the source file.
+	:param frames: The number of frames that will follow the header.
+	:return: The header bytes.
+	:rtype: bytes
+	"""
+	data_bytes = frames * info.block_align
+	fmt = struct.pack('<HHIIHH', _WAV_FORMAT_FLOAT if info.is_float else _WAV_FORMAT_PCM, info.channels,
+					  info.sample_rate, info.sample_rate * info.block_align, info.block_align, info.bits_per_sample)
+	return b''.join((b'RIFF', struct.pack('<I', 4 + 8 + len(fmt) + 8 + data_bytes + data_bytes % 2), b'WAVE',
+					 b'fmt ', struct.pack('<I', len(fmt)), fmt,
+					 b'data', struct.pack('<I', data_bytes)))
+
+
+def _ieee_extended(value):
+	""" Encode a positive integer as the 80-bit IEEE extended float AIFF stores sample rates in. """
+	if value <= 0:
+		return bytes(10)
+	exponent = int(value).bit_length() - 1
+	return struct.pack('>HQ', 16383 + exponent, int(value) << (63 - exponent))
+
+
+def _aifc_compression(info):
+	""" The AIFC compression type and name that store a source format, and whether that is the source layout. """
+	if info.is_float:
+		return (b'fl32', b'32-bit floating point') if info.sample_width == 4 else (b'fl64', b'64-bit floating point')
+	if info.sample_width == 1:
+		return b'NONE', b'not compressed'
+	return b'sowt', b''
+
+
+def _pascal_string(text):
+	""" A Pascal string, padded to an even length. """
+	data = bytes([len(text)]) + text
+	return data + b'\x00' * (len(data) % 2)
+
+
+class HeaderTemplate:
+	""" The header of the slices of one source file in one output format, with size fields patched per slice. """
+
+	def __init__(self, info, fmt='wav'):
+		"""
+		:param info: The WavInfo of the source file.
+		:param fmt: The output format: 'wav', 'aiff' or 'aifc'.
+		"""
+		if fmt not in WRITE_FORMATS:
+			raise ValueError(f"Unsupported output format: '{fmt}'")
+		if fmt == 'aiff' and info.is_float:
+			raise ValueError("AIFF can't store floating point samples, write 'aifc' or 'wav' instead")
+		if fmt in ('aiff', 'aifc') and not info.is_float and info.sample_width == 8:
+			raise ValueError("AIFF and AIFC can't store 64-bit integer samples, write 'wav' instead")
+		self.info = info
+		self.fmt = fmt
+		if fmt == 'wav':
+			self._template = bytearray(wav_header(info, 0))
+			self._form_extra = len(self._template) - 8
+		else:
+			comm = struct.pack('>hIh', info.channels, 0, info.bits_per_sample) + _ieee_extended(info.sample_rate)
+			chunks = [b'COMM', None, comm]
+			if fmt == 'aifc':
+				compression, name = _aifc_compression(info)
+				chunks[2] += compression + _pascal_string(name)
+				chunks[0:0] = [b'FVER', struct.pack('>I', 4), struct.pack('>I', _AIFC_VERSION)]
+			chunks[chunks.index(None)] = struct.pack('>I', len(chunks[-1]))
+			self._template = bytearray(b''.join([b'FORM', bytes(4), b'AIFC' if fmt == 'aifc' else b'AIFF', *chunks,
+												 b'SSND', bytes(4), struct.pack('>II', 0, 0)]))
+			self._form_extra = len(self._template) - 8
+			self._frames_offset = self._template.index(b'COMM') + 10
+		self.suffix = f".{fmt}"
+
+	@property
+	def passthrough(self):
+		""" True if the output stores samples exactly as the source WAV layout does, so they need no re-encoding.
+		:rtype: bool
+		"""
+		return self.fmt == 'wav' or (self.fmt == 'aifc' and not self.info.is_float and self.info.sample_width > 1)
+
+	def build(self, frames):
+		""" The header of a slice.
+		:param frames: The number of frames of the slice.
+		:rtype: bytes
+		"""
+		data_bytes = frames * self.info.block_align
+		header = self._template.copy()
+		if self.fmt == 'wav':
+			struct.pack_into('<I', header, 4, self._form_extra + data_bytes + data_bytes % 2)
+			struct.pack_into('<I', header, len(header) - 4, data_bytes)
+		else:
+			struct.pack_into('>I', header, 4, self._form_extra + data_bytes + data_bytes % 2)
+			struct.pack_into('>I', header, self._frames_offset, frames)
+			struct.pack_into('>I', header, len(header) - 12, 8 + data_bytes)
+		return bytes(header)
+
+	def pad(self, frames):
+		""" The pad byte that keeps an odd-sized data chunk word-aligned, if it needs one.
+		:rtype: bytes
+		"""
+		return b'\x00' if frames * self.info.block_align % 2 else b''
+
+	def encode(self, raw):
+		""" Encode raw source frames, shaped (frames, block_align), in the output format.
+		:return: The raw frames themselves if the format stores them as they are, else an encoded copy.
+		:rtype: np.ndarray
+		"""
+		if self.passthrough:
+			return raw
+		if self.info.sample_width == 1:
+			# Unsigned WAV bytes to signed AIFF bytes
+			return np.bitwise_xor(raw, np.uint8(0x80))
+		width = self.info.sample_width
+		return raw.reshape(len(raw), self.info.channels, width)[:, :, ::-1].reshape(len(raw), self.info.block_align)
+
+
+def _write_encoded(slice_file, template, raw):
+	""" Write raw source frames to a file in the output format, encoding them in chunks if needed. """
+	written = 0
+	if template.passthrough:
+		return slice_file.write(raw)
+	for start in range(0, len(raw), _ENCODE_CHUNK_FRAMES):
+		written += slice_file.write(np.ascontiguousarray(template.encode(raw[start:start + _ENCODE_CHUNK_FRAMES])))
+	return written
+
+
+def write_slice(filename, template, raw):
+	""" Write one slice atomically: to a temporary file, renamed into place once complete.
+	:param filename: The slice file.
+	:param template: The HeaderTemplate of the output format.
+	:param raw: The raw source frames of the slice, shaped (frames, block_align).
+	:return: The number of bytes written.
+	:rtype: int
+	"""
+	tmp_filename = f"{filename}{_TMP_SUFFIX}"
+	frames = len(raw)
+	try:
+		with open(tmp_filename, 'wb') as slice_file:
+			if template.passthrough and raw.nbytes < _SMALL_SLICE_BYTES:
+				written = slice_file.write(b''.join((template.build(frames), raw, template.pad(frames))))
+			else:
+				written = slice_file.write(template.build(frames))
+				written += _write_encoded(slice_file, template, raw)
+				written += slice_file.write(template.pad(frames))
+		os.replace(tmp_filename, filename)
+	except BaseException:
+		_remove_quietly(tmp_filename)
+		raise
+	return written
+
+
+def _write_batch(batch):
+	""" Write a batch of slices. Runs in a writer thread. """
+	return sum(write_slice(filename, template, raw) for filename, template, raw in batch)
+
+
+def _remove_quietly(filename):
+	try:
+		os.remove(filename)
+	except OSError:
+		pass
+
+
+class StreamedSlice:
+	""" A slice written incrementally from blocks, for sources that can only be read front to back. Written to a
+	temporary file, renamed into place by close(). Use as a context manager.
+	"""
+
+	def __init__(self, filename, template, frames):
+		"""
+		:param filename: The slice file.
+		:param template: The HeaderTemplate of the output format.
+		:param frames: The number of frames that will be written.
+		"""
+		self.filename = Path(filename)
+		self.template = template
+		self.frames = frames
+		self.bytes_written = 0
+		self._tmp_filename = f"{filename}{_TMP_SUFFIX}"
+		self._file = open(self._tmp_filename, 'wb')  # pylint: disable=consider-using-with
+		self.bytes_written += self._file.write(template.build(frames))
+
+	def write(self, raw):
+		""" Append raw source frames, shaped (frames, block_align).
+		:return: The number of bytes written.
+		:rtype: int
+		"""
+		written = _write_encoded(self._file, self.template, raw)
+		self.bytes_written += written
+		return written
+
+	def close(self):
+		""" Finish the slice, and rename it into place. """
+		if self._file is None:
+			return
+		self.bytes_written += self._file.write(self.template.pad(self.frames))
+		self._file.close()
+		self._file = None
+		os.replace(self._tmp_filename, self.filename)
+
+	def discard(self):
+		""" Abandon the slice, removing its temporary file. """
+		if self._file is not None:
+			self._file.close()
+			self._file = None
+			_remove_quietly(self._tmp_filename)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, *exc_info):
+		if exc_type is None:
+			self.close()
+		else:
+			self.discard()
+
+
+class SliceWriter:
+	""" Writes slices on a bounded pool of threads, in batches. Safe to share between threads; each write_all()
+	call waits for its own slices only. Use as a context manager, or close() when done.
+	"""
+
+	def __init__(self, workers=DEFAULT_WRITE_THREADS, batch_bytes=DEFAULT_BATCH_BYTES):
+		"""
+		:param workers: Number of writer threads.
+		:param batch_bytes: Slices are handed to the threads in batches of about this many bytes.
+		"""
+		self.batch_bytes = batch_bytes
+		self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='gcrslicer-slice-writer')
+		# Bounds the batches queued, so producers wait for the disk rather than buffer without limit
+		self._slots = threading.BoundedSemaphore(workers * 2)
+
+	def _submit(self, batch):
+		self._slots.acquire()  # pylint: disable=consider-using-with
+		future = self._executor.submit(_write_batch, batch)
+		future.add_done_callback(lambda _: self._slots.release())
+		return future
+
+	def write_all(self, slices):
+		""" Write slices atomically, and wait until all of them are written.
+		:param slices: An iterable of (filename, HeaderTemplate, raw source frames) tuples.
+		:return: The number of bytes written.
+		:rtype: int
+		"""
+		futures = []
+		batch, batch_bytes = [], 0
+		for filename, template, raw in slices:
+			batch.append((filename, template, raw))
+			batch_bytes += raw.nbytes
+			if batch_bytes >= self.batch_bytes:
+				futures.append(self._submit(batch))
+				batch, batch_bytes = [], 0
+		if batch:
+			futures.append(self._submit(batch))
+		# Wait for every batch before raising, so no slice is still being written when the caller moves on
+		errors = [future.exception() for future in futures]
+		for error in errors:
+			if error is not None:
+				raise error
+		return sum(future.result() for future in futures)
+
+	def close(self):
+		""" Wait for pending writes, and stop the writer threads. """
+		self._executor.shutdown(wait=True)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc_info):
+		self.close()
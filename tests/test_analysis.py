@@ -0,0 +1,86 @@
+"""Unit test module for the frame-energy analysis."""
+from pathlib import Path
+import tempfile
+import unittest
+
+import numpy as np
+from scipy.io import wavfile
+
+from src.analysis import AnalysisParams, analyze, frame_energy, slice_regions
+from src.wavreader import WavReader
+
+
+def _bursts(sample_rate, layout, channels=1):
+	"""Build a signal of noise bursts and silences, from (seconds, amplitude) pairs."""
+	rng = np.random.default_rng(1)
+	parts = [rng.normal(0, amplitude, size=(int(seconds * sample_rate), channels)) for seconds, amplitude in layout]
+	return (np.concatenate(parts) * 32767).clip(-32768, 32767).astype(np.int16)
+
+
+class TestAnalysis(unittest.TestCase):
+	"""Unit test methods for the frame-energy analysis"""
+
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.path = Path(self.tmpdir.name)
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def _analyze(self, data, sample_rate=8000, params=AnalysisParams()):
+		filename = self.path / 'audio.wav'
+		wavfile.write(filename, sample_rate, data)
+		with WavReader(filename, block_frames=1000) as reader:
+			return analyze(reader, params)
+
+	def test_frame_energy(self):
+		"""Verify frame levels match a direct computation over each frame."""
+		data = _bursts(8000, [(1.0, 0.2)], channels=2)
+		filename = self.path / 'energy.wav'
+		wavfile.write(filename, 8000, data)
+		with WavReader(filename, block_frames=777) as reader:
+			rms, peak = frame_energy(reader, hop=80, overlap=2)
+		samples = data / np.float32(32768)
+		self.assertEqual(len(rms), 100)
+		np.testing.assert_allclose(rms[10], np.sqrt(np.mean(samples[800:960] ** 2)), rtol=1e-4)
+		np.testing.assert_allclose(peak[10], np.abs(samples[800:960]).max(), rtol=1e-6)
+
+	def test_bursts(self):
+		"""Verify each noise burst becomes one slice, bordered by silences."""
+		result = self._analyze(_bursts(8000, [(0.5, 0), (0.25, 0.3), (0.5, 0), (0.5, 0.3)]))
+		self.assertEqual(len(result.slices), 2)
+		np.testing.assert_allclose(result.slices, [[4000, 6000], [10000, 14000]], atol=result.hop)
+		self.assertEqual(len(result.silences), 2)
+
+	def test_onset_split(self):
+		"""Verify a sudden rise in level splits a sounding region at the onset."""
+		result = self._analyze(_bursts(8000, [(0.5, 0.01), (0.5, 0.3)]))
+		np.testing.assert_allclose(result.slices, [[0, 4000], [4000, 8000]], atol=result.hop)
+		self.assertIn(4000, result.onsets)
+
+	def test_short_gap_merged(self):
+		"""Verify silences shorter than the minimum don't split a slice."""
+		result = self._analyze(_bursts(8000, [(0.25, 0.3), (0.02, 0), (0.25, 0.3)]))
+		self.assertEqual(len(result.slices), 1)
+
+	def test_silence(self):
+		"""Verify a silent file yields no slices or onsets."""
+		result = self._analyze(np.zeros(8000, dtype=np.int16))
+		self.assertEqual((len(result.slices), len(result.onsets)), (0, 0))
+		np.testing.assert_array_equal(result.silences, [[0, 8000]])
+
+	def test_empty(self):
+		"""Verify a valid WAV file without frames yields no frames, silences or slices."""
+		result = self._analyze(np.zeros((0, 2), dtype=np.int16))
+		self.assertEqual((result.frames, len(result.rms), len(result.peak)), (0, 0, 0))
+		self.assertEqual((len(result.silences), len(result.onsets), len(result.slices)), (0, 0, 0))
+
+	def test_slice_regions(self):
+		"""Verify regions are split only at the onsets inside them."""
+		regions = np.array([[0, 10], [20, 30]])
+		np.testing.assert_array_equal(slice_regions(regions, np.array([5, 15, 20, 25])),
+									  [[0, 5], [5, 10], [20, 25], [25, 30]])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,51 @@
+"""Unit test module for process-pool batch execution."""
+import os
+import unittest
+
+from src.batch import run_batch
+
+
+def _square(value, offset=0):
+	"""Square a value, failing on negative values."""
+	if value < 0:
+		raise ValueError(f"negative value {value}")
+	return value * value + offset
+
+
+def _crash(value):
+	"""Kill the worker process on value 13."""
+	if value == 13:
+		os._exit(1)  # pylint: disable=protected-access
+	return value
+
+
+class TestBatch(unittest.TestCase):
+	"""Unit test methods for run_batch"""
+
+	def test_in_process(self):
+		"""Verify a single job runs in order and passes extra arguments."""
+		results = list(run_batch(_square, [1, 2, 3], jobs=1, args=(1,)))
+		self.assertEqual([r.value for r in results], [2, 5, 10])
+
+	def test_pool(self):
+		"""Verify every file is processed by the pool, exactly once."""
+		results = list(run_batch(_square, range(50), jobs=3))
+		self.assertEqual(sorted(r.value for r in results), [v * v for v in range(50)])
+
+	def test_errors_are_isolated(self):
+		"""Verify a failing file is reported without stopping the batch."""
+		results = {r.path: r for r in run_batch(_square, [2, -1, 3], jobs=2)}
+		self.assertTrue(results[2].ok and results[3].ok)
+		self.assertFalse(results[-1].ok)
+		self.assertIn('negative value', results[-1].error)
+
+	def test_worker_crash(self):
+		"""Verify a crashed worker fails its file and the batch carries on in a new pool."""
+		results = {r.path: r for r in run_batch(_crash, range(20), jobs=2)}
+		self.assertEqual(len(results), 20)
+		self.assertFalse(results[13].ok)
+		self.assertTrue(results[19].ok)
+
+
+if __name__ == '__main__':
+	unittest.main()
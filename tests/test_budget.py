@@ -0,0 +1,135 @@
+"""Unit test module for the memory budget."""
+from pathlib import Path
+import tempfile
+import threading
+import time
+import tracemalloc
+import unittest
+
+import numpy as np
+from scipy.io import wavfile
+
+from src.analysis import analyze
+from src.budget import MemoryBudget, parse_size, plan_blocks
+from src.gcrslicer import analyze_file, read_file, write_file
+from src.pipeline import Pipeline
+from src.resample import TargetFormat
+from src.wavreader import DEFAULT_BLOCK_FRAMES, WavReader, read_wav_info
+
+
+class TestBudget(unittest.TestCase):
+	"""Unit test methods for MemoryBudget and block planning"""
+
+	def test_parse_size(self):
+		"""Verify sizes parse with and without binary units."""
+		self.assertEqual(parse_size('65536'), 65536)
+		self.assertEqual(parse_size('512M'), 512 << 20)
+		self.assertEqual(parse_size('1.5GiB'), 3 << 29)
+		with self.assertRaises(ValueError):
+			parse_size('lots')
+
+	def test_plan_blocks(self):
+		"""Verify small files decode as one block, and large files stream in default-sized blocks."""
+		with tempfile.TemporaryDirectory() as tmpdir:
+			short, long = Path(tmpdir, 'short.wav'), Path(tmpdir, 'long.wav')
+			wavfile.write(short, 8000, np.zeros((200000, 2), dtype=np.int16))
+			wavfile.write(long, 8000, np.zeros((1 << 20, 2), dtype=np.int16))
+			short_info, long_info = read_wav_info(short), read_wav_info(long)
+
+		self.assertEqual(plan_blocks(short_info, 80)[0], 200000)
+		self.assertEqual(plan_blocks(short_info, 80, max_bytes=8 << 20)[0], DEFAULT_BLOCK_FRAMES)
+		block_frames, footprint = plan_blocks(long_info, 80)
+		self.assertEqual(block_frames, DEFAULT_BLOCK_FRAMES)
+		self.assertLess(footprint, long_info.frames * long_info.channels * 4)
+
+	def test_block_size_keeps_analysis(self):
+		"""Verify decoding a file as one block analyzes it exactly as streaming it does."""
+		rng = np.random.default_rng(0)
+		samples = (rng.standard_normal((200000, 2)) * np.repeat(rng.random(100) > 0.5, 2000)[:, None] * 8000)
+		with tempfile.TemporaryDirectory() as tmpdir:
+			filename = Path(tmpdir, 'take.wav')
+			wavfile.write(filename, 44100, samples.astype(np.int16))
+			with WavReader(filename, 1000) as streamed, WavReader(filename, 200000) as whole:
+				expected, actual = analyze(streamed), analyze(whole)
+		np.testing.assert_array_equal(actual.rms, expected.rms)
+		np.testing.assert_array_equal(actual.slices, expected.slices)
+
+	def test_optional_footprints(self):
+		"""Verify each optional stage adds its buffers to the footprint, and the estimate covers what they hold."""
+		rng = np.random.default_rng(2)
+		time_s = np.arange(441000) / 44100
+		gate = np.repeat(rng.random(200) > 0.5, 2205)[:, None]
+		samples = np.sin(2 * np.pi * 220 * time_s)[:, None] * gate * np.ones(2) * 8000
+		options = {'features': True, 'pitch': True, 'key': True, 'fingerprints': True,
+				   'target': TargetFormat(48000, 1)}
+		with tempfile.TemporaryDirectory() as tmpdir:
+			filename = Path(tmpdir, 'take.wav')
+			wavfile.write(filename, 44100, samples.astype(np.int16))
+			core = read_file(filename).footprint
+			for name, value in options.items():
+				self.assertGreater(read_file(filename, **{name: value}).footprint, core, name)
+
+			job = read_file(filename, **options)
+			tracemalloc.start()
+			try:
+				write_file(analyze_file(job), tmpdir, target=options['target'])
+				peak = tracemalloc.get_traced_memory()[1]
+			finally:
+				tracemalloc.stop()
+		self.assertLessEqual(peak, job.footprint)
+
+	def test_admission_order(self):
+		"""Verify reservations are admitted in arrival order, and oversized ones are clamped to run alone."""
+		budget = MemoryBudget(100)
+		self.assertEqual(budget.acquire(60), 60)
+		admitted = []
+
+		def acquire(name, nbytes):
+			admitted.append((name, budget.acquire(nbytes)))
+
+		large = threading.Thread(target=acquire, args=('large', 500))
+		large.start()
+		time.sleep(0.05)
+		small = threading.Thread(target=acquire, args=('small', 10))
+		small.start()
+		time.sleep(0.05)
+		self.assertEqual(admitted, [])
+
+		budget.release(60)
+		large.join()
+		self.assertEqual(admitted, [('large', 100)])
+		budget.release(100)
+		small.join()
+		self.assertEqual(admitted[1], ('small', 10))
+		self.assertEqual(budget.peak, 100)
+
+	def test_cancelled(self):
+		"""Verify a cancelled wait gives up its turn to the reservations behind it."""
+		budget = MemoryBudget(100)
+		budget.acquire(100)
+		cancelled = threading.Event()
+		cancelled.set()
+		self.assertIsNone(budget.acquire(50, cancelled))
+		budget.release(100)
+		self.assertEqual(budget.acquire(50), 50)
+
+	def test_pipeline_budget(self):
+		"""Verify the pipeline keeps the footprint of the files in flight within the budget."""
+		budget = MemoryBudget(100)
+		in_flight = []
+
+		def analyze_value(value):
+			in_flight.append(budget.in_use)
+			time.sleep(0.001)
+			return value
+
+		pipeline = Pipeline(lambda value: value, analyze_value, lambda value: value, analyzers=4, budget=budget,
+							footprint=lambda value: 30 + value % 3 * 20)
+		self.assertEqual(sorted(r.value for r in pipeline.run(range(30))), list(range(30)))
+		self.assertLessEqual(max(in_flight), 100)
+		self.assertLessEqual(budget.peak, 100)
+		self.assertEqual(budget.in_use, 0)
+
+
+if __name__ == '__main__':
+	unittest.main()
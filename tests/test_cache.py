@@ -0,0 +1,88 @@
+"""Unit test module for the analysis cache."""
+import os
+from pathlib import Path
+import tempfile
+import unittest
+
+import numpy as np
+from scipy.io import wavfile
+
+from src.analysis import AnalysisParams, analyze
+from src.cache import AnalysisCache
+from src.wavreader import WavReader
+
+
+class TestAnalysisCache(unittest.TestCase):
+	"""Unit test methods for the AnalysisCache"""
+
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.path = Path(self.tmpdir.name)
+		self.params = AnalysisParams()
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def _audio(self, name, frames=8000):
+		filename = self.path / name
+		wavfile.write(filename, 8000, np.random.default_rng(3).integers(-9000, 9000, frames).astype(np.int16))
+		with WavReader(filename) as reader:
+			return filename, analyze(reader, self.params)
+
+	def test_roundtrip(self):
+		"""Verify a stored result is returned unchanged."""
+		filename, result = self._audio('a.wav')
+		cache = AnalysisCache(self.path / 'cache')
+		self.assertIsNone(cache.get(filename, self.params))
+		cache.put(filename, self.params, result)
+		cached = cache.get(filename, self.params)
+		self.assertEqual((cached.sample_rate, cached.frames, cached.hop), (8000, 8000, result.hop))
+		np.testing.assert_array_equal(cached.rms, result.rms)
+		np.testing.assert_array_equal(cached.slices, result.slices)
+
+	def test_invalidation(self):
+		"""Verify an entry misses once the file or the analysis parameters change."""
+		filename, result = self._audio('a.wav')
+		cache = AnalysisCache(self.path / 'cache')
+		cache.put(filename, self.params, result)
+		self.assertIsNone(cache.get(filename, AnalysisParams(silence_db=-60.0)))
+
+		stat = filename.stat()
+		os.utime(filename, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+		self.assertIsNone(cache.get(filename, self.params))
+
+	def test_lru_eviction(self):
+		"""Verify the least recently used entries are evicted once the cache outgrows its bound."""
+		files = [self._audio(f"{index}.wav") for index in range(4)]
+		cache = AnalysisCache(self.path / 'cache', max_bytes=1 << 30)
+		for filename, result in files[:3]:
+			cache.put(filename, self.params, result)
+		entry_size = cache.entry_filename(files[0][0], self.params).stat().st_size
+
+		# Age the entries, then use the oldest one so it becomes the most recent.
+		for age, (filename, _) in enumerate(files[:3]):
+			os.utime(cache.entry_filename(filename, self.params), ns=(age, age))
+		self.assertIsNotNone(cache.get(files[0][0], self.params))
+
+		cache.max_bytes = int(entry_size * 3.5)
+		cache.put(files[3][0], self.params, files[3][1])
+		self.assertIsNotNone(cache.get(files[0][0], self.params))
+		self.assertIsNone(cache.get(files[1][0], self.params))
+		self.assertIsNotNone(cache.get(files[3][0], self.params))
+
+	def test_overwrite(self):
+		"""Verify storing an entry again replaces its size, instead of adding to the cache size and evicting early."""
+		files = [self._audio(f"{index}.wav") for index in range(3)]
+		cache = AnalysisCache(self.path / 'cache')
+		for filename, result in files:
+			cache.put(filename, self.params, result)
+		entry_size = cache.entry_filename(files[0][0], self.params).stat().st_size
+		cache.max_bytes = int(entry_size * 3.2)
+		cache.put(files[2][0], self.params, files[2][1])
+		self.assertEqual(cache._total_bytes, 3 * entry_size)  # pylint: disable=protected-access
+		for filename, _ in files:
+			self.assertIsNotNone(cache.get(filename, self.params))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,42 @@
+"""Unit test module for the synthetic benchmark corpus."""
+import filecmp
+from pathlib import Path
+import tempfile
+import unittest
+
+from benchmarks.corpus import SPEC_FILENAME, CorpusSpec, generate_corpus
+from benchmarks.run import corpus_meta
+from src.gcrslicer import SUPPORTED_READ_EXTENSIONS, file_iterator
+from src.wavreader import WavReader
+
+
+class TestCorpus(unittest.TestCase):
+	"""Unit test methods for generate_corpus"""
+
+	SPEC = CorpusSpec(one_shots=12, one_shot_seconds=(0.01, 0.05), long_files=1, long_file_seconds=2.0,
+					  tree_depth=2, tree_fanout=2)
+
+	def test_deterministic(self):
+		"""Verify the same spec and seed generate identical, readable corpora."""
+		with tempfile.TemporaryDirectory() as first, tempfile.TemporaryDirectory() as second:
+			self.assertEqual(generate_corpus(first, self.SPEC, seed=7), generate_corpus(second, self.SPEC, seed=7))
+			files = list(file_iterator([first], top='/', file_ext_filters=SUPPORTED_READ_EXTENSIONS))
+			self.assertEqual(len(files), 13)
+			self.assertTrue(filecmp.cmp(Path(first, SPEC_FILENAME), Path(second, SPEC_FILENAME), shallow=False))
+			for file in files:
+				twin = Path(second, Path(file).relative_to(first))
+				self.assertTrue(filecmp.cmp(file, twin, shallow=False), msg=f"{file} differs from {twin}")
+				with WavReader(file) as reader:
+					self.assertGreater(reader.info.frames, 0)
+
+	def test_reused_spec(self):
+		"""Verify a reused corpus is described by the spec and seed it was generated with, and others as external."""
+		with tempfile.TemporaryDirectory() as generated, tempfile.TemporaryDirectory() as external:
+			generate_corpus(generated, self.SPEC, seed=7)
+			self.assertEqual(corpus_meta(generated), {'preset': None, 'seed': 7, 'corpus': {
+				**self.SPEC.to_dict(), 'one_shot_seconds': list(self.SPEC.one_shot_seconds)}})
+			self.assertEqual(corpus_meta(external), {'preset': None, 'seed': None, 'corpus': 'external'})
+
+
+if __name__ == '__main__':
+	unittest.main()
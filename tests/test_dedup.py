@@ -0,0 +1,98 @@
+"""Unit test module for near-duplicate slice detection."""
+from pathlib import Path
+import tempfile
+import unittest
+
+import numpy as np
+from scipy.io import wavfile
+
+from src.analysis import analyze
+from src.dedup import FingerprintIndex, SliceFingerprints, slice_fingerprints
+from src.gcrslicer import main, parse_args
+from src.slicer import source_stem
+from src.wavreader import WavReader
+
+
+class TestDedup(unittest.TestCase):
+	"""Unit test methods for slice_fingerprints and FingerprintIndex"""
+
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.path = Path(self.tmpdir.name)
+		(self.path / 'sources').mkdir()
+		(self.path / 'slices').mkdir()
+		rate = 22050
+		rng = np.random.default_rng(8)
+		time = np.arange(rate // 2) / rate
+		hit = rng.uniform(-1, 1, len(time)) * np.exp(-time * 12)
+		swell = rng.uniform(-1, 1, len(time)) * np.minimum(time * 4, 1) * np.exp(-time * 3)
+		tone = np.sin(2 * np.pi * 330 * time) * np.exp(-time * 6)
+		# A hit, a swell, the hit quieter, a tone, and the hit with a little noise
+		parts = [hit, swell, hit * 0.5, tone, hit + rng.normal(0, 0.003, len(time))]
+		silence = np.zeros(rate // 4)
+		audio = np.concatenate([part for sound in parts for part in (silence, 0.8 * sound)] + [silence])
+		self.filename = self.path / 'sources' / 'hits.wav'
+		wavfile.write(self.filename, rate, (audio * 32767).astype(np.int16))
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def test_fingerprints(self):
+		"""Verify a quieter and a noisier copy of a slice are found as its duplicates, and other slices aren't."""
+		with WavReader(self.filename) as reader:
+			fingerprints = slice_fingerprints(reader, analyze(reader))
+		self.assertEqual(fingerprints.fingerprint.dtype, np.uint64)
+		index = FingerprintIndex()
+		name = str(self.filename)
+		self.assertEqual(index.add(name, fingerprints), {2: (name, 0), 4: (name, 0)})
+		self.assertEqual(len(index), 3)
+		self.assertEqual(index.add('copy.wav', fingerprints), {i: (name, [0, 1, 0, 3, 0][i]) for i in range(5)})
+
+	def test_bands(self):
+		"""Verify fingerprints within the maximum distance are found through the LSH bands, and farther ones not."""
+		rng = np.random.default_rng(1)
+		originals = rng.integers(0, 2 ** 63, 1000, dtype=np.uint64)
+		index = FingerprintIndex()
+		unpitched = np.full(2000, np.nan, np.float32)
+		self.assertEqual(index.add('originals', SliceFingerprints(originals, np.ones(1000, np.float32),
+																  unpitched[:1000])), {})
+		# Three flipped bits, one in each of three bands, then one more in the last band
+		near = originals ^ np.uint64((1 << 3) | (1 << 20) | (1 << 40))
+		far = near ^ np.uint64(1 << 60)
+		duplicates = index.add('near', SliceFingerprints(np.concatenate((near, far)), np.ones(2000, np.float32),
+														 unpitched))
+		self.assertEqual(duplicates, {i: ('originals', i) for i in range(1000)})
+		longer = index.add('longer', SliceFingerprints(originals[:1], np.full(1, 2, np.float32), unpitched[:1]))
+		self.assertEqual(longer, {})
+		pitched = index.add('pitched', SliceFingerprints(originals[:1], np.ones(1, np.float32), np.full(1, 440.0)))
+		self.assertEqual(pitched, {})
+
+	def test_pitches(self):
+		"""Verify hits of different pitches with the same envelope aren't duplicates, and the same pitch again is."""
+		rate = 22050
+		time = np.arange(rate // 2) / rate
+		silence = np.zeros(rate // 4)
+		frequencies = [110, 220, 233, 330, 440, 466, 880, 1760, 440]
+		audio = np.concatenate([part for frequency in frequencies
+								for part in (silence, 0.8 * np.sin(2 * np.pi * frequency * time) * np.exp(-time * 6))])
+		filename = self.path / 'notes.wav'
+		wavfile.write(filename, rate, (np.append(audio, silence) * 32767).astype(np.int16))
+		with WavReader(filename) as reader:
+			result = analyze(reader)
+			fingerprints = slice_fingerprints(reader, result)
+		self.assertEqual(len(result.slices), len(frequencies))
+		self.assertEqual(FingerprintIndex().add(filename, fingerprints), {8: (str(filename), 4)})
+
+	def test_skip(self):
+		"""Verify --dedup skip leaves duplicates unwritten, and the other slices keep their names."""
+		params = parse_args([str(self.path / 'sources'), '--write-dir', str(self.path / 'slices'), '--dedup', 'skip'])
+		with self.assertLogs(level='WARNING') as logs:
+			self.assertEqual(main(params), 0)
+		self.assertEqual(len(logs.records), 2)
+		stem = source_stem(self.filename)
+		self.assertEqual(sorted(path.name for path in (self.path / 'slices').iterdir()),
+						 [f"{stem}_0000.wav", f"{stem}_0001.wav", f"{stem}_0003.wav"])
+
+
+if __name__ == '__main__':
+	unittest.main()
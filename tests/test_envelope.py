@@ -0,0 +1,70 @@
+"""Unit test module for min/max envelopes."""
+from pathlib import Path
+import tempfile
+import unittest
+
+import numpy as np
+from scipy.io import wavfile
+
+from src.envelope import EnvelopePyramid, load_or_build_pyramid, minmax_envelope
+from src.wavreader import WavReader
+
+
+class TestEnvelope(unittest.TestCase):
+	"""Unit test methods for envelopes and envelope pyramids"""
+
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.path = Path(self.tmpdir.name)
+		self.data = np.random.default_rng(2).integers(-30000, 30000, size=(100003, 2)).astype(np.int16)
+		self.filename = self.path / 'noise.wav'
+		wavfile.write(self.filename, 44100, self.data)
+		self.samples = self.data / np.float32(32768)
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def _expected(self, samples_per_bin, start=0, stop=None):
+		samples = self.samples[start:stop]
+		bins = range(0, len(samples), samples_per_bin)
+		return (np.array([samples[i:i + samples_per_bin].min(axis=0) for i in bins]),
+				np.array([samples[i:i + samples_per_bin].max(axis=0) for i in bins]))
+
+	def test_minmax_envelope(self):
+		"""Verify each bin holds the extremes of its samples, including the partial last bin."""
+		with WavReader(self.filename, block_frames=4096) as reader:
+			mins, maxs = minmax_envelope(reader, 1000)
+		expected_mins, expected_maxs = self._expected(1000)
+		self.assertEqual(mins.shape, (101, 2))
+		np.testing.assert_allclose(mins, expected_mins)
+		np.testing.assert_allclose(maxs, expected_maxs)
+
+	def test_pyramid_query(self):
+		"""Verify a pyramid query agrees with an envelope computed from the samples."""
+		with WavReader(self.filename) as reader:
+			pyramid = EnvelopePyramid.build(reader, base=64, factor=4, min_bins=16)
+		self.assertGreater(len(pyramid.levels), 2)
+
+		samples_per_bin, first, mins, maxs = pyramid.query(100, start=1024, stop=50000)
+		self.assertLessEqual(len(mins), 100)
+		expected_mins, expected_maxs = self._expected(samples_per_bin, first, first + len(mins) * samples_per_bin)
+		np.testing.assert_allclose(mins, expected_mins)
+		np.testing.assert_allclose(maxs, expected_maxs)
+
+	def test_stored_pyramid(self):
+		"""Verify a stored pyramid is reused, and rebuilt once the file changes."""
+		pyramid_dir = self.path / 'pyramids'
+		with WavReader(self.filename) as reader:
+			built = load_or_build_pyramid(reader, pyramid_dir)
+			loaded = load_or_build_pyramid(reader, pyramid_dir)
+		self.assertEqual(len(built.levels), len(loaded.levels))
+		for (built_min, _), (loaded_min, _) in zip(built.levels, loaded.levels):
+			np.testing.assert_array_equal(built_min, loaded_min)
+
+		wavfile.write(self.filename, 44100, self.data[:5000])
+		with WavReader(self.filename) as reader:
+			self.assertEqual(load_or_build_pyramid(reader, pyramid_dir).frames, 5000)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,84 @@
+"""Unit test module for spectral feature extraction."""
+from pathlib import Path
+import tempfile
+import unittest
+
+import numpy as np
+from scipy.io import wavfile
+
+from src.features import FeatureParams, SliceFeatures, features_filename, frame_features
+from src.gcrslicer import main, parse_args
+from src.wavreader import WavReader
+
+
+class TestFeatures(unittest.TestCase):
+	"""Unit test methods for frame and slice features"""
+
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.path = Path(self.tmpdir.name)
+		self.rate = 16000
+		time = np.arange(self.rate) / self.rate
+		tone = 0.5 * np.sin(2 * np.pi * 1000 * time)
+		noise = np.random.default_rng(3).uniform(-0.5, 0.5, self.rate)
+		self.filename = self.path / 'tone_noise.wav'
+		wavfile.write(self.filename, self.rate, (np.concatenate((tone, noise)) * 32767).astype(np.int16))
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def test_tone_and_noise(self):
+		"""Verify a tone has its frequency as centroid and a flat spectrum only for noise."""
+		with WavReader(self.filename) as reader:
+			features = frame_features(reader).slice_features([[1600, 14400], [17600, 30400]])
+		tone, noise = 0, 1
+		self.assertAlmostEqual(features.centroid[tone], 1000, delta=50)
+		self.assertLess(features.flatness[tone], 0.01)
+		self.assertGreater(features.flatness[noise], 0.3)
+		self.assertGreater(features.centroid[noise], 3000)
+		self.assertEqual(features.bands.shape, (2, FeatureParams().n_bands))
+		self.assertEqual(features.mfcc.shape, (2, FeatureParams().n_mfcc))
+
+	def test_streaming(self):
+		"""Verify frame features don't depend on the block size the file is streamed in."""
+		with WavReader(self.filename, 1000) as small_blocks, WavReader(self.filename, 1 << 20) as one_block:
+			streamed, whole = frame_features(small_blocks), frame_features(one_block)
+		self.assertEqual(len(streamed.centroid), -(-2 * self.rate // streamed.hop))
+		for name in ('centroid', 'flatness', 'bands', 'mfcc'):
+			np.testing.assert_allclose(getattr(streamed, name), getattr(whole, name), rtol=1e-4, atol=1e-4)
+
+	def test_slice_means(self):
+		"""Verify slice features are the means of their frames' features, and survive a store round trip."""
+		with WavReader(self.filename) as reader:
+			frames = frame_features(reader)
+		boundaries = np.array([[0, 1600], [8000, 24000], [31990, 32000]])
+		features = frames.slice_features(boundaries)
+		np.testing.assert_allclose(features.mfcc[1], frames.mfcc[50:150].mean(axis=0), rtol=1e-5)
+		np.testing.assert_allclose(features.centroid[2], frames.centroid[-1], rtol=1e-5)
+
+		features.save(self.path / 'store.npz')
+		stored = SliceFeatures.load(self.path / 'store.npz')
+		np.testing.assert_array_equal(stored.boundaries, boundaries)
+		np.testing.assert_array_equal(stored.bands, features.bands)
+
+	def test_same_stem(self):
+		"""Verify files of the same name in different folders get their own feature stores."""
+		silence = np.zeros(self.rate // 2)
+		time = np.arange(self.rate) / self.rate
+		sources = {}
+		for folder, frequency in (('low', 300), ('high', 3000)):
+			sources[frequency] = self.path / 'sources' / folder / 'shot.wav'
+			sources[frequency].parent.mkdir(parents=True)
+			audio = np.concatenate((silence, 0.5 * np.sin(2 * np.pi * frequency * time), silence))
+			wavfile.write(sources[frequency], self.rate, (audio * 32767).astype(np.int16))
+		(self.path / 'features').mkdir()
+		self.assertEqual(main(parse_args([str(self.path / 'sources'), '--analyze', '--features-dir',
+										  str(self.path / 'features')])), 0)
+		self.assertEqual(len(list((self.path / 'features').iterdir())), 2)
+		for frequency, source in sources.items():
+			stored = SliceFeatures.load(features_filename(self.path / 'features', source))
+			self.assertAlmostEqual(float(stored.centroid[0]), frequency, delta=frequency * 0.1)
+
+
+if __name__ == '__main__':
+	unittest.main()
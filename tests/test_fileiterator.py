@@ -1,6 +1,8 @@
 """Unit test module for the FileIterator"""
 import itertools
+import os
 from pathlib import Path
+import tempfile
 import unittest
 
 from src.gcrslicer import file_iterator as FileIterator
@@ -129,6 +131,36 @@ class TestGCRFileIterator(unittest.TestCase):
 																	f"t:{fpi_list}) as expected (expected_"
 																	f"filelist:{expected_filelist}).")
 
+	def test_symlink_cycle(self):
+		"""Verify symlink cycles are not followed, and files reachable through several links are yielded once."""
+		with tempfile.TemporaryDirectory() as top:
+			os.makedirs(os.path.join(top, 'lib', 'kicks'))
+			Path(top, 'lib', 'kicks', 'kick.wav').touch()
+			Path(top, 'lib', 'snare.wav').touch()
+			os.symlink(os.path.join(top, 'lib'), os.path.join(top, 'lib', 'kicks', 'loop'))
+			os.symlink(os.path.join(top, 'lib', 'snare.wav'), os.path.join(top, 'lib', 'snare-link.wav'))
+
+			fpi = FileIterator(['lib/'], top=top, file_ext_filters=['wav'])
+			found_filelist = list(fpi)
+		expected_filelist = [Path('lib/snare-link.wav'), Path('lib/kicks/kick.wav')]
+
+		self.assertListEqual(found_filelist, expected_filelist, msg=f"Symlinked tree into FileIterator did not yield "
+																	f"(found_filelist:{found_filelist}) as expected "
+																	f"(expected_filelist:{expected_filelist}).")
+
+	def test_multi_suffix_filter(self):
+		"""Verify file extension filters match multi-part and upper case extensions."""
+		input_pathlist = ['data3/']  # must be strings
+		extension_filter = ['tar.xz', '.MP1']
+		expected_filelist = [Path('data3/oldaudio.mp1'), Path('data3/gabbaghoul/rottenm-eats.tar.xz')]
+
+		fpi = FileIterator(input_pathlist, file_ext_filters=extension_filter)
+		fpi_list = list(fpi)
+		self.assertListEqual(fpi_list, expected_filelist, msg=f"Inputs (input_path_list:{input_pathlist})"
+																	f" into FileIterator did not yield (found_filelis"
+																	f"t:{fpi_list}) as expected (expected_"
+																	f"filelist:{expected_filelist}).")
+
 
 if __name__ == '__main__':
 	unittest.main()
@@ -0,0 +1,87 @@
+"""Unit test module for the streaming FLAC reader."""
+from pathlib import Path
+import tempfile
+import threading
+import unittest
+
+import numpy as np
+
+from src.analysis import analyze
+from src.audio import open_audio
+from src.flacreader import flac_supported
+from src.profiling import profile_file
+from src.slicer import write_slices
+
+if flac_supported():
+	import soundfile
+
+
+@unittest.skipUnless(flac_supported(), "soundfile is not installed")
+class TestFlacReader(unittest.TestCase):
+	"""Unit test methods for FlacReader"""
+
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.path = Path(self.tmpdir.name)
+		rng = np.random.default_rng(0)
+		# Integer samples exactly representable at every tested bit depth, so both encoders store the same values
+		samples = rng.standard_normal((30000, 2)) * np.repeat(rng.random(30) > 0.5, 1000)[:, None] * (1 << 29)
+		self.samples = np.clip(samples, -(1 << 31), (1 << 31) - 1).astype(np.int32) & ~0xFFFFFF
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def _write(self, subtype):
+		"""Write the samples as a FLAC file and a WAV file of the same format."""
+		flac, wav = self.path / f"take_{subtype}.flac", self.path / f"take_{subtype}.wav"
+		soundfile.write(flac, self.samples, 44100, subtype=subtype)
+		soundfile.write(wav, self.samples, 44100, subtype=subtype if subtype != 'PCM_S8' else 'PCM_U8')
+		return flac, wav
+
+	def test_blocks_match_wav(self):
+		"""Verify FLAC blocks have the values and layout of the blocks of the same audio in a WAV file, and count as
+		many bytes read."""
+		for subtype in ('PCM_16', 'PCM_24', 'PCM_S8'):
+			flac, wav = self._write(subtype)
+			with open_audio(flac, 4096) as flac_reader, open_audio(wav, 4096) as wav_reader:
+				self.assertEqual(flac_reader.info.frames, wav_reader.info.frames)
+				self.assertEqual(flac_reader.info.block_align, wav_reader.info.block_align)
+				for name in ('raw_blocks', 'blocks', 'float_blocks'):
+					with profile_file(flac) as flac_profile:
+						flac_blocks = list(getattr(flac_reader, name)(start=1000, stop=25000))
+					with profile_file(wav) as wav_profile:
+						wav_blocks = list(getattr(wav_reader, name)(start=1000, stop=25000))
+					self.assertEqual(flac_profile.bytes_read, wav_profile.bytes_read)
+					self.assertEqual([offset for offset, _ in flac_blocks], [offset for offset, _ in wav_blocks])
+					np.testing.assert_array_equal(np.concatenate([block for _, block in flac_blocks]),
+												  np.concatenate([block for _, block in wav_blocks]))
+
+	def test_abandoned_iterator(self):
+		"""Verify the decoder thread stops when the consumer stops early."""
+		flac, _ = self._write('PCM_16')
+		threads = threading.active_count()
+		with open_audio(flac, 1000) as reader:
+			blocks = reader.float_blocks()
+			next(blocks)
+			blocks.close()
+		self.assertEqual(threading.active_count(), threads)
+
+	def test_slices_match_wav(self):
+		"""Verify slicing a FLAC file writes the same WAV slices as slicing the same audio in a WAV file."""
+		for channels in (1, 2):
+			self.samples = self.samples[:, :channels]
+			flac, wav = self._write('PCM_24')
+			(self.path / f"flac{channels}").mkdir()
+			(self.path / f"wav{channels}").mkdir()
+			with open_audio(flac, 3000) as flac_reader, open_audio(wav) as wav_reader:
+				result = analyze(wav_reader)
+				np.testing.assert_array_equal(analyze(flac_reader).slices, result.slices)
+				flac_slices = write_slices(flac_reader, result.slices, self.path / f"flac{channels}", 'take')
+				wav_slices = write_slices(wav_reader, result.slices, self.path / f"wav{channels}", 'take')
+			self.assertGreater(len(flac_slices), 1)
+			for flac_slice, wav_slice in zip(flac_slices, wav_slices):
+				self.assertEqual(flac_slice.read_bytes(), wav_slice.read_bytes())
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,75 @@
+"""Unit test module for key detection."""
+from pathlib import Path
+import tempfile
+import unittest
+
+import numpy as np
+from scipy.io import wavfile
+
+from src.gcrslicer import analyze_file, read_file
+from src.key import detect_key, file_chroma, key_templates, match_keys
+from src.wavreader import WavReader
+
+
+def _progression(rate, chords, seconds=0.5):
+	""" Synthesize chords given as MIDI notes, each held for seconds, with a few harmonics. """
+	time = np.arange(int(rate * seconds)) / rate
+	segments = []
+	for chord in chords:
+		hz = 440 * 2 ** ((np.array(chord)[:, None] - 69) / 12)
+		segments.append(sum(np.sin(2 * np.pi * k * hz * time).sum(axis=0) / k for k in (1, 2, 3)) / (2 * len(chord)))
+	return np.concatenate(segments)
+
+
+class TestKey(unittest.TestCase):
+	"""Unit test methods for detect_key"""
+
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.path = Path(self.tmpdir.name)
+		self.rate = 22050
+		# I-IV-V-I in C major, and i-iv-v-i in A minor
+		self.files = {'C major': [[60, 64, 67], [65, 69, 72], [67, 71, 74], [60, 64, 67, 72]],
+					  'A minor': [[57, 60, 64], [62, 65, 69], [64, 67, 71], [57, 60, 64, 69]]}
+		for key, chords in self.files.items():
+			audio = np.column_stack([_progression(self.rate, chords)] * 2)
+			wavfile.write(self.path / f"{key}.wav", self.rate, (audio * 32767).astype(np.int16))
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def test_keys(self):
+		"""Verify progressions are detected in their keys, relative major and minor told apart."""
+		for key in self.files:
+			with WavReader(self.path / f"{key}.wav") as reader:
+				estimate = detect_key(reader)
+			self.assertEqual(estimate.key, key)
+			self.assertGreater(estimate.score, 0.5)
+			self.assertAlmostEqual(float(estimate.chroma.sum()), 1, places=5)
+
+	def test_batch(self):
+		"""Verify matching a batch of chroma vectors equals matching them one by one, against cached templates."""
+		chromas = []
+		for key in self.files:
+			with WavReader(self.path / f"{key}.wav") as reader:
+				chromas.append(file_chroma(reader))
+		chromas = np.concatenate((chromas, np.random.default_rng(3).random((5, 12))))
+		keys, scores = match_keys(chromas)
+		self.assertEqual(keys[:2], list(self.files))
+		for chroma, key, score in zip(chromas, keys, scores):
+			self.assertEqual(match_keys(chroma)[0], [key])
+			self.assertAlmostEqual(float(match_keys(chroma)[1][0]), float(score), places=5)
+		self.assertIs(key_templates(), key_templates())
+		self.assertNotIn('C chromatic', key_templates()[0])
+
+	def test_silence(self):
+		"""Verify a silent file has no key, and the key is added to the analysis summary."""
+		wavfile.write(self.path / 'silence.wav', self.rate, np.zeros(self.rate, dtype=np.int16))
+		with WavReader(self.path / 'silence.wav') as reader:
+			self.assertEqual(detect_key(reader).summary(), {'key': '', 'key_score': 0.0})
+		summary = analyze_file(read_file(str(self.path / 'A minor.wav'), key=True)).summary()
+		self.assertEqual(summary['key'], 'A minor')
+
+
+if __name__ == '__main__':
+	unittest.main()
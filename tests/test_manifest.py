@@ -0,0 +1,83 @@
+"""Unit test module for the virtual slice manifest."""
+import filecmp
+from pathlib import Path
+import tempfile
+import unittest
+
+import numpy as np
+from scipy.io import wavfile
+
+from src.gcrslicer import main, parse_args, slice_audio
+from src.manifest import MANIFEST_FILENAME, SliceManifest
+from src.wavreader import WavReader
+
+
+class TestManifest(unittest.TestCase):
+	"""Unit test methods for SliceManifest"""
+
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.path = Path(self.tmpdir.name)
+		for directory in ('sources', 'index', 'sliced', 'materialized'):
+			(self.path / directory).mkdir()
+		rng = np.random.default_rng(6)
+		silence = np.zeros((12000, 2), dtype=np.int16)
+		for name in ('take', 'loop'):
+			bursts = [(rng.uniform(-0.5, 0.5, (9000, 2)) * 32767).astype(np.int16) for _ in range(3)]
+			audio = np.concatenate([part for burst in bursts for part in (silence, burst)] + [silence])
+			wavfile.write(self.path / 'sources' / f"{name}.wav", 24000, audio)
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def _index(self):
+		params = parse_args([str(self.path / 'sources'), '--write-dir', str(self.path / 'index'), '--manifest'])
+		self.assertEqual(main(params), 0)
+		return SliceManifest.load(self.path / 'index' / MANIFEST_FILENAME)
+
+	def test_index(self):
+		"""Verify --manifest indexes the slices of every file with their features, writing no audio."""
+		manifest = self._index()
+		self.assertEqual([path.name for path in (self.path / 'index').iterdir()], [MANIFEST_FILENAME])
+		self.assertEqual([Path(source).name for source in manifest.sources], ['loop.wav', 'take.wav'])
+		slices = manifest.slices
+		self.assertEqual(len(manifest), len(slices))
+		self.assertGreaterEqual(len(slices), 6)
+		np.testing.assert_array_equal(np.diff(slices['source']) >= 0, True)
+		self.assertTrue(np.isfinite(slices['mfcc']).all())
+		self.assertTrue(np.isnan(slices['pitch']).all())
+
+		with WavReader(self.path / 'sources' / 'take.wav') as reader:
+			for row in np.flatnonzero(slices['source'] == 1):
+				raw = manifest.raw(row)
+				self.assertIsInstance(raw, np.memmap)
+				np.testing.assert_array_equal(raw, reader.raw[slices['start'][row]:slices['stop'][row]])
+				self.assertEqual(manifest.samples(row).dtype, np.int16)
+		manifest.close()
+
+	def test_materialize(self):
+		"""Verify materialized slices equal those written directly, also for a subset of them."""
+		manifest = self._index()
+		sliced = slice_audio(self.path / 'sources' / 'take.wav', self.path / 'sliced')
+		rows = np.flatnonzero(manifest.slices['source'] == 1)[[2, 0]]
+		written = manifest.materialize(self.path / 'materialized', rows)
+		self.assertEqual([path.name for path in written], [sliced[2].name, sliced[0].name])
+		for path in written:
+			self.assertTrue(filecmp.cmp(path, self.path / 'sliced' / path.name, shallow=False))
+
+	def test_stale_source(self):
+		"""Verify adding again replaces a file's slices, and a changed source isn't served."""
+		manifest = self._index()
+		others = np.sum(manifest.slices['source'] != 0)
+		source = manifest.sources[0]
+		manifest.add(source, [[0, 100]])
+		self.assertEqual(len(manifest), others + 1)
+		wavfile.write(source, 24000, np.zeros((100, 2), dtype=np.int16))
+		with self.assertRaises(ValueError):
+			manifest.raw(0)
+		self.assertEqual(main(parse_args([str(self.path / 'sources'), '--write-dir', str(self.path / 'sources'),
+										  '--manifest', '--target-rate', '16000'])), 1)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,69 @@
+"""Unit test module for music_theory."""
+import os
+import subprocess
+import sys
+import unittest
+
+import numpy as np
+
+import music_theory
+
+
+class TestMusicTheory(unittest.TestCase):
+	"""Unit test methods for music_theory"""
+
+	def test_import_is_quiet(self):
+		"""Verify importing the module prints nothing and builds no tables."""
+		code = "import music_theory; print(music_theory.make_modes.cache_info().currsize, end='')"
+		output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+								cwd=os.path.dirname(music_theory.__file__))
+		self.assertEqual(output.stdout, '0')
+
+	def test_modes(self):
+		"""Verify the lazily built modes table."""
+		self.assertEqual(music_theory.modes['C']['Ionian'], ['C', 'D', 'E', 'F', 'G', 'A', 'B'])
+		self.assertEqual(music_theory.modes['D']['Dorian'], ['D', 'E', 'F', 'G', 'A', 'B', 'C'])
+		self.assertIs(music_theory.modes, music_theory.make_modes())
+		with self.assertRaises(AttributeError):
+			music_theory.missing_table  # pylint: disable=pointless-statement
+
+	def test_lookup(self):
+		"""Verify the note index and the memoized, read-only interval tables."""
+		self.assertEqual([music_theory.pitch_class(note) for note in ('C', 'B#', 'Dbb', 'Cb', 'G#', 'H')],
+						 [0, 0, 0, 11, 8, None])
+		self.assertEqual(music_theory.find_note_index(music_theory.notes, 'Ab'), 8)
+		table = music_theory.interval_table('Eb', 'major')
+		self.assertEqual((table['3'], table['b7'], table['#11']), ('G', 'Db', 'A'))
+		self.assertIs(music_theory.interval_table('Eb', 'major'), table)
+		self.assertEqual(music_theory.make_intervals('Eb', 'major'), dict(table))
+		with self.assertRaises(TypeError):
+			table['3'] = 'X'
+		self.assertEqual(music_theory.formula_notes('1,b3,5', 'F#'), ('F#', 'A', 'C#'))
+		self.assertIsNone(music_theory.make_intervals_major('Cb')['bb2'])
+		with self.assertRaises(ValueError):
+			music_theory.interval_table('H')
+
+	def test_masks(self):
+		"""Verify formulas become pitch-class masks, transposed by rotation."""
+		self.assertEqual(music_theory.formula_mask('1,3,5'), 0b000010010001)
+		self.assertEqual(music_theory.formula_mask('1,3,5,b7,9'), music_theory.pitch_class_mask([0, 4, 7, 10, 2]))
+		self.assertEqual(int(music_theory.transpose_masks(music_theory.formula_mask('1,3,5'), 9)),
+						 music_theory.pitch_class_mask([9, 1, 4]))
+
+	def test_match(self):
+		"""Verify batches of pitch-class sets and chroma vectors match their chords and scales."""
+		sets = music_theory.pitch_class_sets()
+		observed = [music_theory.pitch_class_mask(pcs) for pcs in ([2, 5, 9], [7, 11, 2, 5], [9, 1, 4])]
+		indexes, scores = sets.match(observed, kind='chords', top=2)
+		self.assertEqual([sets.label(i) for i in indexes[:, 0]], ['D minor', 'G dominant_7', 'A major'])
+		np.testing.assert_array_equal(scores[:, 0], 1)
+		self.assertTrue(np.all(scores[:, 1] < 1))
+
+		chroma = sets.templates[indexes[:, 0]] * 0.8 + np.random.default_rng(0).random((3, 12)) * 0.1
+		np.testing.assert_array_equal(sets.match(chroma, kind='chords')[0], indexes[:, :1])
+		indexes, _ = sets.match([music_theory.pitch_class_mask([0, 2, 4, 5, 7, 9, 11])], kind='scales')
+		self.assertEqual(sets.label(indexes[0, 0]), 'C major')
+
+
+if __name__ == '__main__':
+	unittest.main()
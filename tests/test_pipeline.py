@@ -0,0 +1,116 @@
+"""Unit test module for the read → analyze → write pipeline."""
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import os
+from pathlib import Path
+import tempfile
+import threading
+import time
+import unittest
+
+import numpy as np
+from scipy.io import wavfile
+
+from src.gcrslicer import main, parse_args, slice_audio
+from src.pipeline import Pipeline
+
+
+def _double(value):
+	"""Double a value, failing on negative values."""
+	if value < 0:
+		raise ValueError(f"negative value {value}")
+	return value * 2
+
+
+def _crash(value):
+	"""Kill the worker process on value 13 at once, while the other values take a while."""
+	if value == 13:
+		os._exit(1)  # pylint: disable=protected-access
+	time.sleep(0.05)
+	return value
+
+
+def _slow_write(value, delay=0.0):
+	"""Write stage that takes a while."""
+	time.sleep(delay)
+	return value + 1
+
+
+class TestPipeline(unittest.TestCase):
+	"""Unit test methods for Pipeline"""
+
+	def test_stages(self):
+		"""Verify every file passes through each stage exactly once, with threads or a process pool."""
+		for executor_factory in (None, partial(ProcessPoolExecutor, max_workers=2)):
+			pipeline = Pipeline(lambda value: value, _double, _slow_write, readers=3, analyzers=2, writers=2,
+								executor_factory=executor_factory)
+			results = list(pipeline.run(range(40)))
+			self.assertEqual(sorted(r.value for r in results), [v * 2 + 1 for v in range(40)])
+			self.assertEqual(pipeline.stats['results'].items, 40)
+
+	def test_errors_are_isolated(self):
+		"""Verify a failing file skips the later stages without stopping the pipeline."""
+		written = []
+
+		def write(value):
+			written.append(value)
+			return value
+
+		results = {r.path: r for r in Pipeline(lambda value: value, _double, write).run([2, -1, 3])}
+		self.assertTrue(results[2].ok and results[3].ok)
+		self.assertIn('negative value', results[-1].error)
+		self.assertEqual(sorted(written), [4, 6])
+
+	def test_worker_crash(self):
+		"""Verify only the file that kills a worker fails, not the files in flight with it."""
+		pipeline = Pipeline(lambda value: value, _crash, lambda value: value, analyzers=4,
+							executor_factory=partial(ProcessPoolExecutor, max_workers=4))
+		results = {r.path: r for r in pipeline.run(range(40))}
+		self.assertEqual(len(results), 40)
+		self.assertEqual([path for path, result in results.items() if not result.ok], [13])
+		self.assertIn('BrokenProcessPool', results[13].error)
+
+	def test_backpressure(self):
+		"""Verify a slow stage blocks the stages before it once its queue is full."""
+		pipeline = Pipeline(lambda value: value, _double, partial(_slow_write, delay=0.01), writers=1, queue_depth=1)
+		self.assertEqual(len(list(pipeline.run(range(20)))), 20)
+		self.assertGreater(pipeline.stats['analyze→write'].blocked_puts, 0)
+		self.assertGreater(pipeline.stats['analyze→write'].put_wait_s, 0.0)
+		self.assertLessEqual(pipeline.stats['analyze→write'].max_depth, 1)
+
+	def test_abandoned(self):
+		"""Verify the pipeline threads stop when results are no longer consumed."""
+		threads = threading.active_count()
+		results = Pipeline(lambda value: value, _double, _slow_write, queue_depth=1).run(range(1000))
+		next(results)
+		results.close()
+		self.assertEqual(threading.active_count(), threads)
+
+
+class TestPipelineCli(unittest.TestCase):
+	"""Unit test methods for slicing through the pipeline from the CLI"""
+
+	def test_write_dir(self):
+		"""Verify slicing files through the pipeline writes the same slices as slicing them one by one."""
+		rate = 8000
+		burst = np.concatenate([np.zeros(rate // 2), np.sin(np.arange(rate // 2) * 0.3) * 0.5])
+		with tempfile.TemporaryDirectory() as tmpdir:
+			tmpdir = Path(tmpdir)
+			for name in ('in', 'out', 'expected'):
+				(tmpdir / name).mkdir()
+			for index in range(4):
+				wavfile.write(tmpdir / 'in' / f"take{index}.wav", rate,
+							  (np.tile(burst, index + 2) * 32767).astype(np.int16))
+				slice_audio(tmpdir / 'in' / f"take{index}.wav", tmpdir / 'expected')
+
+			params = parse_args([str(tmpdir / 'in'), '--write-dir', str(tmpdir / 'out'), '--jobs', '2',
+								 '--queue-depth', '1'])
+			self.assertEqual(main(params), 0)
+			expected = sorted(path.name for path in (tmpdir / 'expected').iterdir())
+			self.assertEqual(sorted(path.name for path in (tmpdir / 'out').iterdir()), expected)
+			for name in expected:
+				self.assertEqual((tmpdir / 'out' / name).read_bytes(), (tmpdir / 'expected' / name).read_bytes())
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,61 @@
+"""Unit test module for batched pitch estimation."""
+from pathlib import Path
+import tempfile
+import unittest
+
+import numpy as np
+from scipy.io import wavfile
+
+from src.pitch import PITCH_BATCH, note_names, slice_pitches
+from src.slicer import write_slices
+from src.wavreader import WavReader
+
+
+class TestPitch(unittest.TestCase):
+	"""Unit test methods for slice_pitches"""
+
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.path = Path(self.tmpdir.name)
+		self.rate = 22050
+		self.frequencies = [55.0, 110.0, 261.63, 440.0, 466.16, 1318.51]
+		time = np.arange(self.rate // 4) / self.rate
+		tones = [0.4 * np.sin(2 * np.pi * f * time) + 0.2 * np.sin(4 * np.pi * f * time) for f in self.frequencies]
+		noise = np.random.default_rng(5).uniform(-0.5, 0.5, len(time))
+		segments = tones + [noise, np.zeros(len(time))]
+		edges = np.arange(len(segments) + 1) * len(time)
+		self.boundaries = np.column_stack((edges[:-1], edges[1:]))
+		self.filename = self.path / 'tones.wav'
+		wavfile.write(self.filename, self.rate, (np.concatenate(segments) * 32767).astype(np.int16))
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def test_tones(self):
+		"""Verify tones get their frequency and note name, and noise and silence none."""
+		with WavReader(self.filename) as reader:
+			pitches = slice_pitches(reader, self.boundaries)
+		np.testing.assert_allclose(pitches.frequency[:6], self.frequencies, rtol=0.005)
+		self.assertTrue(np.isnan(pitches.frequency[6:]).all())
+		self.assertEqual(pitches.names(), ['A1', 'A2', 'C4', 'A4', 'A#4', 'E6', '', ''])
+		self.assertEqual(pitches.summary()['pitched'], 6)
+
+	def test_batches(self):
+		"""Verify many short slices, spanning several batches, match their slices estimated alone."""
+		starts = np.arange(0, 6 * self.rate // 4 - 1000, 20)[:PITCH_BATCH * 2 + 7]
+		boundaries = np.column_stack((starts, starts + 20))
+		with WavReader(self.filename) as reader:
+			batched = slice_pitches(reader, boundaries).frequency
+			alone = [slice_pitches(reader, boundaries[i:i + 1]).frequency[0] for i in (0, PITCH_BATCH, len(starts) - 1)]
+		np.testing.assert_array_equal(batched[[0, PITCH_BATCH, len(starts) - 1]], alone)
+
+	def test_names(self):
+		"""Verify note names follow the pitch classes of music_theory, and tag slice file names."""
+		self.assertEqual(note_names([440.0, 27.5, 4186.0, np.nan, 0.0]), ['A4', 'A0', 'C8', '', ''])
+		with WavReader(self.filename) as reader:
+			written = write_slices(reader, self.boundaries[:2], self.path, 'tones', tags=['A1', ''])
+		self.assertEqual([path.name for path in written], ['tones_0000_A1.wav', 'tones_0001.wav'])
+
+
+if __name__ == '__main__':
+	unittest.main()
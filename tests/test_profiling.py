@@ -0,0 +1,76 @@
+"""Unit test module for per-stage profiling."""
+import csv
+import json
+from pathlib import Path
+import tempfile
+import time
+import unittest
+
+from src import profiling
+from src.profiling import ProfileReport, profile_file
+
+
+class TestProfiling(unittest.TestCase):
+	"""Unit test methods for stage profiling and reports"""
+
+	def test_disabled(self):
+		"""Verify instrumentation is a no-op without an open profile."""
+		blocks = [1, 2, 3]
+		self.assertIs(profiling.timed_iter('decode', blocks), blocks)
+		with profiling.stage('analyze'):
+			profiling.add_bytes_read(10)
+		with profile_file('a.wav', enabled=False) as profile:
+			self.assertIsNone(profile)
+
+	def test_exclusive_stages(self):
+		"""Verify nested stage time is counted only once, for the innermost stage."""
+		def slow_blocks():
+			for block in range(3):
+				time.sleep(0.01)
+				profiling.add_bytes_read(100)
+				yield block
+
+		with profile_file('a.wav') as profile:
+			with profiling.stage('analyze'):
+				self.assertEqual(list(profiling.timed_iter('decode', slow_blocks())), [0, 1, 2])
+			with profiling.stage('write'):
+				profiling.add_bytes_written(50)
+
+		self.assertEqual(profile.stages['decode'].calls, 4)
+		self.assertGreaterEqual(profile.stages['decode'].wall_s, 0.03)
+		self.assertLess(profile.stages['analyze'].wall_s, 0.01)
+		self.assertEqual((profile.bytes_read, profile.bytes_written), (300, 50))
+		self.assertGreaterEqual(profile.peak_rss_increase_bytes, 0)
+
+	def test_peak_increase(self):
+		"""Verify a file that allocates nothing reports no increase of the process peak, however high it is."""
+		with profile_file('a.wav') as profile:
+			pass
+		self.assertGreater(profiling.peak_rss_bytes(), 16 << 20)
+		self.assertLess(profile.peak_rss_increase_bytes, 16 << 20)
+
+	def test_report(self):
+		"""Verify the report aggregates files per stage, and writes JSON and CSV."""
+		report = ProfileReport()
+		for name in ('a.wav', 'b.wav'):
+			with profile_file(name) as profile:
+				with profiling.stage('analyze'):
+					pass
+			report.add(profile, scan=0.001)
+
+		with tempfile.TemporaryDirectory() as tmpdir:
+			report.write(Path(tmpdir, 'profile.json'))
+			report.write(Path(tmpdir, 'profile.csv'))
+			with open(Path(tmpdir, 'profile.json'), encoding='utf-8') as json_file:
+				stored = json.load(json_file)
+			with open(Path(tmpdir, 'profile.csv'), encoding='utf-8') as csv_file:
+				rows = list(csv.DictReader(csv_file))
+
+		self.assertEqual(stored['aggregate']['analyze']['files'], 2)
+		self.assertEqual(sum(stored['aggregate']['scan']['histogram'].values()), 2)
+		self.assertEqual({(row['path'], row['stage']) for row in rows},
+						 {(name, stage) for name in ('a.wav', 'b.wav') for stage in ('analyze', 'other', 'scan')})
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,81 @@
+"""Unit test module for headless waveform rendering."""
+import os
+from pathlib import Path
+import tempfile
+import unittest
+
+import numpy as np
+from matplotlib.image import imread
+from scipy.io import wavfile
+
+from src.envelope import file_envelope
+from src.gcrslicer import RC, main, parse_args
+from src.render import THUMBNAIL_HEIGHT, THUMBNAIL_WIDTH, WaveformCanvas, plot_filename
+from src.wavreader import WavInfo, WavReader
+
+
+class TestRender(unittest.TestCase):
+	"""Unit test methods for WaveformCanvas and --plot-dir"""
+
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.path = Path(self.tmpdir.name)
+		(self.path / 'sources').mkdir()
+		(self.path / 'plots').mkdir()
+		rng = np.random.default_rng(10)
+		self.files = []
+		for name, frames, channels in (('stereo', 30000, 2), ('mono', 5000, 1), ('quad', 12000, 4), ('empty', 0, 2)):
+			audio = (rng.uniform(-0.8, 0.8, (frames, channels)) * 32767).astype(np.int16)
+			self.files.append(self.path / 'sources' / f"{name}.wav")
+			wavfile.write(self.files[-1], 22050, audio)
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def _render(self, canvas, audio_filename, image_filename):
+		with WavReader(audio_filename) as reader:
+			envelope = file_envelope(reader, canvas.width)
+			canvas.render(image_filename, reader.info, *envelope, title=audio_filename.name)
+		return imread(image_filename)
+
+	def test_reused_canvas(self):
+		"""Verify a reused canvas renders each file as a fresh one does, with nothing left from earlier files."""
+		fresh = [self._render(WaveformCanvas(), file, self.path / f"fresh{index}.png")
+				 for index, file in enumerate(self.files)]
+		canvas = WaveformCanvas()
+		for index, file in enumerate(self.files + self.files[::-1]):
+			image = self._render(canvas, file, self.path / 'reused.png')
+			self.assertEqual(image.shape[:2], (THUMBNAIL_HEIGHT, THUMBNAIL_WIDTH))
+			np.testing.assert_array_equal(image, fresh[self.files.index(file)])
+		self.assertEqual(len(canvas.axes.patches), 4)
+
+	def test_grid_below_envelope(self):
+		"""Verify the gridlines are drawn below the envelope, so a full-scale envelope hides them."""
+		canvas = WaveformCanvas()
+		full = np.ones((100, 1), np.float32)
+		canvas.render(self.path / 'full.png', WavInfo(8000, 1, 16, False, 8000, 0, 2), 80, 0, -full, full, 'full')
+		image = imread(self.path / 'full.png')
+		box = canvas.axes.bbox
+		row = image[int(image.shape[0] - box.y0 - box.height / 2), int(box.x0) + 3:int(box.x1) - 3]
+		self.assertEqual(len(np.unique(row, axis=0)), 1)
+
+	def test_plot_dir(self):
+		"""Verify --plot-dir renders a thumbnail of each file in worker processes, and keeps the up-to-date ones."""
+		params = parse_args([str(self.path / 'sources'), '--plot-dir', str(self.path / 'plots'), '-j', '2'])
+		self.assertEqual(main(params), 0)
+		thumbnails = sorted(plot_filename(self.path / 'plots', file) for file in self.files)
+		self.assertEqual(sorted(self.path.joinpath('plots').iterdir()), thumbnails)
+		written = {thumbnail: thumbnail.stat().st_mtime_ns for thumbnail in thumbnails}
+
+		os.utime(self.files[0], ns=(written[thumbnails[0]] + 10 ** 9,) * 2)
+		self.assertEqual(main(params), 0)
+		changed = plot_filename(self.path / 'plots', self.files[0])
+		for thumbnail in thumbnails:
+			self.assertEqual(thumbnail.stat().st_mtime_ns == written[thumbnail], thumbnail != changed)
+
+		missing = parse_args([str(self.path / 'sources'), '--plot-dir', str(self.path / 'missing')])
+		self.assertEqual(main(missing), RC.PATH_ERR.value)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,75 @@
+"""Unit test module for streaming sample rate and channel conversion."""
+from pathlib import Path
+import tempfile
+import unittest
+
+import numpy as np
+import scipy.signal
+from scipy.io import wavfile
+
+from src.audio import open_audio
+from src.gcrslicer import slice_audio
+from src.resample import StreamingResampler, TargetFormat, mix_matrix, resample_factors
+
+
+class TestResample(unittest.TestCase):
+	"""Unit test methods for StreamingResampler and ConvertedReader"""
+
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.path = Path(self.tmpdir.name)
+		self.samples = np.random.default_rng(4).uniform(-0.5, 0.5, (48001, 2)).astype(np.float32)
+		self.filename = self.path / 'take.wav'
+		wavfile.write(self.filename, 48000, self.samples)
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def test_streaming_matches_resample_poly(self):
+		"""Verify resampling block by block, from any output frame, equals resampling all at once."""
+		for rate_in, rate_out in ((48000, 44100), (44100, 48000), (96000, 48000), (8000, 44100)):
+			expected = scipy.signal.resample_poly(self.samples.astype(np.float64), *resample_factors(rate_in, rate_out))
+			for start, block_frames in ((0, 1000), (0, 65536), (5001, 777)):
+				resampler = StreamingResampler(rate_in, rate_out, 2, start, len(expected))
+				blocks = [resampler.process(self.samples[offset:offset + block_frames])
+						  for offset in range(resampler.input_start, len(self.samples), block_frames)]
+				actual = np.concatenate(blocks + [resampler.flush()])
+				np.testing.assert_allclose(actual, expected[start:], atol=1e-5, err_msg=f"{rate_in}→{rate_out}")
+
+	def test_mix_matrix(self):
+		"""Verify channels are averaged down, copied up, and sum to unit gain."""
+		np.testing.assert_array_equal(mix_matrix(2, 1), [[0.5], [0.5]])
+		np.testing.assert_array_equal(mix_matrix(1, 2), [[1, 1]])
+		np.testing.assert_array_equal(mix_matrix(4, 2).sum(axis=0), [1, 1])
+
+	def test_converted_reader(self):
+		"""Verify a converted file streams in whole blocks and holds the resampled mono downmix."""
+		target = TargetFormat(sample_rate=44100, channels=1)
+		expected = scipy.signal.resample_poly(self.samples.mean(axis=1), 147, 160)
+		with open_audio(self.filename, block_frames=4096, target=target) as reader:
+			self.assertEqual((reader.info.sample_rate, reader.info.channels), (44100, 1))
+			self.assertEqual(len(reader), len(expected))
+			blocks = list(reader.float_blocks())
+			self.assertTrue(all(len(block) == 4096 for _, block in blocks[:-1]))
+			np.testing.assert_allclose(np.concatenate([block for _, block in blocks])[:, 0], expected, atol=1e-5)
+			_, middle = next(reader.float_blocks(start=10000, stop=10100))
+			np.testing.assert_allclose(middle[:, 0], expected[10000:10100], atol=1e-5)
+		with open_audio(self.filename, target=TargetFormat(sample_rate=48000)) as reader:
+			self.assertTrue(hasattr(reader, 'raw'))
+
+	def test_slice_to_target(self):
+		"""Verify slices are written in the target rate and channels, at the converted slice boundaries."""
+		silence = np.zeros((24000, 2), dtype=np.int16)
+		burst = (self.samples[:24000] * 32767).astype(np.int16)
+		wavfile.write(self.filename, 48000, np.concatenate((silence, burst, silence, burst)))
+		written = slice_audio(self.filename, self.path, target=TargetFormat(sample_rate=16000, channels=1))
+		self.assertTrue(written)
+		for path in written:
+			sample_rate, data = wavfile.read(path)
+			self.assertEqual(sample_rate, 16000)
+			self.assertEqual(data.ndim, 1)
+			self.assertEqual(data.dtype, np.int16)
+
+
+if __name__ == '__main__':
+	unittest.main()
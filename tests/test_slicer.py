@@ -0,0 +1,58 @@
+"""Unit test module for slice writing."""
+from pathlib import Path
+import tempfile
+import unittest
+
+import numpy as np
+from scipy.io import wavfile
+
+from src.gcrslicer import main, parse_args
+from src.slicer import source_stem, write_slices
+from src.wavreader import WavReader
+
+
+class TestSlicer(unittest.TestCase):
+	"""Unit test methods for the slicer"""
+
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.path = Path(self.tmpdir.name)
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def test_write_slices(self):
+		"""Verify written slices are valid WAV files holding exactly the source frames."""
+		filename = self.path / 'source.wav'
+		data = np.random.default_rng(1).integers(-16000, 16000, size=(6000, 2)).astype(np.int16)
+		wavfile.write(filename, 8000, data)
+		out_dir = self.path / 'out'
+		out_dir.mkdir()
+		with WavReader(filename) as reader:
+			written = write_slices(reader, np.array([[0, 2000], [4001, 6000]]), out_dir, 'source')
+		self.assertEqual([p.name for p in written], ['source_0000.wav', 'source_0001.wav'])
+		for path, (start, stop) in zip(written, [(0, 2000), (4001, 6000)]):
+			sample_rate, slice_data = wavfile.read(path)
+			self.assertEqual(sample_rate, 8000)
+			np.testing.assert_array_equal(slice_data, data[start:stop])
+
+	def test_same_stem(self):
+		"""Verify files of the same name in different folders get their own slices in one write directory."""
+		sources = [self.path / 'sources' / folder / 'kick.wav' for folder in ('a', 'b')]
+		silence = np.zeros((4000, 1), dtype=np.int16)
+		for level, source in enumerate(sources, 1):
+			source.parent.mkdir(parents=True)
+			wavfile.write(source, 8000, np.concatenate((silence, np.full((4000, 1), 8000 * level, np.int16), silence)))
+		out_dir = self.path / 'out'
+		out_dir.mkdir()
+		self.assertNotEqual(source_stem(sources[0]), source_stem(sources[1]))
+		self.assertTrue(source_stem(sources[0]).startswith('kick-'))
+		self.assertEqual(main(parse_args([str(self.path / 'sources'), '--write-dir', str(out_dir)])), 0)
+		for level, source in enumerate(sources, 1):
+			written = sorted(out_dir.glob(f"{source_stem(source)}_*.wav"))
+			self.assertEqual(len(written), 1)
+			self.assertEqual(wavfile.read(written[0])[1].max(), 8000 * level)
+
+
+if __name__ == '__main__':
+	unittest.main()
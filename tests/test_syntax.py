@@ -1,7 +1,14 @@
 """Unit test module for CLI argument parsing."""
 import argparse
+from pathlib import Path
+import subprocess
+import sys
+import tempfile
 import unittest
 
+import numpy as np
+from scipy.io import wavfile
+
 from src.gcrslicer import parse_args
 
 
@@ -39,3 +46,13 @@ class TestGCRSlicerSyntax(unittest.TestCase):
 		params = parse_args(['data/', 'data2/', 'data3/', '--write-dir', '/tmp'])
 		self.assertIsNotNone(params)
 		self.assertIsInstance(params, argparse.Namespace)
+
+	def test_script(self):
+		"""Verify the CLI runs as a script from outside the repository, as well as a module."""
+		script = Path(__file__).resolve().parent.parent / 'src' / 'gcrslicer.py'
+		with tempfile.TemporaryDirectory() as tmpdir:
+			wavfile.write(Path(tmpdir, 'take.wav'), 8000, np.zeros(800, dtype=np.int16))
+			completed = subprocess.run([sys.executable, str(script), tmpdir, '--analyze'], cwd=tmpdir,
+									   capture_output=True, text=True, check=False)
+		self.assertEqual(completed.returncode, 0, completed.stderr)
+		self.assertIn('take.wav', completed.stdout)
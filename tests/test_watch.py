@@ -0,0 +1,78 @@
+"""Unit test module for watching directory trees for changes."""
+import os
+from pathlib import Path
+import tempfile
+import unittest
+
+import numpy as np
+from scipy.io import wavfile
+
+from src.watch import watch_changes
+from src.wavreader import is_wav_complete
+
+
+class TestWatch(unittest.TestCase):
+	"""Unit test methods for watch_changes"""
+
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.path = Path(self.tmpdir.name)
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def _watch(self, actions, **kwargs):
+		"""Run one poll per action, calling each action before its poll. Return the files ready at each poll."""
+		actions = iter(actions)
+		polls = {'count': 0}
+
+		def sleep(_):
+			polls['count'] += 1
+			next(actions)()
+
+		ready_by_poll = {}
+		for ready in watch_changes(lambda: sorted(self.path.iterdir()), settle=0.0, sleep=sleep, **kwargs):
+			ready_by_poll[polls['count']] = [path.name for path in ready]
+		return ready_by_poll
+
+	def test_created_and_modified(self):
+		"""Verify existing files are skipped, and created or modified files are ready once they stop changing."""
+		(self.path / 'old.wav').write_bytes(b'old')
+
+		def modify():
+			stat = os.stat(self.path / 'old.wav')
+			os.utime(self.path / 'old.wav', ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000))
+
+		actions = [lambda: (self.path / 'new.wav').write_bytes(b'new'),
+				   lambda: None,
+				   modify,
+				   lambda: None]
+		ready_by_poll = self._watch(actions, polls=len(actions))
+		self.assertDictEqual(ready_by_poll, {2: ['new.wav'], 4: ['old.wav']})
+
+	def test_growing_file_waits(self):
+		"""Verify a file still growing is held back until it stops changing."""
+		growing = self.path / 'growing.wav'
+		actions = [lambda: growing.write_bytes(b'a'),
+				   lambda: growing.write_bytes(b'ab'),
+				   lambda: growing.write_bytes(b'abc'),
+				   lambda: None]
+		self.assertDictEqual(self._watch(actions, polls=len(actions)), {4: ['growing.wav']})
+
+	def test_incomplete_wav_waits(self):
+		"""Verify a settled WAV file isn't ready while it holds less data than its header announces."""
+		recording = self.path / 'recording.wav'
+		wavfile.write(recording, 8000, np.zeros(8000, dtype=np.int16))
+		data = recording.read_bytes()
+		recording.unlink()
+
+		actions = [lambda: recording.write_bytes(data[:1000]),
+				   lambda: None,
+				   lambda: recording.write_bytes(data),
+				   lambda: None]
+		ready_by_poll = self._watch(actions, polls=len(actions), is_complete=is_wav_complete)
+		self.assertDictEqual(ready_by_poll, {4: ['recording.wav']})
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,121 @@
+"""Unit test module for the memory-mapped WAV reader."""
+from pathlib import Path
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+from scipy.io import wavfile
+
+from src.wavreader import (WavInfo, WavReader, WavFormatError, denormalize, is_wav_complete, normalize,
+						   read_wav_info)
+
+
+def _write_int24(filename, sample_rate, data):
+	"""Write a 24-bit PCM WAV file by hand, since scipy only reads them."""
+	frames, channels = data.shape
+	packed = data.astype('<i4').view(np.uint8).reshape(frames, channels, 4)[:, :, :3].tobytes()
+	fmt = struct.pack('<HHIIHH', 1, channels, sample_rate, sample_rate * channels * 3, channels * 3, 24)
+	with open(filename, 'wb') as wav_file:
+		wav_file.write(b'RIFF' + struct.pack('<I', 36 + len(packed)) + b'WAVE')
+		wav_file.write(b'fmt ' + struct.pack('<I', len(fmt)) + fmt)
+		wav_file.write(b'data' + struct.pack('<I', len(packed)) + packed)
+
+
+class TestWavReader(unittest.TestCase):
+	"""Unit test methods for the WavReader"""
+
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.path = Path(self.tmpdir.name)
+		self.rng = np.random.default_rng(0)
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def test_info(self):
+		"""Verify header information is parsed without reading samples."""
+		filename = self.path / 'stereo.wav'
+		wavfile.write(filename, 48000, np.zeros((1000, 2), dtype=np.int16))
+		info = read_wav_info(filename)
+		self.assertEqual((info.sample_rate, info.channels, info.frames), (48000, 2, 1000))
+		self.assertEqual(info.dtype, np.dtype('<i2'))
+
+	def test_blocks_match_wavfile(self):
+		"""Verify concatenated blocks equal the samples read by scipy, for each stored dtype."""
+		for dtype in (np.uint8, np.int16, np.int32, np.float32):
+			filename = self.path / f"{np.dtype(dtype).name}.wav"
+			data = self.rng.integers(0, 255, size=(10007, 2)).astype(dtype)
+			wavfile.write(filename, 44100, data)
+			with WavReader(filename, block_frames=1024) as reader:
+				offsets, blocks = zip(*reader.blocks())
+				self.assertEqual(offsets[1] - offsets[0], 1024)
+				np.testing.assert_array_equal(np.concatenate(blocks), wavfile.read(filename)[1])
+
+	def test_blocks_are_views(self):
+		"""Verify blocks of directly mappable formats are views into the mapping, not copies."""
+		filename = self.path / 'view.wav'
+		wavfile.write(filename, 8000, np.ones((4096, 1), dtype=np.int16))
+		with WavReader(filename) as reader:
+			_, block = next(reader.blocks(block_frames=512))
+			self.assertTrue(np.shares_memory(block, reader.raw))
+
+	def test_int24(self):
+		"""Verify packed 24-bit samples decode and normalize correctly."""
+		filename = self.path / 'int24.wav'
+		data = np.array([[0], [1 << 22], [-(1 << 23)], [(1 << 23) - 1]])
+		_write_int24(filename, 48000, data)
+		with WavReader(filename) as reader:
+			self.assertIsNone(reader.samples)
+			_, block = next(reader.float_blocks())
+		np.testing.assert_allclose(block[:, 0], [0.0, 0.5, -1.0, 1.0], atol=1e-6)
+
+	def test_denormalize(self):
+		"""Verify denormalize restores the stored samples of every integer width from their normalized floats."""
+		for bits, data in ((8, np.arange(256, dtype=np.uint8)), (16, np.arange(-32768, 32768, 7, dtype=np.int16)),
+						   (24, np.arange(-(1 << 23), 1 << 23, 4099, dtype=np.int32) << 8)):
+			info = WavInfo(8000, 1, bits, False, len(data), 0, bits // 8)
+			np.testing.assert_array_equal(denormalize(normalize(data[:, None], info), info)[:, 0], data)
+
+	def test_start_stop(self):
+		"""Verify a frame range yields only the frames within it."""
+		filename = self.path / 'range.wav'
+		wavfile.write(filename, 8000, np.arange(1000, dtype=np.int16))
+		with WavReader(filename) as reader:
+			frames = np.concatenate([b for _, b in reader.blocks(block_frames=64, start=100, stop=300)])
+		np.testing.assert_array_equal(frames[:, 0], np.arange(100, 300))
+
+	def test_truncated(self):
+		"""Verify a file holding less data than its header announces reads the whole frames it holds."""
+		filename = self.path / 'truncated.wav'
+		wavfile.write(filename, 8000, np.arange(2000, dtype=np.int16).reshape(-1, 2))
+		with open(filename, 'r+b') as wav_file:
+			wav_file.truncate(filename.stat().st_size - 1001)
+		self.assertFalse(is_wav_complete(filename))
+		with WavReader(filename) as reader:
+			self.assertEqual(reader.info.frames, 749)
+			frames = np.concatenate([b for _, b in reader.blocks(block_frames=100)])
+		np.testing.assert_array_equal(frames, np.arange(1498).reshape(-1, 2))
+
+	def test_unsupported_width(self):
+		"""Verify PCM samples of 5 to 7 bytes raise a WavFormatError."""
+		for width in (5, 6, 7):
+			filename = self.path / f"pcm{width}.wav"
+			fmt = struct.pack('<HHIIHH', 1, 1, 8000, 8000 * width, width, 8 * width)
+			with open(filename, 'wb') as wav_file:
+				wav_file.write(b'RIFF' + struct.pack('<I', 36 + 10 * width) + b'WAVE')
+				wav_file.write(b'fmt ' + struct.pack('<I', len(fmt)) + fmt)
+				wav_file.write(b'data' + struct.pack('<I', 10 * width) + bytes(10 * width))
+			with self.assertRaisesRegex(WavFormatError, f"Unsupported sample width {width}"):
+				read_wav_info(filename)
+
+	def test_not_wav(self):
+		"""Verify non-WAV files raise a WavFormatError."""
+		filename = self.path / 'not.wav'
+		filename.write_bytes(b'not a wav file at all')
+		with self.assertRaises(WavFormatError):
+			WavReader(filename)
+
+
+if __name__ == '__main__':
+	unittest.main()
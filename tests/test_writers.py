@@ -0,0 +1,94 @@
+"""Unit test module for slice file formats and the slice writer."""
+from pathlib import Path
+import tempfile
+import unittest
+
+import numpy as np
+from scipy.io import wavfile
+
+from src.flacreader import flac_supported
+from src.slicer import write_slices
+from src.wavreader import WavReader
+from src.writers import HeaderTemplate, SliceWriter, wav_header
+
+if flac_supported():
+	import soundfile
+
+
+class TestWriters(unittest.TestCase):
+	"""Unit test methods for HeaderTemplate and SliceWriter"""
+
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.path = Path(self.tmpdir.name)
+		self.data = np.random.default_rng(2).integers(-16000, 16000, size=(6001, 2)).astype(np.int16)
+		wavfile.write(self.path / 'source.wav', 8000, self.data)
+		self.out = self.path / 'out'
+		self.out.mkdir()
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def test_wav_template(self):
+		"""Verify the patched WAV header template equals a freshly built header."""
+		with WavReader(self.path / 'source.wav') as reader:
+			template = HeaderTemplate(reader.info, 'wav')
+			for frames in (0, 1, 2000, 6001):
+				self.assertEqual(template.build(frames), wav_header(reader.info, frames))
+
+	def test_aiff_float_rejected(self):
+		"""Verify AIFF refuses floating point sources, which it can't store."""
+		wavfile.write(self.path / 'float.wav', 8000, self.data.astype(np.float32) / 32768)
+		with WavReader(self.path / 'float.wav') as reader:
+			with self.assertRaises(ValueError):
+				HeaderTemplate(reader.info, 'aiff')
+
+	def test_aiff_int64_rejected(self):
+		"""Verify AIFF and AIFC refuse 64-bit integer sources, which neither can store."""
+		wavfile.write(self.path / 'int64.wav', 8000, self.data.astype(np.int64) << 48)
+		with WavReader(self.path / 'int64.wav') as reader:
+			for fmt in ('aiff', 'aifc'):
+				with self.assertRaises(ValueError):
+					HeaderTemplate(reader.info, fmt)
+			self.assertEqual(HeaderTemplate(reader.info, 'wav').suffix, '.wav')
+
+	@unittest.skipUnless(flac_supported(), "soundfile is not installed")
+	def test_formats_round_trip(self):
+		"""Verify slices read back with the source samples in every output format and sample format."""
+		sources = {'PCM_U8': 'PCM_U8', 'PCM_16': 'PCM_16', 'PCM_24': 'PCM_24', 'FLOAT': 'FLOAT'}
+		boundaries = np.array([[0, 1999], [2000, 6001]])
+		for subtype in sources:
+			source = self.path / f"{subtype}.wav"
+			soundfile.write(source, self.data.astype(np.float64) / 32768, 8000, subtype=subtype)
+			expected, _ = soundfile.read(source, dtype='float64')
+			for fmt in ('wav', 'aiff', 'aifc'):
+				if fmt == 'aiff' and subtype == 'FLOAT':
+					continue
+				with WavReader(source) as reader, SliceWriter(workers=2, batch_bytes=1) as writer:
+					written = write_slices(reader, boundaries, self.out, f"{subtype}", fmt, writer)
+				for path, (start, stop) in zip(written, boundaries):
+					self.assertEqual(path.suffix, f".{fmt}")
+					actual, sample_rate = soundfile.read(path, dtype='float64')
+					self.assertEqual(sample_rate, 8000, (subtype, fmt))
+					np.testing.assert_array_equal(actual, expected[start:stop], err_msg=f"{subtype} {fmt}")
+
+	def test_many_small_slices(self):
+		"""Verify thousands of tiny slices are all written, atomically, with no temporary files left."""
+		boundaries = np.column_stack((np.arange(0, 6000, 3), np.arange(0, 6000, 3) + 3))
+		with WavReader(self.path / 'source.wav') as reader, SliceWriter(workers=3) as writer:
+			written = write_slices(reader, boundaries, self.out, 'source', 'wav', writer)
+		self.assertEqual(sorted(self.out.iterdir()), sorted(written))
+		_, last = wavfile.read(written[-1])
+		np.testing.assert_array_equal(last, self.data[5997:6000])
+
+	def test_write_error(self):
+		"""Verify a failed write raises once all slices are done, and leaves no temporary file."""
+		with WavReader(self.path / 'source.wav') as reader, SliceWriter(workers=2, batch_bytes=1) as writer:
+			with self.assertRaises(OSError):
+				write_slices(reader, np.array([[0, 10], [10, 20]]), self.path / 'missing', 'source', 'wav', writer)
+		self.assertFalse((self.path / 'missing').exists())
+		self.assertEqual(list(self.out.iterdir()), [])
+
+
+if __name__ == '__main__':
+	unittest.main()